@@ -1,4 +1,6 @@
+#include "color.h"
 #include "bsdf.h"
+#include "bsdf_m.h"
 #include "ray.h"
 #include <nanobind/nanobind.h>
 #include <nanobind/ndarray.h>
@@ -26,6 +28,25 @@ void get_cie_xyz(const SDValue *val, double cie_xyz[3]) {
   cie_xyz[2] = (1. - val->spec.cx - val->spec.cy) / val->spec.cy * val->cieY;
 }
 
+// Reciprocal matrix indices, as in cmbsdf.c
+int recip_out_from_in(const SDMat *bsdf, int in_recip) {
+  FVECT v;
+  if (!mBSDF_incvec(v, bsdf, in_recip + .5))
+    return in_recip;
+  v[2] = -v[2];
+  return mBSDF_outndx(bsdf, v);
+}
+int recip_in_from_out(const SDMat *bsdf, int out_recip) {
+  FVECT v;
+  if (!mBSDF_outvec(v, bsdf, out_recip + .5))
+    return out_recip;
+  v[2] = -v[2];
+  return mBSDF_incndx(bsdf, v);
+}
+std::string basis_name(void *priv, b_ohmf *ohmf) {
+  return ohmf == &io_getohm ? std::string(((ANGLE_BASIS *)priv)->name) : "";
+}
+
 NB_MODULE(bsdf, m) {
   m.doc() = "Radiance BSDF module extension";
 
@@ -123,7 +144,8 @@ NB_MODULE(bsdf, m) {
       .def_ro("tf", &SDData::tf)
       .def_ro("tb", &SDData::tb);
 
-  m.def("load_file", &SDcacheFile);
+  // entries belong to the BSDF cache; release them with free()
+  m.def("load_file", &SDcacheFile, nb::rv_policy::reference);
   m.def("free", &SDfreeCache);
   m.def(
       "inv_xform",
@@ -257,6 +279,90 @@ NB_MODULE(bsdf, m) {
             cie_rgb(rgb, xyz);
             return nb::make_tuple(rgb[0], rgb[1], rgb[2]);
         });
+
+  // Klems matrix of one component, converted the way cm_loadBTDF and
+  // cm_loadBRDF do it for rmtxop and dctimestep
+  m.def("klems_matrix", [](const SDData *sd, const std::string &comp) {
+    const bool trans = comp == "tf" || comp == "tb";
+    const bool back = comp == "tb" || comp == "rb";
+    if (!trans && comp != "rf" && comp != "rb")
+      throw nb::value_error("component must be one of tf, tb, rf, rb");
+    SDSpectralDF *df = trans ? (back ? sd->tb : sd->tf) : (back ? sd->rb : sd->rf);
+    bool recip = false;
+    if (df == NULL && trans) {
+      df = back ? sd->tf : sd->tb;
+      recip = df != NULL;
+    }
+    const SDValue *lamb = trans ? (back != recip ? &sd->tLambBack : &sd->tLambFront)
+                                : (back ? &sd->rLambBack : &sd->rLambFront);
+    C_COLOR lspec = lamb->spec;
+    COLOR diff;
+    ccy2rgb(&lspec, lamb->cieY / PI, diff);
+
+    const SDMat *mat = NULL;
+    if (df != NULL) {
+      if (df->ncomp != 1 || df->comp[0].func != &SDhandleMtx)
+        throw nb::value_error("not a Klems matrix BSDF");
+      mat = (const SDMat *)df->comp[0].dist;
+    }
+    ANGLE_BASIS *lbasis = NULL;
+    int nrows, ncols;
+    std::string in_name, out_name;
+    if (mat == NULL) { // Lambertian only, on the full Klems basis
+      for (int i = 0; i < nabases; i++)
+        if (abase_list[i].nangles == 145)
+          lbasis = &abase_list[i];
+      if (lbasis == NULL)
+        throw nb::value_error("no full Klems basis defined");
+      nrows = ncols = 145;
+      in_name = out_name = lbasis->name;
+    } else if (recip) {
+      nrows = mat->ninc;
+      ncols = mat->nout;
+      in_name = basis_name(mat->ob_priv, mat->ob_ohm);
+      out_name = basis_name(mat->ib_priv, mat->ib_ohm);
+    } else {
+      nrows = mat->nout;
+      ncols = mat->ninc;
+      in_name = basis_name(mat->ib_priv, mat->ib_ohm);
+      out_name = basis_name(mat->ob_priv, mat->ob_ohm);
+    }
+
+    float *result = new float[(size_t)nrows * ncols * 3];
+    double *ohm = new double[ncols];
+    for (int c = 0; c < ncols; c++) {
+      const int ro = recip ? recip_out_from_in(mat, c) : 0;
+      ohm[c] = mat == NULL ? io_getohm(c, lbasis)
+               : recip     ? mBSDF_outohm(mat, ro)
+                           : mBSDF_incohm(mat, c);
+      for (int r = 0; r < nrows; r++) {
+        float *mp = result + ((size_t)r * ncols + c) * 3;
+        setcolor(mp, .0f, .0f, .0f);
+        if (mat != NULL && ohm[c] > 0) {
+          const int i = recip ? recip_in_from_out(mat, r) : c;
+          const int o = recip ? ro : r;
+          const float f = mBSDF_value(mat, o, i);
+          if (f > 0 && mat->chroma != NULL) {
+            C_COLOR cxy;
+            c_decodeChroma(&cxy, mBSDF_chroma(mat, o, i));
+            ccy2rgb(&cxy, f, mp);
+          } else if (f > 0) {
+            setcolor(mp, f, f, f);
+          }
+        }
+        addcolor(mp, diff);
+        scalecolor(mp, ohm[c]);
+      }
+    }
+    nb::capsule owner(result, [](void *p) noexcept { delete[] (float *)p; });
+    nb::capsule ohm_owner(ohm, [](void *p) noexcept { delete[] (double *)p; });
+    return nb::make_tuple(
+        nb::ndarray<nb::numpy, float, nb::ndim<3>>(
+            result, {(size_t)nrows, (size_t)ncols, 3}, owner),
+        nb::ndarray<nb::numpy, double, nb::ndim<1>>(ohm, {(size_t)ncols},
+                                                    ohm_owner),
+        in_name, out_name);
+  });
   // TODO: add abase_list
 
 }
@@ -127,13 +127,13 @@ NB_MODULE(rad_params, m) {
         .def_rw("yr", &RESOLU::yr);
 
     m.def("parse_view", [](const char *s) {
-        VIEW vp;
+        VIEW vp = stdview;
         sscanview(&vp, const_cast<char *>(s));
         return vp;
     }, "Parse a view string into a View object");
 
     m.def("viewfile", [](const char *fname) {
-        VIEW vp = {0};
+        VIEW vp = stdview;
         int result = viewfile(const_cast<char *>(fname), &vp, NULL);
 		if (result <= 0) {  // viewfile failed
         throw std::runtime_error("Failed to read view file: " + std::string(fname ? fname : "stdin"));
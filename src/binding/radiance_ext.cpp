@@ -74,6 +74,46 @@ RdataShare *python_cdsf_wrapper(const char *name, RCOutputOp op, size_t siz) {
   }
 }
 
+using FloatImage = nb::ndarray<float, nb::ndim<3>, nb::c_contig, nb::device::cpu>;
+using FloatDepth = nb::ndarray<float, nb::ndim<2>, nb::c_contig, nb::device::cpu>;
+
+// Number of components RenderTile() stores per float pixel
+int render_ncomp(const RpictSimulManager &mgr) {
+  return (mgr.prims == NULL && NCSAMP > 3) ? NCSAMP : 3;
+}
+
+// Render a tile into rows stored top first, as pictures and NumPy images are;
+// the manager counts tile rows up from the bottom, so start there with a
+// negative row stride
+bool render_tile_rows(RpictSimulManager &mgr, float *rgb, float *depth,
+                      int stride, const int *tile) {
+  const size_t bottom = (size_t)(mgr.THeight() - 1) * stride;
+  const int nc = render_ncomp(mgr);
+  nb::gil_scoped_release release;
+  return mgr.RenderTile(rgb + bottom * nc, -stride,
+                        depth ? depth + bottom : nullptr, tile);
+}
+
+// Set up a frame for a view with an optional (columns, rows) tile grid
+void new_render_frame(RpictSimulManager &mgr, const VIEW &view, int xres,
+                      int yres, nb::object tiles) {
+  int xydim[2] = {xres, yres};
+  int tgrid[2] = {1, 1};
+  if (!tiles.is_none()) {
+    std::vector<int> t = nb::cast<std::vector<int>>(tiles);
+    if (t.size() != 2)
+      throw nb::value_error("tiles must be (columns, rows)");
+    tgrid[0] = t[0];
+    tgrid[1] = t[1];
+  }
+  if (!mgr.Ready())
+    throw std::runtime_error("no octree loaded");
+  if (!mgr.NewFrame(view, xydim, nullptr, tgrid))
+    throw std::runtime_error("cannot set up frame for view");
+}
+
+extern char *progname;
+
 void ndarray_to_fvect(const OrigDirec &arr, FVECT *output) {
   for (size_t i = 0; i < arr.shape(0); ++i) {
     output[i][0] = arr(i, 0);
@@ -85,6 +125,8 @@ void ndarray_to_fvect(const OrigDirec &arr, FVECT *output) {
 
 NB_MODULE(radiance_ext, m) {
 
+  // header parsing, e.g. isview() when resuming a frame, reads the program name
+  progname = (char *)"radiance_ext";
   m.doc() = "Radiance extension";
 
   nb::class_<RAY>(m, "Ray")
@@ -444,7 +486,7 @@ NB_MODULE(radiance_ext, m) {
           nb::arg("type") = nb::none(), nb::arg("value") = nb::none(),
           nb::arg("traceback") = nb::none());
 
-  nb::enum_<RenderDataType>(m, "RenderDataType")
+  nb::enum_<RenderDataType>(m, "RenderDataType", nb::is_flag())
       .value("RDTnone", RDTnone)
       .value("RDTscolor", RDTscolor)
       .value("RDTrgb", RDTrgb)
@@ -520,18 +562,136 @@ NB_MODULE(radiance_ext, m) {
       .def("get_height", &RpictSimulManager::GetHeight)
       .def("t_width", &RpictSimulManager::TWidth)
       .def("t_height", &RpictSimulManager::THeight)
-      .def("render_tile",
-           nb::overload_cast<COLORV *, int, float *, const int *>(
-               &RpictSimulManager::RenderTile))
-      .def("render_tile", nb::overload_cast<COLRV *, int, float *, const int *>(
-                              &RpictSimulManager::RenderTile))
-      .def("render_tile", nb::overload_cast<COLRV *, int, short *, const int *>(
-                              &RpictSimulManager::RenderTile))
-      .def("render_tile",
-           nb::overload_cast<COLORV *, int, short *, const int *>(
-               &RpictSimulManager::RenderTile))
-      .def("render_frame", &RpictSimulManager::RenderFrame)
-      .def("resume_frame", &RpictSimulManager::RenderFrame)
+      .def("n_components", &render_ncomp,
+           "Number of components per pixel in rendered float arrays.")
+      .def(
+          "render_tile",
+          [](RpictSimulManager &self, FloatImage rgb, nb::object depth,
+             nb::object tile) {
+            if (!self.GetView())
+              throw std::runtime_error("no frame, call new_frame() first");
+            if (rgb.shape(0) != (size_t)self.THeight() ||
+                rgb.shape(1) != (size_t)self.TWidth() ||
+                rgb.shape(2) != (size_t)render_ncomp(self))
+              throw nb::value_error("rgb must have shape (tile height, tile "
+                                    "width, number of components)");
+            float *zp = nullptr;
+            if (!depth.is_none()) {
+              FloatDepth zbuf = nb::cast<FloatDepth>(depth);
+              if (zbuf.shape(0) != rgb.shape(0) || zbuf.shape(1) != rgb.shape(1))
+                throw nb::value_error("depth must have shape (tile height, "
+                                      "tile width)");
+              zp = zbuf.data();
+            }
+            int ti[2] = {0, 0};
+            if (!tile.is_none()) {
+              std::vector<int> t = nb::cast<std::vector<int>>(tile);
+              if (t.size() != 2)
+                throw nb::value_error("tile must be (column, row)");
+              ti[0] = t[0];
+              ti[1] = t[1];
+            }
+            if (ti[0] < 0 || ti[0] >= self.GetWidth() / self.TWidth() ||
+                ti[1] < 0 || ti[1] >= self.GetHeight() / self.THeight())
+              throw nb::value_error("tile outside the frame's tile grid");
+            return render_tile_rows(self, rgb.data(), zp, self.TWidth(), ti);
+          },
+          nb::arg("rgb"), nb::arg("depth") = nb::none(),
+          nb::arg("tile") = nb::none(),
+          "Render a tile of the current frame into float arrays, top row "
+          "first. Tiles are numbered (column, row) from the lower left.")
+      .def(
+          "render",
+          [](RpictSimulManager &self, const VIEW &view, int xres, int yres,
+             bool depth, nb::object tiles, nb::object progress, int nthreads) {
+            new_render_frame(self, view, xres, yres, tiles);
+            self.SetThreadCount(nthreads);
+            const size_t width = self.GetWidth(), height = self.GetHeight();
+            const int tgrid[2] = {self.GetWidth() / self.TWidth(),
+                                  self.GetHeight() / self.THeight()};
+            const size_t nc = render_ncomp(self);
+            float *rgb = new float[height * width * nc]();
+            nb::capsule rgb_owner(rgb, [](void *p) noexcept {
+              delete[] (float *)p;
+            });
+            nb::object rgb_arr = nb::cast(nb::ndarray<nb::numpy, float>(
+                rgb, {height, width, nc}, rgb_owner));
+            float *zbuf = nullptr;
+            nb::object depth_arr = nb::none();
+            if (depth) {
+              zbuf = new float[height * width]();
+              nb::capsule depth_owner(zbuf, [](void *p) noexcept {
+                delete[] (float *)p;
+              });
+              depth_arr = nb::cast(nb::ndarray<nb::numpy, float>(
+                  zbuf, {height, width}, depth_owner));
+            }
+            const int ntiles = tgrid[0] * tgrid[1];
+            int ndone = 0;
+            // top row of tiles first, so previews fill in reading order
+            for (int ty = tgrid[1]; ty--;) {
+              for (int tx = 0; tx < tgrid[0]; tx++) {
+                const int ti[2] = {tx, ty};
+                const size_t off =
+                    (tgrid[1] - 1 - ty) * self.THeight() * width +
+                    tx * self.TWidth();
+                if (!render_tile_rows(self, rgb + off * nc,
+                                      zbuf ? zbuf + off : nullptr, width, ti))
+                  throw std::runtime_error("tile rendering failed");
+                if (!progress.is_none())
+                  progress(++ndone, ntiles, rgb_arr);
+              }
+            }
+            return nb::make_tuple(rgb_arr, depth_arr);
+          },
+          nb::arg("view"), nb::arg("xres"), nb::arg("yres"),
+          nb::arg("depth") = true, nb::arg("tiles") = nb::none(),
+          nb::arg("progress") = nb::none(), nb::arg("nthreads") = 0,
+          "Render a view into new float arrays, top row first.\n\n"
+          "Returns (image, depth); image has shape (height, width, 3), or "
+          "the number of spectral samples, and depth is None unless asked "
+          "for. The resolution is reduced to fit the view aspect and a "
+          "(columns, rows) tile grid. Tiles are rendered one after another "
+          "with nthreads ray tracing processes (0 for all cores), calling "
+          "progress(tiles done, total tiles, image) after each.")
+      .def(
+          "render_frame",
+          [](RpictSimulManager &self, const char *pfname, RenderDataType dt,
+             nb::object dfname) {
+            const std::string dname =
+                dfname.is_none() ? "" : nb::cast<std::string>(dfname);
+            // Radiance exits on a depth file without a depth type
+            if (!dfname.is_none() && RDTdepthT(dt) == RDTnone)
+              dt = RDTnewDT(dt, RDTdfloat);
+            nb::gil_scoped_release release;
+            return self.RenderFrame(pfname, dt,
+                                    dfname.is_none() ? nullptr : dname.c_str());
+          },
+          nb::arg("pfname"), nb::arg("dt") = RDTrgbe,
+          nb::arg("dfname") = nb::none(),
+          "Render the current frame to a new picture file, and depth to "
+          "dfname if given, writing rows as they finish. The depth type "
+          "is or-ed into dt, e.g. RDTrgb | RDTdshort, and defaults to "
+          "RDTdfloat.")
+      .def(
+          "resume_frame",
+          [](RpictSimulManager &self, const char *pfname, nb::object dfname) {
+            // Radiance exits on a missing picture, so check it here
+            FILE *fp = fopen(pfname, "rb");
+            if (!fp)
+              throw std::runtime_error(std::string("cannot open picture '") +
+                                       pfname + "'");
+            fclose(fp);
+            const std::string dname =
+                dfname.is_none() ? "" : nb::cast<std::string>(dfname);
+            nb::gil_scoped_release release;
+            return self.ResumeFrame(pfname,
+                                    dfname.is_none() ? nullptr : dname.c_str());
+          },
+          nb::arg("pfname"), nb::arg("dfname") = nb::none(),
+          "Finish rendering a picture (and depth) file left incomplete by an "
+          "interrupted render_frame(), from the first missing row. The view "
+          "and resolution come from the picture header.")
       .def("set_thread_count", &RpictSimulManager::SetThreadCount,
            nb::arg("nt") = 0)
       .def("set_reference_depth",
@@ -546,9 +706,17 @@ NB_MODULE(radiance_ext, m) {
            [](RpictSimulManager &self, const char *du) {
              return self.GetReferenceDepth(const_cast<char *>(du));
            })
-      .def("new_frame",
-           [](RpictSimulManager &self, const VIEW &v, int xydim[2], double *ap,
-              const int *tgrid) { return self.NewFrame(v, xydim, ap, tgrid); })
+      .def(
+          "new_frame",
+          [](RpictSimulManager &self, const VIEW &view, int xres, int yres,
+             nb::object tiles) {
+            new_render_frame(self, view, xres, yres, tiles);
+            return nb::make_tuple(self.GetWidth(), self.GetHeight());
+          },
+          nb::arg("view"), nb::arg("xres"), nb::arg("yres"),
+          nb::arg("tiles") = nb::none(),
+          "Set up a frame for a view and (columns, rows) tile grid, returning "
+          "the (width, height) fitted to the view aspect and grid.")
       .def("n_threads", &RpictSimulManager::NThreads);
 
   m.def("initfunc", &initfunc);
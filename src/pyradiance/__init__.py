@@ -6,7 +6,8 @@ make Radiance easier to use and accessible to Python user.
 
 import os
 from importlib.metadata import version
-from .anci import BINPATH, write
+from .anci import BINPATH, HeaderInfo, read_header, write
+from .cache import MatrixCache
 from .cal import cnt, rcalc, rlam, total
 from .bsdf import spec_xyz, xyz_rgb
 from .cv import (
@@ -35,6 +36,7 @@ from .gen import (
     gensdaymtx,
     gensky,
     genssky,
+    genssky_batch,
     mkillum,
 )
 from .genbsdf import (
@@ -47,21 +49,41 @@ from .genbsdf import (
 )
 
 from .model import Primitive, Scene
+from .mtx import (
+    KlemsBSDF,
+    MatrixExpr,
+    MatrixHeader,
+    create_matrix,
+    dctimestep_array,
+    load_klems,
+    rcollate_array,
+    rcomb_array,
+    read_matrix,
+    read_matrix_header,
+    rgb2xyz_matrix,
+    tiled_matmul,
+    transform_components,
+    write_matrix,
+)
 from .ot import oconv, getbbox
 
 from .px import (
     Pcomb,
     falsecolor,
+    filter_hdr,
     pcompos,
     pcond,
     pextrem,
     pfilt,
+    pfilt_array,
     pvalue,
     pvaluer,
     ra_ppm,
     ra_rgbe,
     ra_tiff,
     ra_xyze,
+    read_hdr,
+    write_hdr,
 )
 
 if os.name == "posix":
@@ -73,6 +95,8 @@ if os.name == "posix":
         RTimmIrrad,
         RTlimDist,
         RTmask,
+        RenderDataType,
+        RpictSimulManager,
         RtraceSimulManager,
         RTtraceSources,
         calcontext,
@@ -100,9 +124,20 @@ from .rad_params import (
 )
 
 from .rt import mkpmap, Rcontrib, rpict, rtrace
+from .sky import (
+    CIESkies,
+    PerezSkies,
+    SolarPosition,
+    cie_skies,
+    perez_skies,
+    reinhart_patches,
+    sky_matrix,
+    solar_position,
+)
 from .util import (
     Xform,
     dctimestep,
+    edit_header,
     evalglare,
     get_header,
     get_image_dimensions,
@@ -115,12 +150,17 @@ from .util import (
     Rmtxop,
     Rcomb,
     render,
+    render_progressive,
+    render_resumable,
+    render_tiles,
+    render_views,
     rfluxmtx,
     rmtxop,
     rsensor,
     vwrays,
     WrapBSDF,
 )
+from .weather import Weather, read_weather
 
 __version__ = version("pyradiance")
 
@@ -141,6 +181,8 @@ __all__ = [
     "RCCONTEXT",
     "initfunc",
     "RcontribSimulManager",
+    "RenderDataType",
+    "RpictSimulManager",
     "RtraceSimulManager",
     "RcOutputOp",
     "calcontext",
@@ -153,8 +195,13 @@ __all__ = [
     "ray_done",
     "bsdf2klems",
     "bsdf2ttree",
+    "CIESkies",
+    "cie_skies",
     "cnt",
+    "create_matrix",
     "dctimestep",
+    "dctimestep_array",
+    "edit_header",
     "evalglare",
     "eval",
     "falsecolor",
@@ -171,15 +218,22 @@ __all__ = [
     "gensdaymtx",
     "gensky",
     "genssky",
+    "genssky_batch",
     "getbbox",
     "get_header",
     "get_image_dimensions",
     "getinfo",
+    "HeaderInfo",
     "ies2rad",
+    "KlemsBSDF",
+    "load_klems",
     "load_material_smd",
     "mgf2rad",
     "mkillum",
     "mkpmap",
+    "MatrixCache",
+    "MatrixExpr",
+    "MatrixHeader",
     "obj2rad",
     "obj2mesh",
     "oconv",
@@ -193,11 +247,21 @@ __all__ = [
     "pvaluer",
     "pcond",
     "pfilt",
+    "pfilt_array",
+    "filter_hdr",
     "ra_tiff",
     "ra_ppm",
     "ra_rgbe",
     "ra_xyze",
     "rcalc",
+    "rcollate_array",
+    "reinhart_patches",
+    "rcomb_array",
+    "read_hdr",
+    "read_header",
+    "read_matrix",
+    "read_matrix_header",
+    "read_weather",
     "rcode_depth",
     "rcode_ident",
     "rcode_norm",
@@ -205,23 +269,38 @@ __all__ = [
     "Rcomb",
     "Rmtxop",
     "render",
+    "render_progressive",
+    "render_resumable",
+    "render_tiles",
+    "render_views",
     "rfluxmtx",
+    "rgb2xyz_matrix",
     "rlam",
     "rmtxop",
     "robjutil",
     "rpict",
     "rsensor",
     "rtrace",
+    "PerezSkies",
+    "perez_skies",
     "Primitive",
     "Scene",
+    "sky_matrix",
+    "SolarPosition",
+    "solar_position",
     "SpectralPoint",
     "spec_xyz",
     "set_eparams",
+    "tiled_matmul",
     "total",
+    "transform_components",
     "View",
     "vwrays",
+    "Weather",
     "WrapBSDF",
     "write",
+    "write_hdr",
+    "write_matrix",
     "Xform",
     "xyz_rgb",
     "ShadingMaterial",
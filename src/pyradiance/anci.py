@@ -2,13 +2,29 @@
 Auxiliary functions.
 """
 
+from dataclasses import dataclass, field
 from pathlib import Path
 from functools import wraps
 from subprocess import CalledProcessError
+from typing import BinaryIO, Iterable, Literal
 import os
+import subprocess as sp
+import tempfile
+import threading
+
+import numpy as np
 
 BINPATH = Path(__file__).parent / "bin"
 
+# Size of each write to / read from a streamed subprocess
+CHUNK_SIZE = 1 << 22
+
+StreamInput = bytes | str | Path | np.ndarray | Iterable[bytes | np.ndarray]
+StreamOutput = None | str | Path | BinaryIO | np.ndarray
+
+# Matrix data formats: ascii, float, double and RGBE
+FileType = Literal["a", "f", "d", "c"]
+
 
 def handle_called_process_error(func):
     """
@@ -52,3 +68,525 @@ def write(
         with open(file_path, mode=mode) as write_data:
             write_data.write(data)
     return str(file_path)
+
+
+def _iter_chunks(inp: StreamInput, chunk_size: int):
+    """Yield memoryview chunks from bytes, arrays or an iterator of either."""
+    if isinstance(inp, (bytes, bytearray, memoryview, np.ndarray)):
+        inp = (inp,)
+    for item in inp:
+        if isinstance(item, np.ndarray):
+            # memmaps stay paged on disk, only one chunk is touched at a time
+            item = np.ascontiguousarray(item)
+        mv = memoryview(item).cast("B")
+        for start in range(0, len(mv), chunk_size):
+            yield mv[start : start + chunk_size]
+
+
+def _feed(stdin: BinaryIO, inp: StreamInput, chunk_size: int, errors: list):
+    try:
+        for chunk in _iter_chunks(inp, chunk_size):
+            stdin.write(chunk)
+    except BrokenPipeError:
+        # process exited early, its return code tells the story
+        pass
+    except Exception as err:
+        errors.append(err)
+    finally:
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+def _skip_header(stdout: BinaryIO) -> None:
+    """Consume a Radiance header and resolution string, if present."""
+    if stdout.peek(10)[:10] == b"#?RADIANCE":
+        while stdout.readline().strip():
+            pass
+    if stdout.peek(2)[:2] in (b"-Y", b"+Y", b"-X", b"+X"):
+        stdout.readline()
+
+
+def _drain(stdout: BinaryIO, out: StreamOutput, chunk_size: int):
+    if out is None:
+        return stdout.read()
+    if isinstance(out, np.ndarray):
+        if not out.flags.c_contiguous:
+            raise ValueError("Output array must be C-contiguous")
+        mv = memoryview(out).cast("B")
+        pos = 0
+        while pos < len(mv):
+            nread = stdout.readinto(mv[pos : pos + chunk_size])
+            if not nread:
+                break
+            pos += nread
+        if stdout.read(1):
+            raise ValueError(f"Output exceeds the {len(mv)} bytes of the array")
+        if isinstance(out, np.memmap):
+            out.flush()
+        return out
+    if isinstance(out, (str, Path)):
+        with open(out, "wb") as wtr:
+            _drain(stdout, wtr, chunk_size)
+        return str(out)
+    while chunk := stdout.read(chunk_size):
+        out.write(chunk)
+    return out
+
+
+def stream_run(
+    cmd: list[str],
+    inp: None | StreamInput = None,
+    out: StreamOutput = None,
+    chunk_size: int = CHUNK_SIZE,
+    skip_header: bool = False,
+):
+    """Run a command while streaming its standard input and output.
+
+    Input is fed through a writer thread and output is read incrementally,
+    so neither has to be held in memory in full.
+
+    Args:
+        cmd: command to run
+        inp: bytes, a file path, an array (e.g. np.memmap) or an
+            iterator of bytes/array chunks to send to stdin.
+        out: None to return stdout as bytes; a file path or a writable
+            binary file object to write to; or a preallocated C-contiguous
+            array (e.g. np.memmap) to read the binary output into.
+        chunk_size: size in bytes of each read and write.
+        skip_header: discard a Radiance header and resolution string
+            at the start of output. Always done when out is an array.
+
+    Returns:
+        stdout bytes if out is None, otherwise out (str for a path).
+    """
+    if out is None and not skip_header and (inp is None or isinstance(inp, bytes)):
+        return sp.run(cmd, check=True, input=inp, stdout=sp.PIPE, stderr=sp.PIPE).stdout
+    stdin_file = None
+    if isinstance(inp, (str, Path)):
+        stdin_file = open(inp, "rb")
+    errors: list[Exception] = []
+    with tempfile.TemporaryFile() as errfile:
+        try:
+            proc = sp.Popen(
+                cmd,
+                stdin=sp.DEVNULL if inp is None else stdin_file or sp.PIPE,
+                stdout=sp.PIPE,
+                stderr=errfile,
+            )
+        finally:
+            if stdin_file is not None:
+                stdin_file.close()
+        writer = None
+        if proc.stdin is not None:
+            writer = threading.Thread(
+                target=_feed, args=(proc.stdin, inp, chunk_size, errors), daemon=True
+            )
+            writer.start()
+        try:
+            if skip_header or isinstance(out, np.ndarray):
+                _skip_header(proc.stdout)
+            result = _drain(proc.stdout, out, chunk_size)
+        finally:
+            proc.stdout.close()
+            if writer is not None:
+                writer.join()
+            proc.wait()
+        if proc.returncode != 0:
+            errfile.seek(0)
+            raise CalledProcessError(proc.returncode, cmd, stderr=errfile.read())
+    if errors:
+        raise errors[0]
+    return result
+
+
+# Radiance picture and matrix data formats as written on a FORMAT= line
+PICFMT = {"32-bit_rle_rgbe", "32-bit_rle_xyze", "Radiance_spectra"}
+
+# Run-length encoding is only used for scanlines within these bounds
+MINELEN = 17
+MAXELEN = 0x7FFF
+# Shortest run worth a run code
+MINRUN = 4
+
+
+def parse_header(data: bytes) -> tuple[list[str], int]:
+    """Split the information header off Radiance data.
+
+    Args:
+        data: bytes starting with a Radiance header.
+
+    Returns:
+        header lines (without newlines) and the offset of the data that follows.
+    """
+    if not data.startswith(b"#?"):
+        raise ValueError("Missing Radiance header")
+    end = data.find(b"\n\n")
+    if end < 0:
+        raise ValueError("Unterminated Radiance header")
+    lines = data[:end].decode(errors="replace").splitlines()
+    return lines, end + 2
+
+
+def parse_resolution(data: bytes, offset: int = 0) -> tuple[str, int, int, int]:
+    """Parse a resolution string such as '-Y 480 +X 640'.
+
+    Args:
+        data: bytes containing the resolution string.
+        offset: position of the resolution string in data.
+
+    Returns:
+        orientation (e.g. '-Y+X'), number of scanlines,
+        scanline length, and the offset of the data that follows.
+    """
+    end = data.find(b"\n", offset)
+    if end < 0:
+        raise ValueError("Missing resolution string")
+    fields = data[offset:end].split()
+    if (
+        len(fields) != 4
+        or fields[0][1:] not in (b"X", b"Y")
+        or {fields[0][1:], fields[2][1:]} != {b"X", b"Y"}
+    ):
+        raise ValueError(f"Bad resolution string: {data[offset:end]!r}")
+    orient = (fields[0] + fields[2]).decode()
+    return orient, int(fields[1]), int(fields[3]), end + 1
+
+
+def _read_head(path: str | Path, size: int = 1 << 16) -> bytes:
+    """Read enough of a file to cover its header and resolution string."""
+    with open(path, "rb") as rdr:
+        data = rdr.read(size)
+        while True:
+            end = data.find(b"\n\n")
+            if end >= 0 and data.find(b"\n", end + 2) >= 0:
+                return data
+            more = rdr.read(size)
+            if not more:
+                return data
+            data += more
+
+
+@dataclass(slots=True)
+class HeaderInfo:
+    """Fields of a Radiance information header.
+
+    Attributes:
+        lines: header lines without newlines, starting with the #? identifier
+        fmt: FORMAT= value, None if not given
+        exposure: product of the EXPOSURE= values
+        view: options of the VIEW= lines in order, None if not given
+        nrows: NROWS= value, 0 if not given
+        ncols: NCOLS= value, 0 if not given
+        ncomp: NCOMP= value, 3 if not given
+        primaries: PRIMARIES= chromaticities, None if not given
+        resolution: orientation, number of scanlines and scanline length from
+            the resolution string, None if there is none
+        header_end: offset just past the blank line ending the header
+        offset: offset of the data, past the resolution string if any
+    """
+
+    lines: list[str] = field(default_factory=list)
+    fmt: None | str = None
+    exposure: float = 1.0
+    view: None | str = None
+    nrows: int = 0
+    ncols: int = 0
+    ncomp: int = 3
+    primaries: None | tuple[float, ...] = None
+    resolution: None | tuple[str, int, int] = None
+    header_end: int = 0
+    offset: int = 0
+
+    @property
+    def dimensions(self) -> None | tuple[int, int]:
+        """Picture width and height from the resolution string, None if there is none."""
+        if self.resolution is None:
+            return None
+        orient, nscan, length = self.resolution
+        return (length, nscan) if orient[1] == "Y" else (nscan, length)
+
+
+def read_header(inp: str | Path | bytes) -> HeaderInfo:
+    """Parse the information header and resolution string of a Radiance file.
+
+    Only the beginning of a file is read.
+
+    Args:
+        inp: file path or bytes
+
+    Returns:
+        HeaderInfo
+    """
+    data = _read_head(inp, 1 << 12) if isinstance(inp, (str, Path)) else inp
+    lines, end = parse_header(data)
+    info = HeaderInfo(lines=lines, header_end=end, offset=end)
+    views = []
+    for line in lines[1:]:
+        key, sep, value = line.partition("=")
+        if not sep:
+            continue
+        if key == "FORMAT":
+            info.fmt = value.strip()
+        elif key == "EXPOSURE":
+            info.exposure *= float(value)
+        elif key == "VIEW":
+            views.append(value.strip())
+        elif key in ("NROWS", "NCOLS", "NCOMP"):
+            setattr(info, key.lower(), int(value))
+        elif key == "PRIMARIES":
+            info.primaries = tuple(float(v) for v in value.split())
+    if views:
+        info.view = " ".join(views)
+    if data[end : end + 1] in (b"-", b"+"):
+        try:
+            orient, nscan, length, info.offset = parse_resolution(data, end)
+        except ValueError:
+            pass
+        else:
+            info.resolution = (orient, nscan, length)
+    return info
+
+
+def rgbe_to_float(colr: np.ndarray) -> np.ndarray:
+    """Convert common-exponent colors to float32.
+
+    Args:
+        colr: uint8 array whose last axis holds the mantissas
+            followed by the shared exponent.
+
+    Returns:
+        float32 array with the exponent axis removed.
+    """
+    colr = np.asarray(colr, dtype=np.uint8)
+    # same table as colr_color(): (m + 0.5) * 2^(e - 136), zero if e == 0
+    scale = np.ldexp(np.float32(1), np.arange(256, dtype=np.int32) - 136)
+    scale = scale.astype(np.float32)
+    scale[0] = 0
+    scale = scale[colr[..., -1]]
+    # one component at a time, into C order whatever the input layout
+    color = np.empty(colr.shape[:-1] + (colr.shape[-1] - 1,), dtype=np.float32)
+    for i in range(color.shape[-1]):
+        np.add(colr[..., i], np.float32(0.5), out=color[..., i], dtype=np.float32)
+        color[..., i] *= scale
+    return color
+
+
+def float_to_rgbe(color: np.ndarray) -> np.ndarray:
+    """Convert float colors to common-exponent uint8 colors, as setcolr().
+
+    Args:
+        color: array whose last axis holds color components.
+
+    Returns:
+        uint8 array with one more element on the last axis for the exponent.
+    """
+    color = np.asarray(color, dtype=np.float64)
+    cmax = color.max(axis=-1, keepdims=True)
+    mant, expo = np.frexp(cmax)
+    valid = cmax > 1e-32
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mult = np.where(valid, mant * 256.0 / cmax, 0.0)
+    colr = np.empty(color.shape[:-1] + (color.shape[-1] + 1,), dtype=np.uint8)
+    colr[..., :-1] = np.clip(color * mult, 0, 255).astype(np.uint8)
+    colr[..., -1:] = np.where(valid, expo + 128, 0).astype(np.uint8)
+    return colr
+
+
+def _rle_chains(buf: np.ndarray, starts: np.ndarray, width: int):
+    """Follow the run-length code chains of many scanlines in lockstep.
+
+    Returns the end offset of each chain (-1 where the bytes at a start
+    cannot be a valid scanline) and, per step, the code positions visited.
+    """
+    size = len(buf)
+    total = 4 * width
+    pos = starts + 4
+    count = np.zeros(len(starts), dtype=np.int64)
+    ends = np.full(len(starts), -1, dtype=np.int64)
+    alive = np.arange(len(starts))
+    steps = []
+    while len(alive):
+        if pos.max() >= size:
+            ok = pos < size
+            alive, pos, count = alive[ok], pos[ok], count[ok]
+        code = buf[pos].astype(np.int64)
+        run = code > 128
+        nval = code - 128 * run
+        # a code must not run past the end of its component
+        ok = (nval > 0) & (count % width + nval <= width)
+        if not ok.all():
+            alive, pos, count, run, nval = alive[ok], pos[ok], count[ok], run[ok], nval[ok]
+        steps.append(pos)
+        count += nval
+        pos = pos + 2 + (nval - 1) * ~run
+        done = count == total
+        if done.any():
+            ends[alive[done]] = pos[done]
+            keep = ~done
+            alive, pos, count = alive[keep], pos[keep], count[keep]
+    return ends, steps
+
+
+def _decode_rle(buf: np.ndarray, nscan: int, width: int) -> np.ndarray:
+    """Decode new-style run-length encoded scanlines without a per-byte loop."""
+    mark = np.array([2, 2, width >> 8, width & 255], dtype=np.uint8)
+    # every offset that looks like a scanline start is a candidate
+    cand = np.flatnonzero(
+        (buf[:-3] == mark[0])
+        & (buf[1:-2] == mark[1])
+        & (buf[2:-1] == mark[2])
+        & (buf[3:] == mark[3])
+    )
+    ends, steps = _rle_chains(buf, cand, width)
+    # link the chain of true scanline starts from the first one
+    starts = np.empty(nscan, dtype=np.int64)
+    pos = 0
+    for i in range(nscan):
+        idx = np.searchsorted(cand, pos)
+        if idx == len(cand) or cand[idx] != pos or ends[idx] < 0:
+            raise ValueError(f"Bad run-length encoded scanline {i}")
+        starts[i] = pos
+        pos = ends[idx]
+    if len(cand) > nscan:
+        # replay the true chains only
+        _, steps = _rle_chains(buf, starts, width)
+    # codes in file order yield values in output order
+    is_code = np.zeros(len(buf), dtype=bool)
+    is_code[np.concatenate(steps)] = True
+    cpos = np.flatnonzero(is_code)
+    code = buf[cpos]
+    run = code > 128
+    nval = code.astype(np.int64) - 128 * run
+    # repeat each byte as often as it occurs in the output: literal values
+    # once, run values by their run length, codes and scanline marks never
+    reps = np.zeros(len(buf) + 1, dtype=np.int8)
+    reps[cpos[~run] + 1] = 1
+    reps[cpos[~run] + 1 + nval[~run]] = -1
+    reps = np.cumsum(reps[:-1], dtype=np.int8)
+    reps[cpos[run] + 1] = nval[run]
+    out = np.repeat(buf, reps)
+    if len(out) != nscan * 4 * width:
+        raise ValueError("Bad run-length encoded data")
+    return out.reshape(nscan, 4, width).transpose(0, 2, 1)
+
+
+def _encode_rle(colrs: np.ndarray) -> bytes:
+    """Run-length encode (nscan, width, 4) scanlines in the new style.
+
+    Components are encoded separately, as in fwritecolrs(), with runs of
+    MINRUN or more equal bytes as run codes and everything in between as
+    literals; the two short-run special case of the C code is left out.
+    """
+    nscan, width, _ = colrs.shape
+    rows = np.ascontiguousarray(colrs.transpose(0, 2, 1)).reshape(-1)
+    size = len(rows)
+    # maximal runs of equal bytes within each component row
+    brk = np.ones(size, dtype=bool)
+    np.not_equal(rows[1:], rows[:-1], out=brk[1:])
+    brk[::width] = True
+    starts = np.flatnonzero(brk)
+    is_run = np.diff(starts, append=size) >= MINRUN
+    # segments are long runs and the stretches of short runs between them
+    seg = is_run.copy()
+    seg[1:] |= is_run[:-1]
+    seg |= starts % width == 0
+    sstart = starts[seg]
+    slen = np.diff(sstart, append=size)
+    srun = is_run[seg]
+    # split segments into codes of at most 127 run or 128 literal values
+    cap = np.where(srun, 127, 128)
+    nchunk = -(-slen // cap)
+    cseg = np.repeat(np.arange(len(sstart)), nchunk)
+    skip = (np.arange(len(cseg)) - np.repeat(np.cumsum(nchunk) - nchunk, nchunk)) * cap[cseg]
+    cstart = sstart[cseg] + skip
+    clen = np.minimum(cap[cseg], slen[cseg] - skip)
+    crun = srun[cseg]
+    # each scanline starts with its 2 2 width mark
+    head = np.where(cstart % (4 * width) == 0, 4, 0)
+    nbyte = np.where(crun, 2, 1 + clen) + head
+    cpos = np.cumsum(nbyte) - nbyte + head
+    out = np.empty(int(nbyte.sum()), dtype=np.uint8)
+    for i, byte in enumerate((2, 2, width >> 8, width & 255)):
+        out[cpos[head > 0] - 4 + i] = byte
+    out[cpos] = np.where(crun, 128 + clen, clen)
+    out[cpos[crun] + 1] = rows[cstart[crun]]
+    # literal values keep their order
+    lits = np.zeros(len(out) + 1, dtype=np.int8)
+    lits[cpos[~crun] + 1] = 1
+    lits[cpos[~crun] + 1 + clen[~crun]] = -1
+    out[np.cumsum(lits[:-1], dtype=np.int8).view(bool)] = rows[np.repeat(~crun, clen)]
+    return out.tobytes()
+
+
+def encode_colrs(colrs: np.ndarray) -> bytes:
+    """Encode RGBE/XYZE scanlines as fwritecolrs() does.
+
+    Scanlines of MINELEN to MAXELEN pixels are run-length encoded, others
+    are written flat.
+
+    Args:
+        colrs: uint8 array of shape (nscan, width, 4).
+
+    Returns:
+        encoded bytes to follow the resolution string.
+    """
+    colrs = np.asarray(colrs, dtype=np.uint8)
+    nscan, width, _ = colrs.shape
+    if not MINELEN <= width <= MAXELEN or nscan == 0:
+        return colrs.tobytes()
+    return _encode_rle(colrs)
+
+
+def _decode_old_rle(buf: np.ndarray, nscan: int, width: int) -> np.ndarray:
+    """Decode flat or old-style (1, 1, 1, n) run-length encoded pixels."""
+    pix = buf[: len(buf) // 4 * 4].reshape(-1, 4)
+    rep = (pix[:, 0] == 1) & (pix[:, 1] == 1) & (pix[:, 2] == 1)
+    total = nscan * width
+    if not rep[1:].any():
+        if len(pix) < total:
+            raise ValueError("Premature end of pixel data")
+        return pix[:total].reshape(nscan, width, 4)
+    # with nothing to repeat yet, a run marker is a pixel
+    rep[0] = False
+    idx = np.arange(len(pix))
+    last = np.maximum.accumulate(np.where(rep, 0, idx))
+    # successive markers hold higher bytes of one count
+    shift = idx - last - 1
+    nrep = pix[:, 3].astype(np.int64)
+    count = np.where(shift < 4, nrep << (8 * np.minimum(shift, 3)), np.where(nrep > 0, total, 0))
+    count = np.where(rep, count, 1)
+    ends = np.cumsum(count)
+    if len(ends) == 0 or ends[-1] < total:
+        raise ValueError("Premature end of pixel data")
+    nused = int(np.searchsorted(ends, total)) + 1
+    count = count[:nused]
+    count[-1] -= ends[nused - 1] - total
+    colrs = np.repeat(pix[last[:nused]], count, axis=0)
+    return colrs.reshape(nscan, width, 4)
+
+
+def decode_colrs(data: bytes | np.ndarray, nscan: int, width: int) -> np.ndarray:
+    """Decode RGBE/XYZE scanlines as written by fwritecolrs().
+
+    Args:
+        data: encoded bytes following the resolution string.
+        nscan: number of scanlines.
+        width: scanline length.
+
+    Returns:
+        uint8 array of shape (nscan, width, 4).
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if nscan == 0 or width == 0:
+        return np.empty((nscan, width, 4), dtype=np.uint8)
+    if (
+        MINELEN <= width <= MAXELEN
+        and len(buf) >= 4
+        and buf[0] == 2
+        and buf[1] == 2
+        and not buf[2] & 0x80
+    ):
+        return _decode_rle(buf, nscan, width)
+    return _decode_old_rle(buf, nscan, width)
@@ -0,0 +1,207 @@
+"""
+On-disk result caching
+"""
+
+from pathlib import Path
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+# file digests keyed by (path, size, mtime), so unchanged files are hashed once
+_DIGESTS: dict[tuple[str, int, int], str] = {}
+
+
+def file_digest(path: str | Path) -> str:
+    """SHA-256 digest of a file's content, memoized on its size and mtime."""
+    stat = os.stat(path)
+    memo = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo not in _DIGESTS:
+        sha = hashlib.sha256()
+        with open(path, "rb") as rdr:
+            while chunk := rdr.read(1 << 20):
+                sha.update(chunk)
+        _DIGESTS[memo] = sha.hexdigest()
+    return _DIGESTS[memo]
+
+
+class MatrixCache:
+    """Content-addressed on-disk cache with least-recently-used and age eviction.
+
+    Results are stored under a hash of everything they depend on. For
+    commands, each argument naming an existing file (octree, receiver,
+    scene files, ...) contributes its content rather than its name, so
+    editing a file invalidates its results while renaming it does not.
+    Files referenced from inside scene descriptions are not followed.
+
+    Examples:
+        >>> cache = MatrixCache("~/.cache/pyradiance", max_size=20 << 30)
+        >>> dmx = rfluxmtx("sky.rad", rays=rays, octree="room.oct", params=params, cache=cache)
+    """
+
+    def __init__(self, directory: str | Path, max_size: int = 10 << 30, max_age: None | float = None):
+        """
+        Args:
+            directory: cache directory, created if missing
+            max_size: total size in bytes above which least recently used entries are removed
+            max_age: seconds since last use after which entries are removed, None to keep them
+        """
+        self.directory = Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.max_age = max_age
+
+    def key(self, *parts) -> str:
+        """Hash bytes, strings, paths of existing files, arrays and sequences of these."""
+        sha = hashlib.sha256()
+
+        def update(part):
+            if isinstance(part, (bytes, bytearray, memoryview)):
+                sha.update(b"b%d:" % len(part))
+                sha.update(part)
+            elif isinstance(part, np.ndarray):
+                sha.update(f"a{part.dtype.str}{part.shape}:".encode())
+                sha.update(memoryview(np.ascontiguousarray(part)).cast("B"))
+            elif isinstance(part, (str, Path)) and os.path.isfile(part):
+                sha.update(f"f{file_digest(part)}:".encode())
+            elif isinstance(part, (list, tuple)):
+                sha.update(b"l%d:" % len(part))
+                for item in part:
+                    update(item)
+            else:
+                text = str(part).encode()
+                sha.update(b"s%d:" % len(text))
+                sha.update(text)
+
+        for part in parts:
+            update(part)
+        return sha.hexdigest()
+
+    def command_key(self, cmd: list[str], inp=None, out=None) -> None | str:
+        """Key for a command's standard output, None if it cannot be cached.
+
+        Commands fed from an iterator or writing to an open file are not cached.
+        """
+        if inp is not None and not isinstance(inp, (bytes, str, Path, np.ndarray)):
+            return None
+        if out is not None and not isinstance(out, (str, Path, np.ndarray)):
+            return None
+        # programs are keyed by name, not by their binaries
+        return self.key(os.path.basename(cmd[0]), cmd[1:], inp, isinstance(out, np.ndarray))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.bin"
+
+    def get(self, key: str) -> None | Path:
+        """Path of a cached entry, marking it as recently used; None on a miss."""
+        path = self._path(key)
+        # explicit, fine-grained times keep the use order of quick successive calls
+        now = time.time_ns()
+        try:
+            if self.max_age is not None and now - path.stat().st_mtime_ns > self.max_age * 1e9:
+                path.unlink(missing_ok=True)
+                return None
+            os.utime(path, ns=(now, now))
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, data: bytes | str | Path | np.ndarray) -> Path:
+        """Store bytes, an array or a copy of a file under key."""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as wtr:
+            if isinstance(data, (str, Path)):
+                with open(data, "rb") as rdr:
+                    shutil.copyfileobj(rdr, wtr)
+            elif isinstance(data, np.ndarray):
+                np.ascontiguousarray(data).tofile(wtr)
+            else:
+                wtr.write(data)
+        os.replace(tmp, self._path(key))
+        self.get(key)
+        self.evict()
+        return self._path(key)
+
+    def fetch(self, key: str, out: None | str | Path | np.ndarray = None):
+        """Read a cached entry the way a command would have produced it.
+
+        Returns:
+            None on a miss, or if out is an array of another size than the
+            entry; otherwise bytes if out is None, or out filled in (str for
+            a path).
+        """
+        path = self.get(key)
+        if path is None:
+            return None
+        if out is None:
+            return path.read_bytes()
+        if isinstance(out, np.ndarray):
+            # an entry of another size is for another output shape
+            if path.stat().st_size != out.nbytes:
+                return None
+            with open(path, "rb") as rdr:
+                if rdr.readinto(memoryview(out).cast("B")) != out.nbytes:
+                    return None
+            if isinstance(out, np.memmap):
+                out.flush()
+            return out
+        shutil.copyfile(path, out)
+        return str(out)
+
+    def store(self, key: str, result, out: None | str | Path | np.ndarray = None) -> None:
+        """Store a command result given the output it was written to."""
+        self.put(key, result if out is None else out)
+
+    def save(self, key: str, array: np.ndarray) -> Path:
+        """Store an array with its shape and dtype, in .npy format."""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as wtr:
+            np.save(wtr, array, allow_pickle=False)
+        os.replace(tmp, self._path(key))
+        self.get(key)
+        self.evict()
+        return self._path(key)
+
+    def load(self, key: str) -> None | np.memmap:
+        """Read-only memory map of an array stored with save(), None on a miss."""
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            return np.load(path, mmap_mode="r", allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+
+    @property
+    def size(self) -> int:
+        """Total size of cached entries in bytes."""
+        return sum(p.stat().st_size for p in self.directory.glob("*.bin"))
+
+    def evict(self) -> None:
+        """Remove entries past max_age, then least recently used entries
+        until the cache fits max_size."""
+        oldest = None if self.max_age is None else time.time_ns() - self.max_age * 1e9
+        entries = []
+        for path in self.directory.glob("*.bin"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if oldest is not None and stat.st_mtime_ns < oldest:
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        """Remove all cached entries."""
+        for path in self.directory.glob("*.bin"):
+            path.unlink(missing_ok=True)
@@ -2,17 +2,23 @@
 Radiance generators and scene Manipulators
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import subprocess as sp
 from datetime import datetime
 from pathlib import Path
 from dataclasses import dataclass, field
 import os
 import json
+import sys
 import tempfile
-from typing import Sequence, NamedTuple
+from typing import Callable, Sequence, NamedTuple
 from enum import Enum
 
-from .anci import BINPATH, handle_called_process_error
+import numpy as np
+
+from .anci import BINPATH, FileType, handle_called_process_error
+from .cache import MatrixCache
+from .mtx import FORMATS, read_matrix, read_matrix_header
 
 NM_PER_MICRON = 1e3
 M_PER_MM = 1e-3
@@ -232,6 +238,171 @@ def gendaylit(
     return sp.run(cmd, stderr=sp.PIPE, stdout=sp.PIPE, check=True).stdout
 
 
+def _weather_split(data: bytes) -> tuple[list[bytes], list[bytes]]:
+    """Split a WEA or EPW weather tape into header and data lines."""
+    lines = data.splitlines(keepends=True)
+    nhead = 0
+    while nhead < len(lines) and not lines[nhead][:1].isdigit():
+        nhead += 1
+    return lines[:nhead], [line for line in lines[nhead:] if line.strip()]
+
+
+def _is_leap_day(line: bytes) -> bool:
+    fields = line.replace(b",", b" ").split()
+    # EPW lines start with the year, WEA lines with the month
+    month, day = (fields[1], fields[2]) if b"," in line else (fields[0], fields[1])
+    return int(month) == 2 and int(day) == 29
+
+
+@handle_called_process_error
+def _gendaymtx_chunk(cmd: list[str], tape: bytes) -> bytes:
+    return sp.run(cmd, check=True, input=tape, stdout=sp.PIPE, stderr=sp.PIPE).stdout
+
+
+def _gendaymtx_ncols(cmd: list[str], tape: bytes) -> int:
+    """Number of time steps gendaymtx keeps from a tape, 0 if none."""
+    proc = sp.run(cmd, input=tape, stdout=sp.PIPE, stderr=sp.PIPE)
+    return read_matrix_header(proc.stdout).ncols if proc.returncode == 0 else 0
+
+
+def _tape_chunks(lines: list[bytes], size: int, nprev: int) -> list[tuple[list[bytes], list[bytes]]]:
+    """Split weather records into chunks of size records, as (warmup, body) pairs.
+
+    Each chunk after the first is preceded by the nprev records before it
+    and by the tape's first leap day, so that state carried from record to
+    record and the date shift after a leap day are as in a single run.
+    """
+    leap = next((i for i, line in enumerate(lines) if _is_leap_day(line)), len(lines))
+    chunks = []
+    for start in range(0, len(lines), size):
+        warmup = lines[max(start - nprev, 0) : start]
+        if leap < start - nprev:
+            warmup = [lines[leap]] + warmup
+        chunks.append((warmup, lines[start : start + size]))
+    return chunks
+
+
+def _header_word(word: str) -> str:
+    """Quote a command argument for a header line as Radiance's fputword() does."""
+    quote = ""
+    for char in word[1:-1]:
+        if char == '"':
+            quote = "'"
+        elif char == "'":
+            quote = '"'
+    if not word or any(char.isspace() for char in word) or quote:
+        quote = quote or '"'
+        return quote + word + quote
+    return word
+
+
+def _daymtx_parallel(
+    cmd: list[str],
+    data: bytes,
+    nproc: int,
+    header: bool,
+    average: bool,
+    daylight_hours_only: bool,
+    outform: FileType,
+    out: None | str | Path,
+    argv: list[str],
+    nprev: int = 2,
+    ncols_cmd: None | list[str] = None,
+    nchunks: None | int = None,
+    progress: None | Callable[[int, int], None] = None,
+) -> bytes | str:
+    """Run gendaymtx or gensdaymtx on time chunks of a weather tape concurrently.
+
+    The columns of the warm-up records of each chunk (see _tape_chunks) are
+    dropped again; with daylight hours only, ncols_cmd counts how many of
+    them were kept. Chunk results are assembled into the output of a single
+    run with command line argv, byte for byte.
+    """
+    name = os.path.basename(cmd[0])
+    head, lines = _weather_split(data)
+    head = b"".join(head)
+    chunks = _tape_chunks(lines, -(-len(lines) // (nchunks or nproc)), nprev)
+
+    def run(chunk):
+        warmup, body = chunk
+        if not warmup:
+            nwarm = 0
+        elif daylight_hours_only:
+            nwarm = _gendaymtx_ncols(ncols_cmd, head + b"".join(warmup))
+        else:
+            nwarm = len(warmup)
+        try:
+            result = _gendaymtx_chunk(cmd, head + b"".join(warmup + body))
+        except RuntimeError:
+            # no valid time steps in this chunk
+            if daylight_hours_only:
+                return None
+            raise
+        return read_matrix_header(result), read_matrix(result)[:, nwarm:]
+
+    results = [None] * len(chunks)
+    done = 0
+    with ThreadPoolExecutor(max_workers=nproc) as executor:
+        futures = {executor.submit(run, chunk): i for i, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            done += len(chunks[futures[future]][1])
+            if progress is not None:
+                progress(done, len(lines))
+    results = [r for r in results if r is not None]
+    if not results:
+        raise RuntimeError(f"{name}: no valid time steps on input")
+    blocks = [mtx for _, mtx in results if mtx.shape[1] > 0]
+    nsteps = sum(b.shape[1] for b in blocks)
+    hdr = results[0][0]
+    if average:
+        # accumulate and scale in single precision, step by step, as gendaymtx -A
+        total = np.zeros((hdr.nrows, hdr.ncomp), dtype=np.float32)
+        for block in blocks:
+            for step in range(block.shape[1]):
+                total += block[:, step]
+        blocks = [(total.astype(np.float64) * (1.0 / nsteps)).astype(np.float32)[:, np.newaxis]]
+    nrows, ncomp = blocks[0].shape[0], blocks[0].shape[2]
+    ncols = sum(b.shape[1] for b in blocks)
+    # the header and number format of a single run
+    preamble = b""
+    if header:
+        info = ["#?RADIANCE", " ".join(_header_word(word) for word in argv)]
+        info += [line for line in hdr.info if line.startswith("LATLONG=")]
+        info += [f"NROWS={nrows}", f"NCOLS={ncols}"]
+        if average:
+            info.append(f"NAVERAGED={nsteps}")
+        info.append(f"NCOMP={ncomp}")
+        if hdr.wavelength_splits is not None:
+            info.append("WAVELENGTH_SPLITS= " + " ".join(f"{w:g}" for w in hdr.wavelength_splits))
+        if outform in ("f", "d"):
+            info.append(f"BigEndian={int(sys.byteorder == 'big')}")
+        info.append(f"FORMAT={FORMATS[outform]}")
+        preamble = ("\n".join(info) + "\n\n").encode()
+    if name == "gensdaymtx":
+        rowfmt = "%.3g " * ncomp + "\n"
+    else:
+        rowfmt = " ".join(["%.3g"] * ncomp) + "\n"
+    dtype = np.float32 if outform == "f" else np.float64
+
+    def rows():
+        for i in range(nrows):
+            row = np.concatenate([block[i] for block in blocks])
+            if outform != "a":
+                yield row.astype(dtype).tobytes()
+            elif ncols > 1:
+                yield ((rowfmt * ncols) % tuple(row.ravel().tolist()) + "\n").encode()
+            else:
+                yield (rowfmt % tuple(row.ravel().tolist())).encode()
+
+    if out is None:
+        return preamble + b"".join(rows())
+    with open(out, "wb") as wtr:
+        wtr.write(preamble)
+        wtr.writelines(rows())
+    return str(out)
+
+
 @handle_called_process_error
 def gendaymtx(
     weather_data: str | Path | bytes,
@@ -251,7 +422,10 @@ def gendaymtx(
     onesun: bool = False,
     solar_radiance: bool = False,
     mfactor: int = 1,
-) -> bytes:
+    nproc: int = 1,
+    out: None | str | Path = None,
+    cache: None | MatrixCache = None,
+) -> bytes | str:
     """Generate an annual Perez sky matrix from a weather tape.
 
     Args:
@@ -272,19 +446,21 @@ def gendaymtx(
         outform: outform
         onesun: onesun
         solar_radiance: solar radiance
+        nproc: number of gendaymtx processes, each computing a time chunk of
+            the tape; not used with sun_file, sun_mods or dryrun
+        out: output file path, None to return bytes; binary output with a
+            header is written in place through a memory map
+        cache: cache to reuse results from, keyed on the weather content
+            and options. Not used with sun_file, sun_mods or dryrun.
 
     Returns:
-        bytes: output of gendaymtx
+        bytes: output of gendaymtx, or the output path if out is given
     """
     stdin = None
     cmd = [str(BINPATH / "gendaymtx")]
     cmd.extend(["-m", str(mfactor)])
     if verbose:
         cmd.append("-v")
-    if not header:
-        cmd.append("-h")
-    if average:
-        cmd.append("-A")
     if sun_only:
         cmd.append("-d")
     elif sky_only:
@@ -295,28 +471,68 @@ def gendaymtx(
         cmd.extend(["-c", *[str(i) for i in sky_color]])
     if ground_color:
         cmd.extend(["-g", *[str(i) for i in ground_color]])
-    if dryrun:
-        cmd.append("-n")
     if daylight_hours_only:
         cmd.append("-u")
     if solar_radiance:
         cmd.append("-O1")
+    if rotate is not None:
+        cmd.extend(["-r", str(rotate)])
+    if not isinstance(weather_data, (str, Path, bytes)):
+        raise TypeError("weather_data must be a string, Path, or bytes")
+    key = None
+    if cache is not None and sun_file is None and sun_mods is None and not dryrun:
+        # the number of processes does not change the result
+        key = cache.key("gendaymtx", cmd[1:], header, average, outform, weather_data)
+    if key is not None and (result := cache.fetch(key, out)) is not None:
+        return result
+    if nproc > 1 and sun_file is None and sun_mods is None and not dryrun:
+        data = weather_data if isinstance(weather_data, bytes) else Path(weather_data).read_bytes()
+        # command line of the equivalent single run, for the header
+        argv = [os.path.basename(cmd[0]), *cmd[1:]]
+        if average:
+            argv.append("-A")
+        if outform is not None:
+            argv.append(f"-o{outform}")
+        if not isinstance(weather_data, bytes):
+            argv.append(str(weather_data))
+        result = _daymtx_parallel(
+            cmd + ["-of"],
+            data,
+            nproc,
+            header,
+            average,
+            daylight_hours_only,
+            outform or "a",
+            out,
+            argv=argv,
+            ncols_cmd=cmd[:1] + ["-m", "1", "-u"],
+        )
+        if key is not None:
+            cache.store(key, result, out)
+        return result
+    if not header:
+        cmd.append("-h")
+    if average:
+        cmd.append("-A")
+    if dryrun:
+        cmd.append("-n")
     if sun_file is not None:
         cmd.extend(["-D", sun_file])
     if sun_mods is not None:
         cmd.extend(["-M", sun_mods])
-    if rotate is not None:
-        cmd.extend(["-r", str(rotate)])
     if outform is not None:
         cmd.append(f"-o{outform}")
     if isinstance(weather_data, bytes):
         stdin = weather_data
-    elif isinstance(weather_data, (str, Path)):
-        cmd.append(str(weather_data))
     else:
-        raise TypeError("weather_data must be a string, Path, or bytes")
-    out = sp.run(cmd, check=True, input=stdin, stdout=sp.PIPE, stderr=sp.PIPE)
-    return out.stdout
+        cmd.append(str(weather_data))
+    out_bytes = sp.run(cmd, check=True, input=stdin, stdout=sp.PIPE, stderr=sp.PIPE).stdout
+    if key is not None:
+        cache.store(key, out_bytes)
+    if out is None:
+        return out_bytes
+    Path(out).write_bytes(out_bytes)
+    return str(out)
 
 
 class GenGlaze:
@@ -473,6 +689,35 @@ def genrev(
     return sp.run(cmd, stdout=sp.PIPE, check=True).stdout
 
 
+def _atmos_key(line: bytes) -> tuple[bool, None | str]:
+    """Season and aerosol optical depth naming the atmosphere data a record needs."""
+    if b"," in line:
+        fields = line.split(b",")
+        month, aod = int(fields[1]), fields[29] if len(fields) > 29 else b""
+    else:
+        fields = line.split()
+        month, aod = int(fields[0]), fields[5] if len(fields) > 5 else b""
+    # missing depths fall back to a default, as in gensdaymtx
+    depth = float(aod) if aod.strip() else 999.0
+    return 4 <= month <= 9, None if depth >= 999 else f"{depth:.2f}"
+
+
+@handle_called_process_error
+def _gensdaymtx_prime(binary: str, data: bytes, nthreads: int, out_dir: str) -> None:
+    """Pre-compute the atmosphere data for a weather tape in a single run.
+
+    gensdaymtx computes data missing from out_dir on first use, so runs
+    sharing out_dir would otherwise compute and write the same files at
+    once. One record per season and aerosol optical depth is enough.
+    """
+    head, lines = _weather_split(data)
+    records = {}
+    for line in lines:
+        records.setdefault(_atmos_key(line), line)
+    cmd = [binary, "-m", "1", "-h", "-of", "-n", str(nthreads), "-p", out_dir]
+    sp.run(cmd, check=True, input=b"".join(head + list(records.values())), stdout=sp.DEVNULL, stderr=sp.PIPE)
+
+
 @handle_called_process_error
 def gensdaymtx(
     weather_data: str | Path | bytes,
@@ -488,7 +733,11 @@ def gensdaymtx(
     onesun: bool = False,
     mfactor: int = 1,
     nthreads: int = 1,
-) -> bytes:
+    nproc: int = 1,
+    progress: None | Callable[[int, int], None] = None,
+    out: None | str | Path = None,
+    cache: None | MatrixCache = None,
+) -> bytes | str:
     """Generate an annual spectral sky matrix from a weather tape.
 
     Args:
@@ -504,17 +753,23 @@ def gensdaymtx(
         outform: outform
         onesun: onesun
         nthreads: number of threads to use for precomputations
+        nproc: number of gensdaymtx processes, each computing a time chunk
+            of the tape once the atmosphere data in out_dir are precomputed
+        progress: called as progress(done, total) with the number of time
+            steps computed so far; the tape is then run in chunks even with
+            a single process
+        out: output file path, None to return bytes; binary output with a
+            header is written in place through a memory map
+        cache: cache to reuse results from, keyed on the weather content
+            and options
 
     Returns:
-        bytes: output of gensdaymtx
+        bytes: output of gensdaymtx, or the output path if out is given
     """
-    stdin = None
     cmd = [str(BINPATH / "gensdaymtx")]
     cmd.extend(["-m", str(mfactor)])
     if verbose:
         cmd.append("-v")
-    if not header:
-        cmd.append("-h")
     if sun_only:
         cmd.append("-d")
     elif sky_only:
@@ -523,22 +778,63 @@ def gensdaymtx(
         cmd.extend(["-5", ".533"])
     if ground_reflectance:
         cmd.extend(["-g", str(ground_reflectance)])
-    cmd.extend(["-n", str(nthreads)])
     if daylight_hours_only:
         cmd.append("-u")
     if rotate is not None:
         cmd.extend(["-r", str(rotate)])
+    if not isinstance(weather_data, (str, Path, bytes)):
+        raise TypeError("weather_data must be a string, Path, or bytes")
+    key = None
+    if cache is not None:
+        # neither the thread and process counts nor the atmosphere data directory change the result
+        key = cache.key("gensdaymtx", cmd[1:], header, outform, weather_data)
+    if key is not None and (result := cache.fetch(key, out)) is not None:
+        return result
+    cmd.extend(["-n", str(nthreads), "-p", out_dir])
+    if nproc > 1 or progress is not None:
+        data = weather_data if isinstance(weather_data, bytes) else Path(weather_data).read_bytes()
+        _gensdaymtx_prime(cmd[0], data, nthreads, out_dir)
+        # command line of the equivalent single run, for the header
+        argv = [os.path.basename(cmd[0]), *cmd[1:]]
+        if outform is not None:
+            argv.append(f"-o{outform}")
+        if not isinstance(weather_data, bytes):
+            argv.append(str(weather_data))
+        result = _daymtx_parallel(
+            cmd + ["-of"],
+            data,
+            nproc,
+            header,
+            False,
+            daylight_hours_only,
+            outform or "a",
+            out,
+            argv=argv,
+            nprev=0,
+            ncols_cmd=cmd[:1] + ["-m", "1", "-u", "-p", out_dir],
+            # smaller chunks for finer progress reports
+            nchunks=nproc if progress is None else 4 * nproc,
+            progress=progress,
+        )
+        if key is not None:
+            cache.store(key, result, out)
+        return result
+    if not header:
+        cmd.append("-h")
     if outform is not None:
         cmd.append(f"-o{outform}")
-    cmd.extend(["-p", out_dir])
+    stdin = None
     if isinstance(weather_data, bytes):
         stdin = weather_data
-    elif isinstance(weather_data, (str, Path)):
-        cmd.append(str(weather_data))
     else:
-        raise TypeError("weather_data must be a string, Path, or bytes")
-    out = sp.run(cmd, check=True, input=stdin, stdout=sp.PIPE, stderr=sp.PIPE)
-    return out.stdout
+        cmd.append(str(weather_data))
+    out_bytes = sp.run(cmd, check=True, input=stdin, stdout=sp.PIPE, stderr=sp.PIPE).stdout
+    if key is not None:
+        cache.store(key, out_bytes)
+    if out is None:
+        return out_bytes
+    Path(out).write_bytes(out_bytes)
+    return str(out)
 
 
 @handle_called_process_error
@@ -698,6 +994,89 @@ def genssky(
     return sp.run(cmd, stderr=sp.PIPE, stdout=sp.PIPE, check=True).stdout
 
 
+def genssky_batch(
+    dts: Sequence[datetime],
+    latitude: float = 37.7,
+    longitude: float = 122.2,
+    timezone: int = 120,
+    year: None | int = None,
+    res: int = 64,
+    cloud_cover: float | Sequence[float] = 0.0,
+    ground_reflectance: float = 0.2,
+    broadband_aerosol_optical_depth: float = 0.115,
+    mie_file: None | str = None,
+    nthreads: int = 1,
+    out_dir: str = ".",
+    out_name: str = "out",
+    dir_norm_illum: None | Sequence[float] = None,
+    diff_hor_illum: None | Sequence[float] = None,
+    nproc: int = 1,
+    progress: None | Callable[[int, int], None] = None,
+) -> list[bytes]:
+    """Generate spectral skies for a series of times with concurrent genssky runs.
+
+    The i-th sky image is written as {out_name}_{i}_sky.hsr in out_dir. The
+    first sky of each season is generated alone, so that the atmosphere
+    data it precomputes into out_dir are there for the other runs to share.
+
+    Args:
+        dts: datetime objects
+        cloud_cover: cloud cover for all times or for each time
+        dir_norm_illum: direct normal illuminance for each time to calibrate against
+        diff_hor_illum: diffuse horizontal illuminance for each time to calibrate against
+        nproc: number of genssky processes
+        progress: called as progress(done, total) with the number of skies generated so far
+        Other arguments as for genssky.
+
+    Returns:
+        list[bytes]: output of genssky for each time
+    """
+    nsky = len(dts)
+    covers = np.broadcast_to(np.asarray(cloud_cover, dtype=float), (nsky,))
+    illums = [None] * nsky
+    if (dir_norm_illum is not None) and (diff_hor_illum is not None):
+        illums = list(zip(dir_norm_illum, diff_hor_illum))
+
+    def run(i):
+        dni, dhi = illums[i] or (None, None)
+        return genssky(
+            dts[i],
+            latitude=latitude,
+            longitude=longitude,
+            timezone=timezone,
+            year=year,
+            res=res,
+            cloud_cover=float(covers[i]),
+            ground_reflectance=ground_reflectance,
+            broadband_aerosol_optical_depth=broadband_aerosol_optical_depth,
+            mie_file=mie_file,
+            nthreads=nthreads,
+            out_dir=out_dir,
+            out_name=f"{out_name}_{i}",
+            dir_norm_illum=dni,
+            diff_hor_illum=dhi,
+        )
+
+    results = [None] * nsky
+    done = 0
+    firsts = {}
+    for i, dt in enumerate(dts):
+        firsts.setdefault(4 <= dt.month <= 9, i)
+    for i in firsts.values():
+        results[i] = run(i)
+        done += 1
+        if progress is not None:
+            progress(done, nsky)
+    with ThreadPoolExecutor(max_workers=nproc) as executor:
+        futures = {executor.submit(run, i): i for i in range(nsky) if results[i] is None}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            done += 1
+            if progress is not None:
+                progress(done, nsky)
+    return results
+
+
 @handle_called_process_error
 def mkillum(
     inp: bytes,
@@ -7,8 +7,11 @@ import shutil
 import tempfile
 from typing import Literal, NamedTuple
 
+import numpy as np
+
 from .cal import cnt, rcalc
-from .util import Rcomb, Rmtxop, rfluxmtx, rttree_reduce, strip_header, WrapBSDF, Xform
+from .mtx import read_matrix, transform_components
+from .util import Rmtxop, rfluxmtx, rttree_reduce, strip_header, WrapBSDF, Xform
 from .ot import oconv, getbbox
 from .gen import genblinds
 from .model import Primitive
@@ -220,8 +223,8 @@ def _ttree_comp(
 ) -> None:
     """Post-process rfluxmtx output to tensor tree format.
 
-    Runs Rcomb | strip_header | rcalc | rttree_reduce pipeline and writes
-    the result to dest.
+    Converts RGB flux to luminance per solid angle in-process and runs
+    rttree_reduce on the result, which is written to dest.
 
     Args:
         src: path to rfluxmtx output .dat file (RGB flux)
@@ -233,16 +236,15 @@ def _ttree_comp(
         reciprocal: apply reciprocity averaging
         is_trans: True for transmission component, False for reflection
     """
-    inform = None if os.name == "nt" else "f"
     fmt = "a" if os.name == "nt" else "f"
 
-    # Convert RGB flux to XYZ and strip Radiance header
-    xyz_data = Rcomb(outform=fmt, transform="xyz").add_input(src)()
-    stripped = strip_header(xyz_data)
-
-    # Extract Y luminance normalized by solid angle Omega = pi/ns^2
-    expr = f"Xi=$1;Yi=$2;Zi=$3;Omega:PI/({ns}*{ns});$1=Yi/Omega"
-    luminance = rcalc(stripped, inform=inform, incount=3, outform=fmt, expr=expr)
+    # Y of the RGB flux normalized by solid angle Omega = pi/ns^2
+    omega = math.pi / (ns * ns)
+    luminance = transform_components(read_matrix(src), "y", scale=1 / omega)
+    if fmt == "a":
+        luminance = "".join(f"{v:.7e}\n" for v in luminance.ravel()).encode()
+    else:
+        luminance = luminance.astype(np.float32).tobytes()
 
     # Reciprocity: always for t3; for t4 only on reflection components
     use_recip = reciprocal and (tensortree == 3 or not is_trans)
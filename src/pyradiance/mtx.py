@@ -0,0 +1,1022 @@
+"""
+Radiance matrix utilities
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Sequence
+import os
+import subprocess as sp
+import sys
+import tempfile
+
+import numpy as np
+
+from .anci import (
+    BINPATH,
+    PICFMT,
+    FileType,
+    decode_colrs,
+    float_to_rgbe,
+    _read_head,
+    parse_header,
+    handle_called_process_error,
+    parse_resolution,
+    rgbe_to_float,
+)
+from .bsdf import free, klems_matrix, load_file
+from .cache import file_digest
+
+FORMATS = {
+    "a": "ascii",
+    "f": "float",
+    "d": "double",
+    "c": "32-bit_rle_rgbe",
+}
+
+
+@dataclass(slots=True)
+class MatrixHeader:
+    """Radiance matrix header.
+
+    Attributes:
+        nrows: number of rows, 0 if not given
+        ncols: number of columns
+        ncomp: number of components per element
+        fmt: data format, e.g. 'float' or '32-bit_rle_rgbe'
+        big_endian: byte order of binary data, None if not given
+        cexp: exposure per color channel the data has been scaled by
+        wavelength_splits: spectral band limits, None if not given
+        info: other header lines
+        offset: position of the data in the file
+    """
+
+    nrows: int = 0
+    ncols: int = 0
+    ncomp: int = 3
+    fmt: str = "ascii"
+    big_endian: None | bool = None
+    cexp: tuple[float, float, float] = (1.0, 1.0, 1.0)
+    wavelength_splits: None | tuple[float, ...] = None
+    info: list[str] = field(default_factory=list)
+    offset: int = 0
+
+    @property
+    def dtype(self) -> np.dtype:
+        """numpy dtype of float or double data."""
+        if self.fmt not in ("float", "double"):
+            raise ValueError(f"{self.fmt} data has no fixed binary type")
+        dtype = np.dtype(np.float32 if self.fmt == "float" else np.float64)
+        if self.big_endian is None:
+            return dtype
+        return dtype.newbyteorder(">" if self.big_endian else "<")
+
+
+def _parse_matrix_header(data: bytes) -> MatrixHeader:
+    lines, offset = parse_header(data)
+    hdr = MatrixHeader()
+    cexp = [1.0, 1.0, 1.0]
+    for line in lines[1:]:
+        if line.startswith("NROWS="):
+            hdr.nrows = int(line[6:])
+        elif line.startswith("NCOLS="):
+            hdr.ncols = int(line[6:])
+        elif line.startswith("NCOMP="):
+            hdr.ncomp = int(line[6:])
+        elif line.startswith("BigEndian="):
+            hdr.big_endian = line[10:].strip() == "1"
+        elif line.startswith("EXPOSURE="):
+            cexp = [c * float(line[9:]) for c in cexp]
+        elif line.startswith("COLORCORR="):
+            cexp = [c * float(v) for c, v in zip(cexp, line[10:].split())]
+        elif line.startswith("WAVELENGTH_SPLITS="):
+            hdr.wavelength_splits = tuple(float(v) for v in line[18:].split())
+        elif line.startswith("FORMAT="):
+            hdr.fmt = line[7:].strip()
+        else:
+            hdr.info.append(line)
+    hdr.cexp = tuple(cexp)
+    if hdr.fmt not in PICFMT and hdr.fmt not in FORMATS.values():
+        raise ValueError(f"Unknown matrix format: {hdr.fmt}")
+    if hdr.fmt in ("32-bit_rle_rgbe", "32-bit_rle_xyze") and hdr.ncomp != 3:
+        raise ValueError(f"{hdr.fmt} data must have 3 components")
+    if hdr.ncols <= 0:
+        _, hdr.nrows, hdr.ncols, offset = parse_resolution(data, offset)
+    hdr.offset = offset
+    return hdr
+
+
+def read_matrix_header(inp: str | Path | bytes) -> MatrixHeader:
+    """Read the header of a Radiance matrix.
+
+    Args:
+        inp: matrix file path or bytes
+
+    Returns:
+        MatrixHeader: parsed header
+    """
+    if isinstance(inp, (str, Path)):
+        inp = _read_head(inp)
+    return _parse_matrix_header(inp)
+
+
+def read_matrix(inp: str | Path | bytes, mmap: bool = True) -> np.ndarray:
+    """Read a Radiance matrix into an array.
+
+    Float and double data in a file are memory-mapped without copying,
+    unless the header carries an exposure that has to be undone.
+
+    Args:
+        inp: matrix file path or bytes
+        mmap: memory-map binary data in a file instead of loading it
+
+    Returns:
+        ndarray: array of shape (nrows, ncols, ncomp)
+    """
+    hdr = read_matrix_header(inp)
+    if hdr.fmt in ("float", "double"):
+        dtype = hdr.dtype
+        if isinstance(inp, (str, Path)):
+            nbytes = Path(inp).stat().st_size - hdr.offset
+        else:
+            nbytes = len(inp) - hdr.offset
+        nrows = hdr.nrows or nbytes // (hdr.ncols * hdr.ncomp * dtype.itemsize)
+        shape = (nrows, hdr.ncols, hdr.ncomp)
+        if nbytes < np.prod(shape) * dtype.itemsize:
+            raise ValueError("Premature end of matrix data")
+        if isinstance(inp, (str, Path)):
+            if mmap:
+                data = np.memmap(inp, dtype=dtype, mode="r", offset=hdr.offset, shape=shape)
+            else:
+                data = np.fromfile(inp, dtype=dtype, count=np.prod(shape), offset=hdr.offset)
+        else:
+            data = np.frombuffer(inp, dtype=dtype, count=np.prod(shape), offset=hdr.offset)
+        data = data.reshape(shape)
+    else:
+        if isinstance(inp, (str, Path)):
+            with open(inp, "rb") as rdr:
+                rdr.seek(hdr.offset)
+                body = rdr.read()
+        else:
+            body = inp[hdr.offset :]
+        if hdr.fmt == "ascii":
+            values = np.fromstring(body.decode(), dtype=np.float64, sep=" ")
+            nrows = hdr.nrows or len(values) // (hdr.ncols * hdr.ncomp)
+            shape = (nrows, hdr.ncols, hdr.ncomp)
+            if len(values) < np.prod(shape):
+                raise ValueError("Premature end of matrix data")
+            data = values[: np.prod(shape)].reshape(shape)
+        elif hdr.fmt == "Radiance_spectra":
+            npix = hdr.nrows * hdr.ncols * (hdr.ncomp + 1)
+            if len(body) < npix:
+                raise ValueError("Premature end of matrix data")
+            colrs = np.frombuffer(body, dtype=np.uint8, count=npix)
+            data = rgbe_to_float(colrs.reshape(hdr.nrows, hdr.ncols, hdr.ncomp + 1))
+        else:
+            data = rgbe_to_float(decode_colrs(body, hdr.nrows, hdr.ncols))
+    if hdr.cexp != (1.0, 1.0, 1.0):
+        cexp = np.array(hdr.cexp if hdr.ncomp == 3 else hdr.cexp[1])
+        data = (data / cexp).astype(data.dtype.newbyteorder("="))
+    return data
+
+
+def _matrix_header(
+    nrows: int, ncols: int, ncomp: int, outform: FileType, info: None | list[str]
+) -> bytes:
+    """Header as written by rmx_write_header(), ending with the resolution string if any."""
+    fmt = FORMATS[outform]
+    if outform == "c":
+        if ncomp < 3:
+            raise ValueError("RGBE output requires at least 3 components")
+        if ncomp > 3:
+            fmt = "Radiance_spectra"
+    header = "#?RADIANCE\n"
+    for line in info or []:
+        header += line.rstrip("\n") + "\n"
+    if fmt not in PICFMT:
+        header += f"NROWS={nrows}\nNCOLS={ncols}\n"
+    if fmt not in PICFMT or ncomp > 3:
+        header += f"NCOMP={ncomp}\n"
+    if outform in ("f", "d"):
+        header += f"BigEndian={int(sys.byteorder == 'big')}\n"
+    header += f"FORMAT={fmt}"
+    if outform in ("f", "d"):
+        # pad so the data is aligned for memory mapping, as fputformat()
+        align = 4 if outform == "f" else 8
+        header += " " * (-(len(header.encode()) + 2) % align)
+    header += "\n\n"
+    if fmt in PICFMT:
+        header += f"-Y {nrows:8d} +X {ncols:8d}\n"
+    return header.encode()
+
+
+def write_matrix(
+    mtx: np.ndarray,
+    out: None | str | Path = None,
+    outform: FileType = "f",
+    info: None | list[str] = None,
+) -> bytes | str:
+    """Write an array as a Radiance matrix.
+
+    Args:
+        mtx: array of shape (nrows, ncols, ncomp) or (nrows, ncols)
+        out: output file path, None to return bytes
+        outform: output format, 'a' for ascii, 'f' for float,
+            'd' for double, 'c' for RGBE (or common-exponent spectra)
+        info: extra header lines
+
+    Returns:
+        bytes of the matrix if out is None, otherwise the output path
+    """
+    mtx = np.asarray(mtx)
+    if mtx.ndim == 2:
+        mtx = mtx[:, :, np.newaxis]
+    if mtx.ndim != 3:
+        raise ValueError("Matrix must have 2 or 3 dimensions")
+    nrows, ncols, ncomp = mtx.shape
+    header = _matrix_header(nrows, ncols, ncomp, outform, info)
+    if outform == "a":
+        rowfmt = (" %.7e" * ncomp + "\t") * ncols + "\n"
+        body = "".join(rowfmt % tuple(row) for row in mtx.reshape(nrows, -1))
+        body = body.encode()
+    elif outform == "c":
+        # flat scanlines are always valid input to freadcolrs()
+        body = float_to_rgbe(mtx).tobytes()
+    else:
+        body = np.ascontiguousarray(mtx, dtype=np.float32 if outform == "f" else np.float64)
+    if out is None:
+        return header + bytes(body)
+    with open(out, "wb") as wtr:
+        wtr.write(header)
+        if isinstance(body, np.ndarray):
+            body.tofile(wtr)
+        else:
+            wtr.write(body)
+    return str(out)
+
+
+def create_matrix(
+    path: str | Path,
+    shape: tuple[int, int, int],
+    outform: FileType = "f",
+    info: None | list[str] = None,
+) -> np.memmap:
+    """Create a float or double matrix file and map its data for writing.
+
+    Args:
+        path: output file path
+        shape: (nrows, ncols, ncomp)
+        outform: 'f' for float or 'd' for double
+        info: extra header lines
+
+    Returns:
+        np.memmap: writable view of the (zero-filled) matrix data
+    """
+    if outform not in ("f", "d"):
+        raise ValueError("Only float and double matrices can be memory-mapped")
+    header = _matrix_header(*shape, outform, info)
+    with open(path, "wb") as wtr:
+        wtr.write(header)
+    dtype = np.float32 if outform == "f" else np.float64
+    return np.memmap(path, dtype=dtype, mode="r+", offset=len(header), shape=shape)
+
+
+def _as_matrix(mtx: np.ndarray | str | Path | bytes) -> np.ndarray:
+    """Get a (nrows, ncols, ncomp) array from an array, file or bytes."""
+    if not isinstance(mtx, np.ndarray):
+        mtx = read_matrix(mtx)
+    if mtx.ndim == 2:
+        mtx = mtx[:, :, np.newaxis]
+    if mtx.ndim != 3:
+        raise ValueError("Matrix must have 2 or 3 dimensions")
+    return mtx
+
+
+def chain_order(dims: list[int]) -> tuple[tuple | int, int]:
+    """Find the cheapest parenthesization of a matrix chain product.
+
+    Args:
+        dims: chain dimensions, matrix i has shape (dims[i], dims[i+1])
+
+    Returns:
+        nested tuple of matrix indices giving the multiplication order,
+        and the number of scalar multiplications it takes
+    """
+    nmtx = len(dims) - 1
+    cost = [[0] * nmtx for _ in range(nmtx)]
+    split = [[0] * nmtx for _ in range(nmtx)]
+    for length in range(1, nmtx):
+        for i in range(nmtx - length):
+            j = i + length
+            cost[i][j], split[i][j] = min(
+                (cost[i][k] + cost[k + 1][j] + dims[i] * dims[k + 1] * dims[j + 1], k)
+                for k in range(i, j)
+            )
+
+    def build(i, j):
+        if i == j:
+            return i
+        return (build(i, split[i][j]), build(split[i][j] + 1, j))
+
+    return build(0, nmtx - 1), cost[0][nmtx - 1]
+
+
+def _involves(order, index: int) -> bool:
+    if isinstance(order, int):
+        return order == index
+    return _involves(order[0], index) or _involves(order[1], index)
+
+
+def _chain_product(order, mats: list[np.ndarray], cache: dict):
+    """Multiply (ncomp, nrows, ncols) stacks in the given order."""
+    if isinstance(order, int):
+        return mats[order]
+    if order in cache:
+        return cache[order]
+    return np.matmul(
+        _chain_product(order[0], mats, cache), _chain_product(order[1], mats, cache)
+    )
+
+
+def _cache_fixed(order, mats: list[np.ndarray], index: int, cache: dict) -> None:
+    """Compute the largest products that do not involve matrix index."""
+    if isinstance(order, int):
+        return
+    if not _involves(order, index):
+        cache[order] = _chain_product(order, mats, cache)
+        return
+    _cache_fixed(order[0], mats, index, cache)
+    _cache_fixed(order[1], mats, index, cache)
+
+
+def dctimestep_array(
+    *mtx: np.ndarray | str | Path | bytes,
+    nstep: None | int = None,
+    chunk_steps: int = 256,
+    nproc: int = 1,
+    out: None | np.ndarray = None,
+) -> np.ndarray:
+    """Compute a daylight coefficient time series in-process.
+
+    Equivalent to dctimestep for 2-phase (D, S) and 3-phase (V, T, D, S)
+    calculations. Each color channel is multiplied with BLAS, the chain is
+    evaluated in the cheapest order, and sky vectors are processed in chunks
+    of time steps to bound memory.
+
+    Args:
+        mtx: matrices as arrays of shape (nrows, ncols, ncomp), file paths or bytes.
+            The last one is the sky matrix with one column per time step.
+        nstep: number of time steps to compute, all by default
+        chunk_steps: number of time steps computed at a time
+        nproc: number of chunks computed concurrently
+        out: optional array of shape (nrows, nstep, ncomp) to write into, e.g. a np.memmap
+
+    Returns:
+        ndarray: result of shape (nrows, nstep, ncomp)
+    """
+    if len(mtx) not in (2, 4):
+        raise ValueError("mtx must be a list of 2 or 4 items")
+    mats = [_as_matrix(m) for m in mtx]
+    ncomp = max(m.shape[2] for m in mats)
+    for i, (left, right) in enumerate(zip(mats[:-1], mats[1:])):
+        if left.shape[1] != right.shape[0]:
+            raise ValueError(
+                f"Matrix {i} has {left.shape[1]} columns but matrix {i + 1} "
+                f"has {right.shape[0]} rows"
+            )
+    for m in mats:
+        if m.shape[2] not in (1, ncomp):
+            raise ValueError("Matrices must have the same number of components")
+    dtype = np.result_type(np.float32, *mats).newbyteorder("=")
+    sky = mats[-1][:, :nstep]
+    nstep = sky.shape[1]
+    nrows = mats[0].shape[0]
+    if out is None:
+        out = np.empty((nrows, nstep, ncomp), dtype=dtype)
+    elif out.shape != (nrows, nstep, ncomp):
+        raise ValueError(f"Output array must have shape {(nrows, nstep, ncomp)}")
+    # channel-major stacks so that each channel is a contiguous BLAS product
+    stacks = [np.ascontiguousarray(np.moveaxis(m, 2, 0), dtype=dtype) for m in mats[:-1]]
+    dims = [m.shape[0] for m in mats] + [nstep]
+    order, _ = chain_order(dims)
+    # products without the sky matrix are shared by all chunks
+    cache: dict = {}
+    _cache_fixed(order, stacks, len(stacks), cache)
+
+    def run(start):
+        chunk = np.ascontiguousarray(
+            np.moveaxis(sky[:, start : start + chunk_steps], 2, 0), dtype=dtype
+        )
+        result = _chain_product(order, stacks + [chunk], cache)
+        out[:, start : start + chunk_steps] = np.broadcast_to(
+            np.moveaxis(result, 0, 2), out[:, start : start + chunk_steps].shape
+        )
+
+    starts = range(0, nstep, chunk_steps)
+    if nproc > 1:
+        with ThreadPoolExecutor(max_workers=nproc) as executor:
+            list(executor.map(run, starts))
+    else:
+        for start in starts:
+            run(start)
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
+
+
+MatrixSource = np.ndarray | str | Path | bytes
+
+
+class MatrixExpr:
+    """Lazy matrix expression, the deferred counterpart of Rmtxop.
+
+    Operations are recorded instead of run. On evaluation, chained products
+    are multiplied in the cheapest order for their dimensions, scalings are
+    folded into the smallest operand, and transposes are free views.
+    Evaluation is in-process unless an input is a BSDF XML file, which is
+    left to rmtxop.
+
+    Examples:
+        >>> expr = MatrixExpr("view.vmx") @ "klems.xml" @ "daylight.dmx" @ sky
+        >>> result = (expr * 179).transform([0.265, 0.670, 0.065]).evaluate()
+    """
+
+    __slots__ = ("op", "args", "refl_side")
+
+    # make numpy defer to the reflected operators, e.g. array @ expr
+    __array_ufunc__ = None
+
+    def __init__(self, source: MatrixSource, refl_side: None | str = None):
+        """
+        Args:
+            source: matrix array, file path or bytes
+            refl_side: 'f' or 'b' to take front or back reflection of a BSDF XML input
+        """
+        self.op = "leaf"
+        self.args = (source,)
+        self.refl_side = refl_side
+
+    @classmethod
+    def _node(cls, op: str, *args) -> "MatrixExpr":
+        node = cls.__new__(cls)
+        node.op = op
+        node.args = args
+        node.refl_side = None
+        return node
+
+    @staticmethod
+    def _wrap(other) -> "MatrixExpr":
+        return other if isinstance(other, MatrixExpr) else MatrixExpr(other)
+
+    def __matmul__(self, other) -> "MatrixExpr":
+        return MatrixExpr._node("dot", self, self._wrap(other))
+
+    def __rmatmul__(self, other) -> "MatrixExpr":
+        return self._wrap(other) @ self
+
+    def __add__(self, other) -> "MatrixExpr":
+        return MatrixExpr._node("+", self, self._wrap(other))
+
+    def __radd__(self, other) -> "MatrixExpr":
+        if isinstance(other, (int, float)):
+            raise TypeError("cannot add a scalar to a matrix expression")
+        return self._wrap(other) + self
+
+    def __mul__(self, other) -> "MatrixExpr":
+        if isinstance(other, (int, float, Sequence)) and not isinstance(other, (str, bytes)):
+            return self.scale(other)
+        return MatrixExpr._node("*", self, self._wrap(other))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other) -> "MatrixExpr":
+        if isinstance(other, (int, float)):
+            return self.scale(1 / other)
+        return MatrixExpr._node("/", self, self._wrap(other))
+
+    def __rtruediv__(self, other) -> "MatrixExpr":
+        if isinstance(other, (int, float)):
+            raise TypeError("cannot divide a scalar by a matrix expression")
+        return self._wrap(other) / self
+
+    def scale(self, factors: float | Sequence[float]) -> "MatrixExpr":
+        """Scale all components by one factor, or each by its own."""
+        factors = np.atleast_1d(np.asarray(factors, dtype=np.float64))
+        return MatrixExpr._node("scale", self, factors)
+
+    def transpose(self) -> "MatrixExpr":
+        """Swap rows and columns."""
+        return MatrixExpr._node("transpose", self)
+
+    @property
+    def T(self) -> "MatrixExpr":
+        return self.transpose()
+
+    def transform(self, coefs: str | Sequence[float] | np.ndarray) -> "MatrixExpr":
+        """Transform components, as rmtxop -c.
+
+        Args:
+            coefs: N x ncomp coefficients giving N output components,
+                or symbols such as 'XYZ' or 'Y' (see transform_components)
+        """
+        if not isinstance(coefs, str):
+            coefs = np.asarray(coefs, dtype=np.float64)
+        return MatrixExpr._node("transform", self, coefs)
+
+    @property
+    def shape(self) -> None | tuple[int, int, int]:
+        """Shape of the result, None if it cannot be known before evaluation."""
+        if self.op == "leaf":
+            source = self.args[0]
+            if isinstance(source, np.ndarray):
+                return _as_matrix(source).shape
+            if _is_xml(source):
+                return None
+            hdr = read_matrix_header(source)
+            return (hdr.nrows, hdr.ncols, hdr.ncomp) if hdr.nrows > 0 else None
+        shapes = [a.shape for a in self.args if isinstance(a, MatrixExpr)]
+        if any(shp is None for shp in shapes):
+            return None
+        if self.op == "dot":
+            return (shapes[0][0], shapes[1][1], max(shapes[0][2], shapes[1][2]))
+        if self.op == "transpose":
+            return (shapes[0][1], shapes[0][0], shapes[0][2])
+        if self.op == "transform":
+            coefs = self.args[1]
+            nout = len(coefs) if isinstance(coefs, str) else coefs.size // shapes[0][2]
+            return shapes[0][:2] + (nout,)
+        return shapes[0]
+
+    def leaves(self) -> list["MatrixExpr"]:
+        """Input matrices of the expression."""
+        if self.op == "leaf":
+            return [self]
+        return [leaf for a in self.args if isinstance(a, MatrixExpr) for leaf in a.leaves()]
+
+    def evaluate(self, binary: None | bool = None) -> np.ndarray:
+        """Compute the expression.
+
+        Args:
+            binary: run rmtxop instead of computing in-process. By default
+                rmtxop is only used if an input is a BSDF XML file.
+
+        Returns:
+            ndarray: result of shape (nrows, ncols, ncomp)
+        """
+        if binary is None:
+            binary = any(_is_xml(leaf.args[0]) for leaf in self.leaves())
+        if binary:
+            with tempfile.TemporaryDirectory(prefix="pyradiance_rmtxop_") as tmpdir:
+                return read_matrix(_run_rmtxop(self, tmpdir), mmap=False)
+        return _evaluate(self)
+
+    __call__ = evaluate
+
+
+def _is_xml(source) -> bool:
+    return isinstance(source, (str, Path)) and str(source).lower().endswith(".xml")
+
+
+def _flatten_dot(expr: MatrixExpr) -> tuple[list[MatrixExpr], None | np.ndarray]:
+    """Collect the operands of nested products and their overall scaling.
+
+    Transposes of products are pushed down to the operands.
+    """
+    if expr.op == "dot":
+        left, lfac = _flatten_dot(expr.args[0])
+        right, rfac = _flatten_dot(expr.args[1])
+        factors = [f for f in (lfac, rfac) if f is not None]
+        return left + right, np.prod(factors, axis=0) if factors else None
+    if expr.op == "scale":
+        operands, factor = _flatten_dot(expr.args[0])
+        return operands, expr.args[1] if factor is None else factor * expr.args[1]
+    if expr.op == "transpose" and expr.args[0].op in ("dot", "scale"):
+        operands, factor = _flatten_dot(expr.args[0])
+        if len(operands) > 1:
+            return [o.transpose() for o in reversed(operands)], factor
+    return [expr], None
+
+
+def _chain_dims(operands: list[MatrixExpr]) -> None | list[int]:
+    shapes = [o.shape for o in operands]
+    if any(shp is None for shp in shapes):
+        return None
+    return [shp[0] for shp in shapes] + [shapes[-1][1]]
+
+
+def _smallest(operands: list[MatrixExpr]) -> int:
+    sizes = [np.prod(shp) if (shp := o.shape) else np.inf for o in operands]
+    return int(np.argmin(sizes))
+
+
+def _evaluate_chain(operands: list[MatrixExpr], factor: None | np.ndarray) -> np.ndarray:
+    mats = [_evaluate(o) for o in operands]
+    if factor is not None:
+        # scaling commutes with the product, so apply it where it is cheapest
+        idx = int(np.argmin([m.size for m in mats]))
+        mats[idx] = mats[idx] * factor
+    for i, (left, right) in enumerate(zip(mats[:-1], mats[1:])):
+        if left.shape[1] != right.shape[0]:
+            raise ValueError(f"Mismatched dimensions in product operand {i + 1}")
+    dtype = np.result_type(np.float32, *mats).newbyteorder("=")
+    stacks = [np.ascontiguousarray(np.moveaxis(m, 2, 0), dtype=dtype) for m in mats]
+    order, _ = chain_order([m.shape[0] for m in mats] + [mats[-1].shape[1]])
+    return np.moveaxis(_chain_product(order, stacks, {}), 0, 2)
+
+
+def _evaluate(expr: MatrixExpr) -> np.ndarray:
+    if expr.op == "leaf":
+        return _as_matrix(expr.args[0])
+    if expr.op in ("dot", "scale"):
+        operands, factor = _flatten_dot(expr)
+        if len(operands) > 1:
+            return _evaluate_chain(operands, factor)
+        return _evaluate(expr.args[0]) * expr.args[1]
+    if expr.op == "transpose":
+        return _evaluate(expr.args[0]).transpose(1, 0, 2)
+    if expr.op == "transform":
+        return transform_components(_evaluate(expr.args[0]), expr.args[1])
+    left, right = _evaluate(expr.args[0]), _evaluate(expr.args[1])
+    if expr.op == "+":
+        return left + right
+    if expr.op == "*":
+        return left * right
+    return left / right
+
+
+def _ncomp(expr: MatrixExpr) -> int:
+    shape = expr.shape
+    # BSDF XML inputs are loaded as RGB
+    return 3 if shape is None else shape[2]
+
+
+def _collapse(expr: MatrixExpr):
+    """Reduce unary operations to rmtxop's per-input -c, -s and -t options."""
+    coefs = None
+    factor = None
+    transpose = False
+    while expr.op in ("scale", "transpose", "transform"):
+        if expr.op == "transpose":
+            transpose = not transpose
+        elif expr.op == "scale" and coefs is not None:
+            # a scaling under a transform scales its input components
+            coefs = coefs * expr.args[1]
+        elif expr.op == "scale":
+            factor = expr.args[1] if factor is None else factor * expr.args[1]
+        else:
+            inner = _transform_coefs(expr.args[1], _ncomp(expr.args[0]))
+            coefs = inner if coefs is None else coefs @ inner
+        expr = expr.args[0]
+    return expr, coefs, factor, transpose
+
+
+def _operand_args(expr: MatrixExpr, tmpdir: str, factor: None | np.ndarray = None) -> list[str]:
+    base, coefs, scale, transpose = _collapse(expr)
+    if factor is not None:
+        scale = factor if scale is None else scale * factor
+    args = []
+    if scale is not None:
+        args.extend(["-s", *map(str, np.ravel(scale))])
+    if transpose:
+        args.append("-t")
+    if coefs is not None:
+        args.extend(["-c", *map(str, np.ravel(coefs))])
+    if base.op != "leaf":
+        args.append(_run_rmtxop(base, tmpdir))
+        return args
+    source = base.args[0]
+    if base.refl_side is not None:
+        args.append(f"-r{base.refl_side[0]}")
+    if isinstance(source, np.ndarray):
+        source = write_matrix(source, os.path.join(tmpdir, f"{id(base)}.mtx"))
+    elif isinstance(source, bytes):
+        source = os.path.join(tmpdir, f"{id(base)}.mtx")
+        with open(source, "wb") as wtr:
+            wtr.write(base.args[0])
+    args.append(str(source))
+    return args
+
+
+def _product_args(order, operands, tmpdir, factor, fidx) -> list[str]:
+    """rmtxop arguments for a product, evaluating right-nested subproducts first."""
+    if isinstance(order, int):
+        return _operand_args(operands[order], tmpdir, factor if order == fidx else None)
+    left = _product_args(order[0], operands, tmpdir, factor, fidx)
+    if isinstance(order[1], int):
+        right = _operand_args(operands[order[1]], tmpdir, factor if order[1] == fidx else None)
+    else:
+        right = [_rmtxop_file(_product_args(order[1], operands, tmpdir, factor, fidx), tmpdir)]
+    return left + ["."] + right
+
+
+@handle_called_process_error
+def _rmtxop_file(args: list[str], tmpdir: str) -> str:
+    out = tempfile.mkstemp(suffix=".mtx", dir=tmpdir)
+    with os.fdopen(out[0], "wb") as wtr:
+        sp.run([str(BINPATH / "rmtxop"), "-ff", *args], check=True, stdout=wtr, stderr=sp.PIPE)
+    return out[1]
+
+
+def _run_rmtxop(expr: MatrixExpr, tmpdir: str) -> str:
+    """Evaluate an expression with rmtxop, returning the result file."""
+    if expr.op == "dot" or (expr.op in ("scale", "transpose") and len(_flatten_dot(expr)[0]) > 1):
+        operands, factor = _flatten_dot(expr)
+        dims = _chain_dims(operands)
+        if dims is None:
+            # rmtxop multiplies left to right
+            order = 0
+            for i in range(1, len(operands)):
+                order = (order, i)
+        else:
+            order, _ = chain_order(dims)
+        args = _product_args(order, operands, tmpdir, factor, _smallest(operands))
+    elif expr.op in ("+", "*", "/"):
+        args = _operand_args(expr.args[0], tmpdir) + [expr.op] + _operand_args(expr.args[1], tmpdir)
+    else:
+        args = _operand_args(expr, tmpdir)
+    return _rmtxop_file(args, tmpdir)
+
+
+def _tile_sizes(
+    nrows: int, ncols: int, inner: int, ncomp: int, itemsize: int, budget: int
+) -> tuple[int, int]:
+    """Largest row and column block sizes whose working set fits in budget."""
+    rows, cols = nrows, ncols
+
+    def need(r, c):
+        # input slices and their channel-major copies, plus the tile result
+        return itemsize * ncomp * (2 * (r * inner + inner * c) + 2 * r * c)
+
+    while need(rows, cols) > budget and (rows > 1 or cols > 1):
+        if rows >= cols:
+            rows = (rows + 1) // 2
+        else:
+            cols = (cols + 1) // 2
+    return rows, cols
+
+
+def tiled_matmul(
+    left: MatrixSource,
+    right: MatrixSource,
+    out: None | str | Path | np.ndarray = None,
+    memory: int = 1 << 30,
+    nproc: int = 1,
+) -> np.ndarray:
+    """Multiply two matrices out of core, one tile of the result at a time.
+
+    Row blocks of the left matrix and column blocks of the right matrix are
+    read from their arrays or memory-mapped files as needed, so only the
+    tiles in flight are held in memory.
+
+    Args:
+        left: matrix of shape (nrows, n, ncomp) as an array, file path or bytes
+        right: matrix of shape (n, ncols, ncomp), e.g. an annual sky matrix
+        out: result array or np.memmap, or a file path to create a float
+            matrix at; an in-memory array is allocated if None.
+        memory: approximate memory budget in bytes for all tiles in flight
+        nproc: number of tiles computed concurrently
+
+    Returns:
+        ndarray: result of shape (nrows, ncols, ncomp), a np.memmap if out is a path
+    """
+    left, right = _as_matrix(left), _as_matrix(right)
+    if left.shape[1] != right.shape[0]:
+        raise ValueError(
+            f"Left matrix has {left.shape[1]} columns but right matrix has {right.shape[0]} rows"
+        )
+    if left.shape[2] != right.shape[2] and 1 not in (left.shape[2], right.shape[2]):
+        raise ValueError("Matrices must have the same number of components")
+    dtype = np.result_type(np.float32, left, right).newbyteorder("=")
+    shape = (left.shape[0], right.shape[1], max(left.shape[2], right.shape[2]))
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif isinstance(out, (str, Path)):
+        out = create_matrix(out, shape, outform="f" if dtype == np.float32 else "d")
+    elif out.shape != shape:
+        raise ValueError(f"Output array must have shape {shape}")
+    rows, cols = _tile_sizes(
+        shape[0], shape[1], left.shape[1], shape[2], dtype.itemsize, memory // max(nproc, 1)
+    )
+
+    def run(tile):
+        r0, c0 = tile
+        lblk = np.ascontiguousarray(np.moveaxis(left[r0 : r0 + rows], 2, 0), dtype=dtype)
+        rblk = np.ascontiguousarray(np.moveaxis(right[:, c0 : c0 + cols], 2, 0), dtype=dtype)
+        out[r0 : r0 + rows, c0 : c0 + cols] = np.moveaxis(np.matmul(lblk, rblk), 0, 2)
+
+    # consecutive tiles share a column block of the right matrix
+    tiles = [(r0, c0) for c0 in range(0, shape[1], cols) for r0 in range(0, shape[0], rows)]
+    if nproc > 1:
+        with ThreadPoolExecutor(max_workers=nproc) as executor:
+            list(executor.map(run, tiles))
+    else:
+        for tile in tiles:
+            run(tile)
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
+
+
+# Radiance standard RGB primaries and white point as CIE (x, y)
+STDPRIMS = ((0.640, 0.330), (0.290, 0.600), (0.150, 0.060), (1 / 3, 1 / 3))
+
+# Luminous efficacy of Radiance white (lm/W)
+WHTEFFICACY = 179.0
+
+
+def rgb2xyz_matrix(prims: Sequence[Sequence[float]] = STDPRIMS) -> np.ndarray:
+    """RGB to CIE XYZ conversion matrix for a set of primaries, as comprgb2xyzmat().
+
+    Args:
+        prims: (x, y) chromaticities of red, green, blue and white
+
+    Returns:
+        ndarray: 3 x 3 matrix taking RGB column vectors to XYZ
+    """
+    xy = np.asarray(prims, dtype=np.float64)
+    xyz = np.column_stack([xy[:, 0], xy[:, 1], 1 - xy[:, 0] - xy[:, 1]]) / xy[:, 1:2]
+    # scale the primaries so that equal RGB gives the white point at Y = 1
+    weights = np.linalg.solve(xyz[:3].T, xyz[3])
+    return xyz[:3].T * weights
+
+
+def _transform_coefs(transform: str | Sequence[float] | np.ndarray, ncomp: int, xyze: bool = False) -> np.ndarray:
+    """Component transform matrix for rcomb/rmtxop -c coefficients or symbols."""
+    if not isinstance(transform, str):
+        return np.asarray(transform, dtype=np.float64).reshape(-1, ncomp)
+    if ncomp != 3:
+        raise ValueError(f"-c '{transform}' needs 3 components in-process, not {ncomp}")
+    rgb2xyz = rgb2xyz_matrix()
+    rows = []
+    for sym in transform:
+        if sym in "aA":
+            rows.append(np.full(ncomp, 1 / ncomp))
+        elif sym in "rgbRGB":
+            comp = "rgb".index(sym.lower())
+            if xyze:
+                scale = 1 / WHTEFFICACY if sym.isupper() else 1
+                rows.append(np.linalg.inv(rgb2xyz)[comp] * scale)
+            else:
+                rows.append(np.eye(3)[comp])
+        elif sym in "xyzXYZ":
+            comp = "xyz".index(sym.lower())
+            if xyze:
+                rows.append(np.eye(3)[comp])
+            else:
+                rows.append(rgb2xyz[comp] * (WHTEFFICACY if sym.isupper() else 1))
+        else:
+            raise ValueError(f"-c '{sym}' unsupported in-process")
+    return np.array(rows)
+
+
+def transform_components(
+    mtx: MatrixSource,
+    transform: str | Sequence[float] | np.ndarray,
+    scale: None | float | Sequence[float] = None,
+    xyze: bool = False,
+) -> np.ndarray:
+    """Transform matrix components in-process, as rcomb/rmtxop -c and -s.
+
+    Args:
+        mtx: matrix of shape (nrows, ncols, ncomp) as an array, file path or bytes
+        transform: N x ncomp coefficients, or symbols such as 'XYZ', 'Y' or 'rgb'.
+            Upper case X, Y and Z include the luminous efficacy of white (179).
+        scale: factor, or one factor per output component
+        xyze: input components are CIE XYZ rather than RGB
+
+    Returns:
+        ndarray: array of shape (nrows, ncols, N)
+    """
+    mtx = _as_matrix(mtx)
+    coefs = _transform_coefs(transform, mtx.shape[2], xyze)
+    if scale is not None:
+        coefs = coefs * np.reshape(scale, (-1, 1))
+    if np.array_equal(coefs, np.eye(mtx.shape[2])[: len(coefs)]):
+        # plain component selection
+        return mtx[..., : len(coefs)]
+    dtype = np.result_type(np.float32, mtx).newbyteorder("=")
+    return np.matmul(mtx, coefs.T.astype(dtype))
+
+
+def rcomb_array(
+    *mtx: MatrixSource,
+    transform: None | str | Sequence[float] = None,
+    scale: None | float | Sequence[float] = None,
+) -> np.ndarray:
+    """Sum matrices and transform the result in-process, as rcomb.
+
+    Args:
+        mtx: matrices of the same shape as arrays, file paths or bytes
+        transform: output component transform, see transform_components
+        scale: output scaling factor(s)
+
+    Returns:
+        ndarray: combined array
+    """
+    mats = [_as_matrix(m) for m in mtx]
+    result = mats[0] if len(mats) == 1 else np.sum(np.broadcast_arrays(*mats), axis=0)
+    if transform is not None:
+        return transform_components(result, transform, scale)
+    if scale is not None:
+        return result * np.asarray(scale, dtype=np.float64)
+    return result
+
+
+def rcollate_array(
+    mtx: MatrixSource,
+    transpose: bool = False,
+    orows: None | int = None,
+    ocols: None | int = None,
+) -> np.ndarray:
+    """Transpose or reshape a matrix in-process, as rcollate.
+
+    Transposes and reshapes of contiguous data are returned as views.
+
+    Args:
+        mtx: matrix of shape (nrows, ncols, ncomp) as an array, file path or bytes
+        transpose: swap rows and columns
+        orows: number of output rows
+        ocols: number of output columns
+
+    Returns:
+        ndarray: collated array of shape (orows, ocols, ncomp)
+    """
+    mtx = _as_matrix(mtx)
+    if transpose:
+        mtx = mtx.transpose(1, 0, 2)
+    if orows is None and ocols is None:
+        return mtx
+    nrec = mtx.shape[0] * mtx.shape[1]
+    if orows is None:
+        orows = nrec // ocols
+    if ocols is None:
+        ocols = nrec // orows
+    if orows * ocols != nrec:
+        raise ValueError(f"Cannot collate {nrec} records into {orows} x {ocols}")
+    return mtx.reshape(orows, ocols, mtx.shape[2])
+
+
+@dataclass(slots=True)
+class KlemsBSDF:
+    """Klems matrices of a BSDF, as rmtxop and dctimestep load them.
+
+    Each matrix has shape (nout, ninc, 3): RGB BSDF values, including the
+    Lambertian part, times the projected solid angle of the incident patch.
+    Transmission missing from one side is derived by reciprocity, and
+    components without matrix data are Lambertian on the full Klems basis.
+    The transmission matrix dctimestep uses is tb.
+
+    Attributes:
+        tf: front transmission
+        tb: back transmission
+        rf: front reflection
+        rb: back reflection
+        bases: (incident, outgoing) basis names per component
+        lambdas: projected solid angles of the incident patches per component
+    """
+
+    tf: np.ndarray
+    tb: np.ndarray
+    rf: np.ndarray
+    rb: np.ndarray
+    bases: dict[str, tuple[str, str]]
+    lambdas: dict[str, np.ndarray]
+
+    def bsdf(self, comp: str) -> np.ndarray:
+        """BSDF values (1/sr) of a component, without the projected solid angles."""
+        return getattr(self, comp) / self.lambdas[comp][None, :, None]
+
+
+# parsed files keyed by content digest
+_KLEMS: dict[str, KlemsBSDF] = {}
+
+
+def load_klems(path: str | Path) -> KlemsBSDF:
+    """Load the Klems matrices of a BSDF XML file.
+
+    Results are cached by file content, so reloading an unchanged file
+    does not parse it again. The returned arrays are read-only.
+
+    Args:
+        path: Klems BSDF XML file
+    Returns:
+        KlemsBSDF
+    """
+    digest = file_digest(path)
+    if digest in _KLEMS:
+        return _KLEMS[digest]
+    sd = load_file(str(path))
+    if sd is None:
+        raise ValueError(f"cannot load BSDF {path}")
+    mats, bases, lambdas = {}, {}, {}
+    try:
+        for comp in ("tf", "tb", "rf", "rb"):
+            mats[comp], lambdas[comp], inb, outb = klems_matrix(sd, comp)
+            mats[comp].flags.writeable = False
+            lambdas[comp].flags.writeable = False
+            bases[comp] = (inb, outb)
+    finally:
+        free(sd)
+    result = _KLEMS[digest] = KlemsBSDF(**mats, bases=bases, lambdas=lambdas)
+    return result
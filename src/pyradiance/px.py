@@ -2,11 +2,26 @@
 Radiance picture processing utilities.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import subprocess as sp
 from pathlib import Path
 from typing import NamedTuple, Sequence
 
-from .anci import BINPATH, handle_called_process_error
+import numpy as np
+
+from .anci import (
+    BINPATH,
+    PICFMT,
+    decode_colrs,
+    encode_colrs,
+    float_to_rgbe,
+    handle_called_process_error,
+    parse_header,
+    parse_resolution,
+    read_header,
+    rgbe_to_float,
+)
+from .mtx import read_matrix_header, rgb2xyz_matrix
 
 
 class xyRGB(NamedTuple):
@@ -545,6 +560,307 @@ def pvaluer(
     return sp.run(cmd, check=True, stdout=sp.PIPE, input=stdin).stdout
 
 
+def _standard_orientation(data: np.ndarray, orient: str) -> np.ndarray:
+    """Reorder (scanline, pixel, ...) data into rows from top to bottom and
+    columns from left to right, given a resolution string orientation."""
+    # flip each axis running against the standard -Y +X order
+    for axis, sign, name in ((0, orient[0], orient[1]), (1, orient[2], orient[3])):
+        if (sign == "+") == (name == "Y"):
+            data = np.flip(data, axis)
+    if orient[1] == "X":
+        data = data.swapaxes(0, 1)
+    return data
+
+
+def read_hdr(pic: str | Path | bytes, original: bool = False) -> np.ndarray:
+    """Read a Radiance picture into an array, without running pvalue.
+
+    Flat, old- and new-style run-length encoded RGBE and XYZE pictures are
+    decoded, as well as common-exponent spectral pictures with NCOMP > 3.
+
+    Args:
+        pic: picture file path or bytes
+        original: undo the exposure recorded in the header, as pvalue -o
+
+    Returns:
+        ndarray: float32 array of shape (height, width, ncomp), with the top
+        row first and the left column first
+    """
+    if isinstance(pic, (str, Path)):
+        pic = Path(pic).read_bytes()
+    hdr = read_matrix_header(pic)
+    # pictures without a FORMAT line are RGBE, as Radiance reads them
+    fmt = read_header(pic).fmt or "32-bit_rle_rgbe"
+    if fmt not in PICFMT:
+        raise ValueError(f"Not a Radiance picture: {fmt}")
+    _, offset = parse_header(pic)
+    orient, nscan, width, offset = parse_resolution(pic, offset)
+    body = np.frombuffer(pic, dtype=np.uint8, offset=offset)
+    if hdr.ncomp > 3:
+        npix = nscan * width * (hdr.ncomp + 1)
+        if len(body) < npix:
+            raise ValueError("Premature end of pixel data")
+        colrs = body[:npix].reshape(nscan, width, hdr.ncomp + 1)
+    else:
+        colrs = decode_colrs(body, nscan, width)
+    data = rgbe_to_float(colrs)
+    if original and hdr.cexp != (1.0, 1.0, 1.0):
+        data /= np.array(hdr.cexp if hdr.ncomp == 3 else hdr.cexp[1], dtype=np.float32)
+    return np.ascontiguousarray(_standard_orientation(data, orient))
+
+
+def write_hdr(
+    data: np.ndarray,
+    out: None | str | Path = None,
+    view: None | str | Sequence[str] = None,
+    exposure: None | float = None,
+    primaries: None | Sequence[float] = None,
+    xyze: bool = False,
+    info: None | Sequence[str] = None,
+    nthreads: int = 1,
+) -> bytes | str:
+    """Write an array as a run-length encoded Radiance picture, without pvaluer.
+
+    Args:
+        data: array of shape (height, width, 3) with the top row first and
+            the left column first, as read_hdr() returns
+        out: output file path, None to return bytes
+        view: view options recorded as VIEW=, e.g. get_view_args(view)
+        exposure: factor the values have already been scaled by, recorded as
+            EXPOSURE=
+        primaries: RGB and white point chromaticities (8 values), recorded as
+            PRIMARIES=
+        xyze: the values are CIE XYZ instead of RGB
+        info: other header lines
+        nthreads: number of threads converting and encoding bands of scanlines
+
+    Returns:
+        bytes of the picture if out is None, otherwise the output path
+    """
+    data = np.asarray(data)
+    if data.ndim != 3 or data.shape[2] != 3:
+        raise ValueError("Picture data must have shape (height, width, 3)")
+    header = ["#?RADIANCE", *(info or [])]
+    if view is not None:
+        header.append(f"VIEW= {view if isinstance(view, str) else ' '.join(view)}")
+    if exposure is not None:
+        header.append(f"EXPOSURE={exposure:.4e}")
+    if primaries is not None:
+        if len(primaries) != 8:
+            raise ValueError("primaries must have 8 values")
+        header.append("PRIMARIES= " + " ".join(f"{p:.4f}" for p in primaries))
+    header.append(f"FORMAT=32-bit_rle_{'xyze' if xyze else 'rgbe'}")
+    height, width, _ = data.shape
+    header = "\n".join(header) + f"\n\n-Y {height:8d} +X {width:8d}\n"
+    bands = np.array_split(data, max(min(nthreads, height), 1))
+    with ThreadPoolExecutor(max_workers=max(nthreads, 1)) as executor:
+        body = b"".join(executor.map(lambda band: encode_colrs(float_to_rgbe(band)), bands))
+    if out is None:
+        return header.encode() + body
+    with open(out, "wb") as wtr:
+        wtr.write(header.encode())
+        wtr.write(body)
+    return str(out)
+
+
+def _exposure_value(exposure: float | str) -> float:
+    """Exposure multiplier from a number or, as pfilt -e, "+N"/"-N" f-stops."""
+    if isinstance(exposure, str) and exposure[:1] in "+-":
+        value = 2.0 ** float(exposure)
+    else:
+        value = float(exposure)
+    if not 1e-20 <= value <= 1e20:
+        raise ValueError("exposure out of range")
+    return value
+
+
+def _filter_axis(nin: int, nout: int, radius: float) -> tuple[np.ndarray, np.ndarray]:
+    """Input indices and offsets of pfilt's filter window for each output pixel along an axis.
+
+    Returns:
+        indices (nout x taps) clipped to the input, and for a box filter the
+        weights (0 or 1), for a Gaussian the offsets in filter radii, inf
+        outside the input
+    """
+    ratio = nout / nin
+    out = np.arange(nout)
+    cent = ((out + 0.5) * nin / nout).astype(np.intp)
+    if radius > 0:
+        half = int(2.0 * radius / ratio + 1)
+        idx = cent[:, None] + np.arange(-half, half + 1)
+        delta = (ratio * (idx + 0.5) - (out[:, None] + 0.5)) / radius
+        delta[(idx < 0) | (idx >= nin)] = np.inf
+    else:
+        half = nin // nout // 2 + 1
+        idx = cent[:, None] + np.arange(1 - half, half + 1)
+        # downsampling averages the input pixels within the output pixel,
+        # upsampling picks the nearest one
+        if ratio < 1:
+            dist = ratio * idx - (out[:, None] + 0.5)
+            delta = ((dist >= -0.5) & (dist < 0.5)).astype(np.float64)
+        else:
+            delta = (idx == cent[:, None]).astype(np.float64)
+        delta[(idx < 0) | (idx >= nin)] = 0
+    return np.clip(idx, 0, nin - 1), delta
+
+
+def pfilt_array(
+    data: np.ndarray,
+    xres: None | int | str = None,
+    yres: None | int | str = None,
+    exposure: float | str = 1,
+    one_pass: bool = False,
+    gaussian_filter_radius: float = 0,
+    hot_threshold: float = 100,
+    average_hot: bool = False,
+    xyze: bool = False,
+    nthreads: int = 1,
+) -> tuple[np.ndarray, float]:
+    """Resample and expose a picture array in-process, as pfilt without stars.
+
+    Args:
+        data: array of shape (height, width, ncomp) with the top row first, as read_hdr() returns
+        xres: output width, or "/N" for the input width divided by N
+        yres: output height, or "/N" for the input height divided by N
+        exposure: exposure multiplier, or "+N"/"-N" f-stops; unless one_pass,
+            relative to the exposure that brings the average brightness to 0.5
+        one_pass: skip the average exposure, applying exposure alone
+        gaussian_filter_radius: Gaussian filter radius in output pixels, 0 for a box filter
+        hot_threshold: brightness above which pixels are left out of the average
+        average_hot: include bright pixels in the average
+        xyze: the values are CIE XYZ, so brightness is Y rather than RGB luminance
+        nthreads: number of threads filtering bands of output rows
+
+    Returns:
+        filtered array of shape (yres, xres, ncomp), and the exposure applied,
+        to record as EXPOSURE= (e.g. write_hdr(..., exposure=...))
+    """
+    data = np.asarray(data, dtype=np.float32)
+    if data.ndim != 3:
+        raise ValueError("Picture data must have shape (height, width, ncomp)")
+    height, width, ncomp = data.shape
+
+    def outres(res, nin):
+        if res is None:
+            return nin
+        if isinstance(res, str) and res.startswith("/"):
+            return int(nin / float(res[1:]) + 0.5)
+        return int(res)
+
+    ncols, nrows = outres(xres, width), outres(yres, height)
+    if ncols < 1 or nrows < 1:
+        raise ValueError("output resolution must be positive")
+    factor = _exposure_value(exposure)
+    if not one_pass:
+        if xyze:
+            bright = data[..., 1]
+        elif ncomp == 3:
+            bright = data @ rgb2xyz_matrix()[1].astype(np.float32)
+        else:
+            raise ValueError("average exposure needs 3 components, use one_pass")
+        use = (bright > 0) if average_hot else (bright > 0) & (bright < hot_threshold)
+        if not use.any():
+            raise ValueError("picture too dark or too bright")
+        factor *= 0.5 / float(bright[use].mean(dtype=np.float64))
+    radius = gaussian_filter_radius
+    if radius > 0 and nrows >= height and ncols >= width:
+        radius *= (nrows / height + ncols / width) / 2
+    xidx, xdelta = _filter_axis(width, ncols, radius)
+    yidx, ydelta = _filter_axis(height, nrows, radius)
+    if radius > 0:
+        # pfilt's table of exp(-r^2) in steps of 0.05, flat within the output pixel
+        plateau = (ncols / width) * (nrows / height) * 0.25 / (radius * radius)
+        table = np.exp(-np.maximum(np.arange(1777) * 0.05, plateau)).astype(np.float32)
+        # beyond the table and outside the input
+        table[-1] = 0
+
+    def rows(band: slice) -> np.ndarray:
+        block = data[yidx[band]]  # rows x ytaps x width x ncomp
+        if radius <= 0:
+            # the box filter is separable
+            block = (block * ydelta[band, :, None, None].astype(np.float32)).sum(axis=1)
+            block = (block[:, xidx] * xdelta[None, :, :, None].astype(np.float32)).sum(axis=2)
+            count = ydelta[band].sum(axis=1)[:, None] * xdelta.sum(axis=1)[None, :]
+            return block / np.maximum(count, 1)[..., None].astype(np.float32)
+        total = np.zeros((block.shape[0], ncols, ncomp), dtype=np.float32)
+        wsum = np.full((block.shape[0], ncols), 1e-6, dtype=np.float32)
+        for j in range(yidx.shape[1]):
+            dy2 = ydelta[band, j, None] ** 2
+            for k in range(xidx.shape[1]):
+                weight = table[np.minimum(20 * (dy2 + xdelta[:, k] ** 2) + 0.5, len(table) - 1).astype(np.intp)]
+                total += block[:, j, xidx[:, k]] * weight[..., None]
+                wsum += weight
+        return total / wsum[..., None]
+
+    # bands of output rows, small enough to bound the gathered input windows
+    row_bytes = yidx.shape[1] * width * ncomp * 4
+    band = max(1, min(-(-nrows // max(nthreads, 1)), (16 << 20) // row_bytes))
+    bands = [slice(r, min(r + band, nrows)) for r in range(0, nrows, band)]
+    with ThreadPoolExecutor(max_workers=max(nthreads, 1)) as executor:
+        result = np.concatenate(list(executor.map(rows, bands)))
+    result *= np.float32(factor)
+    return result, factor
+
+
+def filter_hdr(
+    pic: str | Path | bytes,
+    out: None | str | Path = None,
+    xres: None | int | str = None,
+    yres: None | int | str = None,
+    exposure: float | str = 1,
+    one_pass: bool = False,
+    gaussian_filter_radius: float = 0,
+    hot_threshold: float = 100,
+    average_hot: bool = False,
+    nthreads: int = 1,
+) -> bytes | str:
+    """Filter a Radiance picture in-process with pfilt_array(), without running pfilt.
+
+    The input header is kept, and the exposure applied and any change of
+    pixel aspect ratio are added as EXPOSURE= and PIXASPECT=, as pfilt does.
+    Spectral pictures are not written; filter their data with pfilt_array().
+
+    Args:
+        pic: picture file path or bytes
+        out: output picture path, None to return bytes
+        xres, yres, exposure, one_pass, gaussian_filter_radius, hot_threshold,
+            average_hot, nthreads: as for pfilt_array(); hot_threshold is in
+            the units of the original picture, before its exposure
+
+    Returns:
+        bytes of the filtered picture if out is None, otherwise the output path
+    """
+    info = read_header(pic)
+    if info.ncomp > 3:
+        raise ValueError("filter_hdr writes RGBE and XYZE pictures only, use pfilt_array() for spectral data")
+    xyze = (info.fmt or "").lower() == "32-bit_rle_xyze"
+    data = read_hdr(pic)
+    img, factor = pfilt_array(
+        data,
+        xres=xres,
+        yres=yres,
+        exposure=exposure,
+        one_pass=one_pass,
+        gaussian_filter_radius=gaussian_filter_radius,
+        hot_threshold=hot_threshold * info.exposure,
+        average_hot=average_hot,
+        xyze=xyze,
+        nthreads=nthreads,
+    )
+    lines = [ln for ln in info.lines[1:] if not ln.startswith("FORMAT=")]
+    aspect = (img.shape[1] / data.shape[1]) / (img.shape[0] / data.shape[0])
+    if not 0.995 <= aspect <= 1.005:
+        lines.append(f"PIXASPECT={aspect:f}")
+    return write_hdr(
+        img,
+        out,
+        exposure=None if 0.98 <= factor <= 1.02 else factor,
+        xyze=xyze,
+        info=lines,
+        nthreads=nthreads,
+    )
+
+
 @handle_called_process_error
 def pextrem(
     pic: str | Path | bytes,
@@ -8,7 +8,17 @@ import subprocess as sp
 from pathlib import Path
 from typing import Sequence
 
-from .anci import BINPATH, handle_called_process_error
+import numpy as np
+
+from .anci import (
+    BINPATH,
+    CHUNK_SIZE,
+    StreamInput,
+    StreamOutput,
+    handle_called_process_error,
+    stream_run,
+)
+from .cache import MatrixCache
 
 
 @handle_called_process_error
@@ -165,7 +175,7 @@ def mkpmap(
 class Rcontrib:
     def __init__(
         self,
-        inp: bytes,
+        inp: StreamInput,
         octree: Path | str,
         nproc: int = 1,
         yres: None | int = None,
@@ -173,10 +183,32 @@ class Rcontrib:
         outform: None | str = None,
         report: int = 0,
         params: None | Sequence[str] = None,
+        chunk_size: int = CHUNK_SIZE,
+        cache: None | MatrixCache = None,
     ):
+        """Compute contribution coefficients with rcontrib.
+
+        Args:
+            inp: input rays, as bytes, a file path, an array (e.g. np.memmap)
+                or an iterator of bytes/array chunks. Anything but bytes is
+                streamed to rcontrib so it never has to fit in memory.
+                Binary rays need to match inform, e.g. float32 for 'f'.
+            octree: octree file path
+            nproc: number of processes
+            yres: number of output rows
+            inform: input format
+            outform: output format
+            report: progress report interval in seconds
+            params: additional parameters
+            chunk_size: size in bytes of each streamed read and write
+            cache: cache to reuse results from, keyed on the octree content,
+                options and rays. Not used with modifier output files.
+        """
         self.cmd = [str(BINPATH / "rcontrib")]
         self.octree = octree
         self.inp = inp
+        self.chunk_size = chunk_size
+        self.cache = cache
         self.cmd.extend(["-n", str(nproc)])
         if params is not None:
             self.cmd.extend(params)
@@ -227,11 +259,30 @@ class Rcontrib:
         return self
 
     @handle_called_process_error
-    def __call__(self):
+    def __call__(self, out: StreamOutput = None) -> bytes | str | np.ndarray:
+        """Run rcontrib.
+
+        Args:
+            out: where to put the output. None to return bytes; a file path
+                or binary file object to write to as it arrives; or a
+                preallocated array (e.g. np.memmap) to read binary output
+                into, with header and resolution string skipped.
+
+        Returns:
+            Output bytes if out is None, otherwise out.
+        """
         cmd = self.cmd + [str(self.octree)]
-        return sp.run(
-            cmd, check=True, input=self.inp, stderr=sp.PIPE, stdout=sp.PIPE
-        ).stdout
+        key = None
+        if self.cache is not None and "-o" not in self.cmd:
+            # the number of processes does not change the result
+            nproc = self.cmd.index("-n")
+            key = self.cache.command_key(cmd[:nproc] + cmd[nproc + 2 :], self.inp, out)
+        if key is not None and (result := self.cache.fetch(key, out)) is not None:
+            return result
+        result = stream_run(cmd, self.inp, out=out, chunk_size=self.chunk_size)
+        if key is not None:
+            self.cache.store(key, result, out)
+        return result
 
 
 @handle_called_process_error
@@ -0,0 +1,975 @@
+"""
+Solar positions, sky matrices and batches of point-in-time skies
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+from .cache import MatrixCache
+
+SOLAR_CONSTANT_E = 1367.0  # W/m2
+SOLAR_CONSTANT_L = 127.5  # klux
+WHTEFFICACY = 179.0
+SUN_ANG_DEG = 0.533
+NSUNPATCH = 4
+FTINY = 1e-6
+# luminance of RGB with the standard primaries
+CIE_RGB = np.array([0.265074126, 0.670114631, 0.064811243])
+
+# Perez, Seals and Michalsky 1993, Table 1; one row per clearness category
+PEREZ_COEFF = np.array(
+    [
+        [1.3525, -0.2576, -0.2690, -1.4366, -0.7670, 0.0007, 1.2734, -0.1233, 2.8000, 0.6004,
+         1.2375, 1.0000, 1.8734, 0.6297, 0.9738, 0.2809, 0.0356, -0.1246, -0.5718, 0.9938],
+        [-1.2219, -0.7730, 1.4148, 1.1016, -0.2054, 0.0367, -3.9128, 0.9156, 6.9750, 0.1774,
+         6.4477, -0.1239, -1.5798, -0.5081, -1.7812, 0.1080, 0.2624, 0.0672, -0.2190, -0.4285],
+        [-1.1000, -0.2515, 0.8952, 0.0156, 0.2782, -0.1812, -4.5000, 1.1766, 24.7219, -13.0812,
+         -37.7000, 34.8438, -5.0000, 1.5218, 3.9229, -2.6204, -0.0156, 0.1597, 0.4199, -0.5562],
+        [-0.5484, -0.6654, -0.2672, 0.7117, 0.7234, -0.6219, -5.6812, 2.6297, 33.3389, -18.3000,
+         -62.2500, 52.0781, -3.5000, 0.0016, 1.1477, 0.1062, 0.4659, -0.3296, -0.0876, -0.0329],
+        [-0.6000, -0.3566, -2.5000, 2.3250, 0.2937, 0.0496, -5.6812, 1.8415, 21.0000, -4.7656,
+         -21.5906, 7.2492, -3.5000, -0.1554, 1.4062, 0.3988, 0.0032, 0.0766, -0.0656, -0.1294],
+        [-1.0156, -0.3670, 1.0078, 1.4051, 0.2875, -0.5328, -3.8500, 3.3750, 14.0000, -0.9999,
+         -7.1406, 7.5469, -3.4000, -0.1078, -1.0750, 1.5702, -0.0672, 0.4016, 0.3017, -0.4844],
+        [-1.0000, 0.0211, 0.5025, -0.5119, -0.3000, 0.1922, 0.7023, -1.6317, 19.0000, -5.0000,
+         1.2438, -1.9094, -4.0000, 0.0250, 0.3844, 0.2656, 1.0468, -0.3788, -2.4517, 1.4656],
+        [-1.0500, 0.0289, 0.4260, 0.3590, -0.3250, 0.1156, 0.7781, 0.0025, 31.0625, -14.5000,
+         -46.1148, 55.3750, -7.2312, 0.4050, 13.3500, 0.6234, 1.5000, -0.6426, 1.8564, 0.5636],
+    ]
+).reshape(8, 5, 4)
+
+# upper bounds of the sky clearness categories
+CLEARNESS_BOUNDS = np.array([1.065, 1.230, 1.500, 1.950, 2.800, 4.500, 6.200])
+
+# Perez et al. 1990, Table 4: luminous efficacy coefficients a, b, c, d
+DIFFUSE_EFFICACY = np.array(
+    [
+        [97.24, -0.46, 12.00, -8.91],
+        [107.22, 1.15, 0.59, -3.95],
+        [104.97, 2.96, -5.53, -8.77],
+        [102.39, 5.59, -13.95, -13.90],
+        [100.71, 5.94, -22.75, -23.74],
+        [106.42, 3.83, -36.15, -28.83],
+        [141.88, 1.90, -53.24, -14.03],
+        [152.23, 0.35, -45.27, -7.98],
+    ]
+)
+DIRECT_EFFICACY = np.array(
+    [
+        [57.20, -4.55, -2.98, 117.12],
+        [98.99, -3.46, -1.21, 12.38],
+        [109.83, -4.90, -1.71, -8.81],
+        [110.34, -5.84, -1.99, -4.56],
+        [106.36, -3.97, -1.75, -6.16],
+        [107.19, -1.25, -1.51, -26.73],
+        [105.75, 0.77, -1.26, -34.44],
+        [101.18, 1.58, -1.10, -8.29],
+    ]
+)
+
+_MONTH_DAYS = np.array([0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334])
+
+
+def reinhart_patches(mfactor: int = 1) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Reinhart sky patch geometry as used by gendaymtx.
+
+    Patch 0 is the ground, followed by the sky patches row by row from the
+    horizon, azimuths measured from north towards east, ending at the zenith.
+
+    Args:
+        mfactor: Reinhart subdivisions, 1 for the Tregenza sky
+    Returns:
+        altitudes (radians), azimuths (radians) and solid angles (sr)
+    """
+    tnaz = (30, 30, 24, 24, 18, 12, 6)
+    alpha = (np.pi / 2) / (len(tnaz) * mfactor + 0.5)
+    alts, azis, doms = [-np.pi / 2], [0.0], [2 * np.pi]
+    for i in range(len(tnaz) * mfactor):
+        ninrow = tnaz[i // mfactor] * mfactor
+        alts.extend([alpha * (i + 0.5)] * ninrow)
+        azis.extend(2 * np.pi * np.arange(ninrow) / ninrow)
+        doms.extend([2 * np.pi * (np.sin(alpha * (i + 1)) - np.sin(alpha * i)) / ninrow] * ninrow)
+    alts.append(np.pi / 2)
+    azis.append(0.0)
+    doms.append(2 * np.pi * (1 - np.cos(alpha * 0.5)))
+    # single precision like gendaymtx
+    return (
+        np.array(alts, dtype=np.float32),
+        np.array(azis, dtype=np.float32),
+        np.array(doms, dtype=np.float32),
+    )
+
+
+class SolarPosition(NamedTuple):
+    """Sun position in Radiance conventions.
+
+    Attributes:
+        altitude: degrees above the horizon
+        azimuth: degrees west of south
+        direction: unit vectors towards the sun, x east, y north, z up
+    """
+
+    altitude: np.ndarray
+    azimuth: np.ndarray
+    direction: np.ndarray
+
+
+def _solar_angles(declination, solar_time, latitude):
+    """Altitude and azimuth west of south (radians), as salt() and sazi()."""
+    hour_angle = solar_time * (np.pi / 12)
+    sinlat, coslat = np.sin(latitude), np.cos(latitude)
+    sindec, cosdec = np.sin(declination), np.cos(declination)
+    altitude = np.arcsin(sinlat * sindec - coslat * cosdec * np.cos(hour_angle))
+    azimuth = -np.arctan2(
+        cosdec * np.sin(hour_angle), -coslat * sindec - sinlat * cosdec * np.cos(hour_angle)
+    )
+    return altitude, azimuth
+
+
+def _declination_solar_time(jdate, hour, longitude, meridian):
+    """Solar declination (radians) and solar time (hours), as sdec() and stadj()."""
+    declination = 0.4093 * np.sin((2 * np.pi / 365) * (jdate - 81))
+    solar_time = (
+        hour
+        + 0.170 * np.sin((4 * np.pi / 373) * (jdate - 80))
+        - 0.129 * np.sin((2 * np.pi / 355) * (jdate - 8))
+        + (12 / np.pi) * (meridian - longitude)
+    )
+    return declination, solar_time
+
+
+def _michalsky(year, jdate, hour, longitude, meridian):
+    """Declination and solar time with the Almanac algorithm, as mjdate() and msdec()."""
+    jd = jdate + (year - 1949) * 365 + (year - 1949) // 4
+    mjd = jd + (hour + meridian * (12 / np.pi)) / 24 + (2432916.5 - 2451545.0)
+    deg = np.pi / 180
+    mean_lon = np.mod(280.460 * deg + 0.9856474 * deg * mjd, 2 * np.pi)
+    anomaly = np.mod(357.528 * deg + 0.9856003 * deg * mjd, 2 * np.pi)
+    ecl_lon = mean_lon + 1.915 * deg * np.sin(anomaly) + 0.020 * deg * np.sin(2 * anomaly)
+    obliquity = 23.439 * deg - 4e-7 * deg * mjd
+    right_ascension = np.arctan2(np.sin(ecl_lon) * np.cos(obliquity), np.cos(ecl_lon))
+    utime = 24 * (mjd - np.floor(mjd)) + 12
+    gmst = 6.697375 + 0.0657098242 * mjd + utime
+    lmst = gmst - longitude * (12 / np.pi)
+    solar_time = np.mod(lmst - right_ascension * (12 / np.pi) + 12, 24)
+    return np.arcsin(np.sin(obliquity) * np.sin(ecl_lon)), solar_time
+
+
+def solar_position(
+    times: np.ndarray | Sequence[datetime],
+    latitude: float | np.ndarray,
+    longitude: float | np.ndarray,
+    timezone: float | np.ndarray,
+    michalsky: bool = False,
+) -> SolarPosition:
+    """Compute sun positions for arrays of local standard times, like gensky.
+
+    Site arguments broadcast against the times, so e.g. latitude[:, None]
+    with times of shape (ntime,) gives positions of shape (nsite, ntime).
+
+    Args:
+        times: local standard times, datetime64 or datetime
+        latitude: site latitude (degrees north)
+        longitude: site longitude (degrees west)
+        timezone: standard meridian (degrees west), e.g., 120 for PST
+        michalsky: use the more accurate Almanac algorithm with the year of
+            each time, like gensky -y
+    Returns:
+        SolarPosition
+    """
+    altitude, azimuth, _, _ = _sun_angles(times, latitude, longitude, timezone, michalsky)
+    return SolarPosition(np.degrees(altitude), np.degrees(azimuth), _sun_directions(altitude, azimuth))
+
+
+def _sun_angles(times, latitude, longitude, timezone, michalsky):
+    """Altitude, azimuth west of south (radians), solar time (hours) and
+    day of the year without leap days, as in gensky and gendaylit."""
+    stamps = np.asarray(times, dtype="datetime64[s]")
+    years = stamps.astype("datetime64[Y]")
+    months = stamps.astype("datetime64[M]")
+    days = stamps.astype("datetime64[D]")
+    month = (months - years).astype(int) + 1
+    jdate = _MONTH_DAYS[month - 1] + (days - months).astype(int) + 1
+    hour = (stamps - days).astype(float) / 3600
+    lon, meridian = np.radians(longitude), np.radians(timezone)
+    if michalsky:
+        year = years.astype(int) + 1970
+        leap = (month > 2) & (year % 4 == 0)
+        declination, solar_time = _michalsky(year, jdate + leap, hour, lon, meridian)
+    else:
+        declination, solar_time = _declination_solar_time(jdate, hour, lon, meridian)
+    altitude, azimuth = _solar_angles(declination, solar_time, np.radians(latitude))
+    return altitude, azimuth, solar_time, jdate
+
+
+def _sun_directions(altitude: np.ndarray, azimuth: np.ndarray) -> np.ndarray:
+    """Direction vectors, x east, y north, z up, azimuth west of south."""
+    cosalt = np.cos(altitude)
+    return np.stack([-np.sin(azimuth) * cosalt, -np.cos(azimuth) * cosalt, np.sin(altitude)], axis=-1)
+
+
+def _julian_dates(month: np.ndarray, day: np.ndarray) -> np.ndarray:
+    """Days into the year; a leap day is day 60 and shifts the rest of the tape."""
+    leap = (month == 2) & (day == 29)
+    jd = _MONTH_DAYS[month - 1] + day + np.maximum.accumulate(leap)
+    return np.where(leap, 60, jd)
+
+
+def _dew_points(dew_point: None | np.ndarray, nstep: int) -> np.ndarray:
+    """Three-hour average dew point, restarted after missing (NaN) values."""
+    if dew_point is None:
+        return np.full(nstep, 11.0)
+    dpt = np.asarray(dew_point, dtype=float)
+    valid = ~np.isnan(dpt)
+    idx = np.arange(nstep)
+    start = np.maximum.accumulate(np.where(valid & ~np.r_[True, valid[:-1]], idx, 0))
+    first = dpt[start]
+    prev1 = np.where(idx - start >= 1, np.r_[np.nan, dpt[:-1]], first)
+    prev2 = np.where(idx - start >= 2, np.r_[np.nan, np.nan, dpt[:-2]], first)
+    avg = (prev2 + prev1 + dpt) / 3
+    # missing values keep the last average, 11 degrees before any
+    last = np.maximum.accumulate(np.where(valid, idx, -1))
+    return np.where(last >= 0, np.r_[avg, 11.0][last], 11.0)
+
+
+def _category(clearness: np.ndarray) -> np.ndarray:
+    return np.searchsorted(CLEARNESS_BOUNDS, clearness, side="right")
+
+
+def _diffuse_ratio(index, apwc, sun_zenith, brightness):
+    a, b, c, d = DIFFUSE_EFFICACY[index].T
+    return a + b * apwc + c * np.cos(sun_zenith) + d * np.log(brightness)
+
+
+def _direct_ratio(index, apwc, sun_zenith, brightness):
+    a, b, c, d = DIRECT_EFFICACY[index].T
+    return np.maximum(a + b * apwc + c * np.exp(5.73 * sun_zenith - 5.0) + d * brightness, 0.0)
+
+
+def _brightness_clearness(diff_irrad, dir_irrad, sun_zenith, jdate, clear_max):
+    day_angle = (jdate - 1.0) * (2 * np.pi / 365)
+    eccentricity = (
+        1.00011
+        + 0.034221 * np.cos(day_angle)
+        + 0.00128 * np.sin(day_angle)
+        + 0.000719 * np.cos(2 * day_angle)
+        + 0.000077 * np.sin(2 * day_angle)
+    )
+    air_mass = 1.0 / (np.cos(sun_zenith) + 0.15 * (93.885 - np.degrees(sun_zenith)) ** -1.253)
+    sz3 = 1.041 * sun_zenith**3
+    with np.errstate(divide="ignore", invalid="ignore"):
+        clearness = ((diff_irrad + dir_irrad) / diff_irrad + sz3) / (1.0 + sz3)
+    brightness = diff_irrad * air_mass / (SOLAR_CONSTANT_E * eccentricity)
+    clearness = np.clip(np.nan_to_num(clearness, nan=clear_max), 1.0, clear_max)
+    return np.clip(brightness, 0.01, 0.6), clearness
+
+
+def _perez_params(sun_zenith, clearness, brightness, index):
+    """Perez sky parameters a-e per time step, shape (nstep, 5)."""
+    delta = np.where((clearness > 1.065) & (clearness < 2.8), np.maximum(brightness, 0.2), brightness)
+    x = PEREZ_COEFF[index]
+    sz = sun_zenith[:, None]
+    params = x[..., 0] + x[..., 1] * sz + delta[:, None] * (x[..., 2] + x[..., 3] * sz)
+    overcast = index == 0
+    if overcast.any():
+        x0, sz0, d0 = x[overcast], sun_zenith[overcast], delta[overcast]
+        params[overcast, 2] = np.exp((d0 * (x0[:, 2, 0] + x0[:, 2, 1] * sz0)) ** x0[:, 2, 2]) - x0[:, 2, 3]
+        params[overcast, 3] = -np.exp(d0 * (x0[:, 3, 0] + x0[:, 3, 1] * sz0)) + x0[:, 3, 2] + d0 * x0[:, 3, 3]
+    return params
+
+
+def _sun_vectors(altitude: np.ndarray, azimuth: np.ndarray) -> np.ndarray:
+    """Direction vectors, x east, y north, z up, azimuth east of north."""
+    cosalt = np.cos(altitude)
+    return np.stack([cosalt * np.sin(azimuth), cosalt * np.cos(azimuth), np.sin(altitude)], axis=-1)
+
+
+def _sky_chunk(
+    out: np.ndarray,
+    altitude: np.ndarray,
+    azimuth: np.ndarray,
+    dirv: np.ndarray,
+    difv: np.ndarray,
+    jdate: np.ndarray,
+    dew: np.ndarray,
+    patches: tuple[np.ndarray, np.ndarray, np.ndarray],
+    units: int,
+    solar_radiance: bool,
+    sky_color: np.ndarray,
+    sun_color: np.ndarray,
+    ground_color: np.ndarray,
+    nsuns: int,
+    sun_sa: float,
+) -> None:
+    """Fill out (npatch, nstep, 3) with the sky for a chunk of time steps."""
+    palt, pazi, pdom = (p.astype(np.float64) for p in patches)
+    out[...] = 0
+    day = dirv + difv > 1e-4
+    if not day.any():
+        return
+    alt, azi, jd = altitude[day], azimuth[day], jdate[day]
+    dirv, difv = dirv[day], difv[day]
+    if units == 2:
+        dirv = np.where(alt > FTINY, dirv / np.where(alt > FTINY, np.sin(alt), 1.0), dirv)
+    sun_zenith = np.where(alt <= 0, np.pi / 2, np.where(alt >= np.radians(87.0), np.radians(3.0), np.pi / 2 - alt))
+    apwc = np.exp(0.07 * dew[day] - 0.075)
+    if units == 3:
+        diff_illum, dir_illum = difv, dirv
+        # sky brightness and clearness from illuminances, iteratively
+        diff_irrad = diff_illum * SOLAR_CONSTANT_E / (SOLAR_CONSTANT_L * 1000)
+        dir_irrad = dir_illum * SOLAR_CONSTANT_E / (SOLAR_CONSTANT_L * 1000)
+        brightness, clearness = _brightness_clearness(diff_irrad, dir_irrad, sun_zenith, jd, 12.0)
+        test1 = np.full_like(diff_irrad, 0.1)
+        test2 = np.full_like(dir_irrad, 0.1)
+        for _ in range(5):
+            active = (np.abs(diff_irrad - test1) > 10.0) | (np.abs(dir_irrad - test2) > 10.0)
+            if not active.any():
+                break
+            test1 = np.where(active, diff_irrad, test1)
+            test2 = np.where(active, dir_irrad, test2)
+            index = _category(clearness)
+            new_diff = diff_illum / _diffuse_ratio(index, apwc, sun_zenith, brightness)
+            ratio = _direct_ratio(index, apwc, sun_zenith, brightness)
+            new_dir = np.where(ratio > 0.1, dir_illum / np.where(ratio > 0.1, ratio, 1.0), ratio)
+            diff_irrad = np.where(active, new_diff, diff_irrad)
+            dir_irrad = np.where(active, new_dir, dir_irrad)
+            new_bright, new_clear = _brightness_clearness(diff_irrad, dir_irrad, sun_zenith, jd, 12.0)
+            brightness = np.where(active, new_bright, brightness)
+            clearness = np.where(active, new_clear, clearness)
+        index = _category(clearness)
+    else:
+        diff_irrad, dir_irrad = difv, dirv
+        brightness, clearness = _brightness_clearness(diff_irrad, dir_irrad, sun_zenith, jd, 11.9)
+        index = _category(clearness)
+        diff_illum = diff_irrad * _diffuse_ratio(index, apwc, sun_zenith, brightness)
+        dir_illum = dir_irrad * _direct_ratio(index, apwc, sun_zenith, brightness)
+    if solar_radiance:
+        diff_illum = diff_irrad * WHTEFFICACY
+        dir_illum = dir_irrad * WHTEFFICACY
+
+    ground = (diff_illum + np.where(alt > 0, dir_illum * np.sin(alt), 0.0)) / (np.pi * WHTEFFICACY)
+    sky = np.empty((out.shape[0], len(alt), 3))
+    sky[0] = ground[:, None] * ground_color
+    if CIE_RGB @ sky_color > 1e-4:
+        params = _perez_params(sun_zenith, clearness, brightness, index).T[:, None, :]
+        zsa = (np.pi / 2 - palt[1:])[:, None]
+        cossspa = np.cos(sun_zenith) * np.cos(zsa) + np.sin(sun_zenith) * np.sin(zsa) * np.cos(
+            np.abs(pazi[1:, None] - azi)
+        )
+        sspa = np.arccos(np.clip(cossspa, -1.0, 1.0))
+        lum = (1.0 + params[0] * np.exp(params[1] / np.cos(zsa))) * (
+            1.0 + params[2] * np.exp(params[3] * sspa) + params[4] * np.cos(sspa) ** 2
+        )
+        lum = np.maximum(lum, 0.0)
+        norm = (lum * (np.sin(palt[1:]) * pdom[1:])[:, None]).sum(axis=0)
+        zero = norm <= FTINY
+        lum[:, zero] = 1.0
+        norm[zero] = np.pi
+        sky[1:] = (lum * (diff_illum / (norm * WHTEFFICACY)))[..., None] * sky_color
+    else:
+        sky[1:] = 0.0
+    # spread the sun over the nearest patches
+    if CIE_RGB @ sun_color > 1e-4:
+        bright = dir_illum > 1e-4
+        svec = _sun_vectors(alt[bright], azi[bright])
+        pvec = _sun_vectors(palt[1:], pazi[1:])
+        dprod = svec @ pvec.T
+        near = np.argsort(-dprod, axis=1, kind="stable")[:, :nsuns]
+        near_dprod = np.take_along_axis(dprod, near, axis=1)
+        weights = 1.0 / (1.002 - near_dprod)
+        weights /= weights.sum(axis=1, keepdims=True)
+        near += 1
+        doms = sun_sa if sun_sa > 0 else pdom[near]
+        add = weights * (dir_illum[bright] / WHTEFFICACY)[:, None] / doms
+        cols = np.broadcast_to(np.flatnonzero(bright)[:, None], near.shape)
+        np.add.at(sky, (near, cols), add[..., None] * sun_color)
+    out[:, day] = sky
+
+
+def sky_matrix(
+    weather: np.ndarray,
+    latitude: float,
+    longitude: float,
+    timezone: float,
+    mfactor: int = 1,
+    units: int = 1,
+    dew_point: None | np.ndarray = None,
+    average: bool = False,
+    sun_only: bool = False,
+    sky_only: bool = False,
+    daylight_hours_only: bool = False,
+    sky_color: None | Sequence[float] = None,
+    ground_color: None | Sequence[float] = None,
+    rotate: float = 0.0,
+    onesun: bool = False,
+    solar_radiance: bool = False,
+    chunk_steps: int = 1024,
+    nproc: int = 1,
+    cache: None | MatrixCache = None,
+) -> np.ndarray:
+    """Generate a Perez sky matrix in-process, like gendaymtx.
+
+    Sky patch radiances are computed for all time steps at once.
+
+    Args:
+        weather: array of shape (nstep, 5) with month, day, hour and the two
+            values of a WEA data line, e.g. direct normal and diffuse horizontal
+        latitude: site latitude (degrees north)
+        longitude: site longitude (degrees west)
+        timezone: standard meridian (degrees west), e.g., 120 for PST
+        mfactor: Reinhart sky subdivisions
+        units: WEA data units, 1 for direct normal and diffuse horizontal
+            irradiance, 2 for direct and diffuse horizontal irradiance, 3 for
+            direct normal and diffuse horizontal illuminance
+        dew_point: dew point temperature per time step (C), NaN if missing;
+            11 degrees if not given
+        average: average the sky over all time steps
+        sun_only: direct sun only
+        sky_only: sky without direct sun
+        daylight_hours_only: only time steps with the sun above the horizon
+        sky_color: sky color
+        ground_color: ground reflectance
+        rotate: rotate the sky (degrees)
+        onesun: put the sun in a single patch with the sun's solid angle,
+            for 5-phase sun matrices
+        solar_radiance: solar radiance instead of visible
+        chunk_steps: number of time steps computed at a time
+        nproc: number of chunks computed concurrently
+        cache: cache to reuse matrices from, keyed on the weather data and
+            options; hits are read-only memory maps
+    Returns:
+        ndarray: float32 array of shape (npatch, nstep, 3)
+    """
+    weather = np.asarray(weather, dtype=float)
+    if weather.ndim != 2 or weather.shape[1] != 5:
+        raise ValueError("weather must have shape (nstep, 5)")
+    if units not in (1, 2, 3):
+        raise ValueError("units must be 1, 2 or 3")
+    key = None
+    if cache is not None:
+        key = cache.key(
+            "sky_matrix", weather, latitude, longitude, timezone, mfactor, units,
+            None if dew_point is None else np.asarray(dew_point, dtype=float),
+            average, sun_only, sky_only, daylight_hours_only, sky_color, ground_color,
+            rotate, onesun, solar_radiance,
+        )
+        if (smx := cache.load(key)) is not None:
+            return smx
+    month = weather[:, 0].astype(int)
+    day = weather[:, 1].astype(int)
+    hour = weather[:, 2]
+    sky_color = np.array((0.96, 1.004, 1.118) if sky_color is None else sky_color, dtype=float)
+    ground_color = np.array((0.2, 0.2, 0.2) if ground_color is None else ground_color, dtype=float)
+    sun_color = np.ones(3)
+    if sun_only:
+        sky_color = np.zeros(3)
+        ground_color = np.zeros(3)
+    elif sky_only:
+        sun_color = np.zeros(3)
+    nsuns, sun_sa = NSUNPATCH, -1.0
+    if onesun:
+        nsuns = 1
+        sun_sa = np.pi * (np.pi / 360 * SUN_ANG_DEG) ** 2
+
+    jdate = _julian_dates(month, day)
+    dew = _dew_points(dew_point, len(weather))
+    declination, solar_time = _declination_solar_time(
+        jdate, hour, np.radians(longitude), np.radians(timezone)
+    )
+    altitude, azimuth = _solar_angles(declination, solar_time, np.radians(latitude))
+    # gendaymtx measures azimuth east of north
+    azimuth = azimuth + np.pi - np.radians(rotate)
+    keep = slice(None)
+    if daylight_hours_only:
+        keep = altitude > -np.radians(SUN_ANG_DEG / 2)
+    altitude, azimuth, jdate, dew = altitude[keep], azimuth[keep], jdate[keep], dew[keep]
+    dirv, difv = weather[keep, 3], weather[keep, 4]
+    nstep = len(altitude)
+    if nstep == 0:
+        raise ValueError("no valid time steps")
+
+    patches = reinhart_patches(mfactor)
+    npatch = len(patches[0])
+    out = np.empty((npatch, nstep, 3), dtype=np.float32)
+
+    def run(start):
+        stop = start + chunk_steps
+        chunk = out[:, start:stop]
+        _sky_chunk(
+            chunk,
+            altitude[start:stop],
+            azimuth[start:stop],
+            dirv[start:stop],
+            difv[start:stop],
+            jdate[start:stop],
+            dew[start:stop],
+            patches,
+            units,
+            solar_radiance,
+            sky_color,
+            sun_color,
+            ground_color,
+            nsuns,
+            sun_sa,
+        )
+
+    starts = range(0, nstep, chunk_steps)
+    if nproc > 1:
+        with ThreadPoolExecutor(max_workers=nproc) as executor:
+            list(executor.map(run, starts))
+    else:
+        for start in starts:
+            run(start)
+    if average:
+        out = out.mean(axis=1, keepdims=True, dtype=np.float64).astype(np.float32)
+    if key is not None:
+        cache.save(key, out)
+    return out
+
+
+# gendaylit's sky sample directions, zenith angle and azimuth from the sun (degrees)
+_SAMPLE_ROWS = (30, 30, 24, 24, 18, 12, 6, 1)
+_SAMPLE_THETA = np.repeat(np.radians([84, 72, 60, 48, 36, 24, 12, 0]), _SAMPLE_ROWS)
+_SAMPLE_PHI = np.concatenate([np.arange(n) * (2 * np.pi / n) for n in _SAMPLE_ROWS])
+SUN_HALF_ANGLE = 0.2665  # degrees, gendaylit's solar half-angle
+SKYEFFICACY = 203.0
+SUNEFFICACY = 208.0
+
+
+def _normsc(altitude: np.ndarray, intermediate: bool) -> np.ndarray:
+    """Polynomial approximation of the E0*F2/L0 normalization factor."""
+    if intermediate:
+        coeff = (3.5556, -2.7152, -1.3081, 1.0660, 0.60227)
+    else:
+        coeff = (2.766521, 0.547665, -0.369832, 0.009237, 0.059229)
+    return np.polynomial.polynomial.polyval((altitude - np.pi / 4) / (np.pi / 4), coeff)
+
+
+def _clear_f2(altitude: np.ndarray) -> np.ndarray:
+    return 0.274 * (0.91 + 10.0 * np.exp(-3.0 * (np.pi / 2 - altitude)) + 0.45 * np.sin(altitude) ** 2)
+
+
+def _intermediate_f2(altitude: np.ndarray) -> np.ndarray:
+    return (2.739 + 0.9891 * np.sin(0.3119 + 2.6 * altitude)) * np.exp(
+        -(np.pi / 2 - altitude) * (0.4441 + 1.48 * altitude)
+    )
+
+
+def _sky_sun(times, latitude, longitude, timezone, altitude, azimuth, michalsky):
+    """Sun angles (radians), solar time and day of the year for either input."""
+    if times is not None:
+        if latitude is None or longitude is None or timezone is None:
+            raise ValueError("times require latitude, longitude and timezone")
+        return _sun_angles(times, latitude, longitude, timezone, michalsky)
+    if altitude is None or azimuth is None:
+        raise ValueError("Must provide either times or altitude and azimuth")
+    alt, azi = np.broadcast_arrays(np.radians(altitude), np.radians(azimuth))
+    return alt, azi, np.full(alt.shape, np.nan), np.zeros(alt.shape, dtype=int)
+
+
+def _rel_lum(params: np.ndarray, dzeta, gamma) -> np.ndarray:
+    """Perez relative luminance for parameters a-e along the last axis."""
+    a, b, c, d, e = np.moveaxis(params, -1, 0)
+    return (1 + a * np.exp(b / np.cos(dzeta))) * (1 + c * np.exp(d * gamma) + e * np.cos(gamma) ** 2)
+
+
+class PerezSkies(NamedTuple):
+    """Perez skies in the form of gendaylit's perezlum.cal sky, one per time step.
+
+    Attributes:
+        altitude: sun altitude (degrees)
+        azimuth: sun azimuth (degrees west of south)
+        direction: unit vectors towards the sun, x east, y north, z up
+        solar_time: local solar time (hours), NaN for given sun angles
+        clearness: Perez sky clearness (epsilon)
+        brightness: Perez sky brightness (delta)
+        water: atmospheric precipitable water content (cm)
+        solar_radiance: radiance of the sun source
+        diffuse_normalization: diffuse normalization factor, the first perezlum argument
+        ground_brightness: ground brightness, the second perezlum argument
+        coefficients: Perez parameters a-e, shape (nstep, 5)
+        valid: False where gendaylit would print its zero "error sky"
+        sun: whether descriptions include the sun source
+    """
+
+    altitude: np.ndarray
+    azimuth: np.ndarray
+    direction: np.ndarray
+    solar_time: np.ndarray
+    clearness: np.ndarray
+    brightness: np.ndarray
+    water: np.ndarray
+    solar_radiance: np.ndarray
+    diffuse_normalization: np.ndarray
+    ground_brightness: np.ndarray
+    coefficients: np.ndarray
+    valid: np.ndarray
+    sun: bool = True
+
+    def descriptions(self) -> list[bytes]:
+        """Radiance sky descriptions, as gendaylit would print them."""
+        skies = []
+        for i in range(len(self.altitude)):
+            sx, sy, sz = self.direction[i]
+            lines = []
+            if not np.isnan(self.solar_time[i]):
+                lines.append(f"# Local solar time: {self.solar_time[i]:.2f}")
+            lines.append(f"# Solar altitude and azimuth: {self.altitude[i]:.1f} {self.azimuth[i]:.1f}")
+            if not self.valid[i]:
+                lines.extend(
+                    [
+                        "",
+                        "void brightfunc skyfunc",
+                        "2 skybright perezlum.cal",
+                        "0",
+                        f"10 0.00 0.00  0.000 0.000 0.000 0.000 0.000  {sx:f} {sy:f} {sz:f} ",
+                    ]
+                )
+                skies.append(("\n".join(lines) + "\n").encode())
+                continue
+            lines.append(
+                "# epsilon, delta, atmospheric precipitable water content : "
+                f"{self.clearness[i]:.4f} {self.brightness[i]:.4f} {self.water[i]:.4f} "
+            )
+            if self.sun:
+                rad = self.solar_radiance[i]
+                lines.extend(
+                    [
+                        "",
+                        "void light solar",
+                        "0",
+                        "0",
+                        f"3 {rad:.3e} {rad:.3e} {rad:.3e}" if self.clearness[i] > 1 else "3 0.0 0.0 0.0",
+                        "",
+                        "solar source sun",
+                        "0",
+                        "0",
+                        f"4 {sx:f} {sy:f} {sz:f} {2 * SUN_HALF_ANGLE:f}",
+                    ]
+                )
+            coeff = " ".join(f"{c:f}" for c in self.coefficients[i])
+            lines.extend(
+                [
+                    "",
+                    "void brightfunc skyfunc",
+                    "2 skybright perezlum.cal",
+                    "0",
+                    f"10 {self.diffuse_normalization[i]:.3e} {self.ground_brightness[i]:.3e} {coeff} "
+                    f"{sx:f} {sy:f} {sz:f} ",
+                ]
+            )
+            skies.append(("\n".join(lines) + "\n").encode())
+        return skies
+
+
+def perez_skies(
+    times: None | np.ndarray | Sequence[datetime] = None,
+    latitude: None | float = None,
+    longitude: None | float = None,
+    timezone: None | float = None,
+    altitude: None | float | np.ndarray = None,
+    azimuth: None | float | np.ndarray = None,
+    michalsky: bool = False,
+    dirnorm: None | float | np.ndarray = None,
+    diffhor: None | float | np.ndarray = None,
+    dirhor: None | float | np.ndarray = None,
+    dirnorm_illum: None | float | np.ndarray = None,
+    diffhor_illum: None | float | np.ndarray = None,
+    dew_point: None | float | np.ndarray = None,
+    solar: bool = False,
+    sky_only: bool = False,
+    grefl: float = 0.2,
+) -> PerezSkies:
+    """Compute gendaylit skies for many time steps at once, in-process.
+
+    Time steps with the sun below the horizon get gendaylit's zero "error
+    sky", also when sun angles are given.
+
+    Args:
+        times: local standard times, mutually exclusive with altitude and azimuth
+        latitude: site latitude (degrees north)
+        longitude: site longitude (degrees west)
+        timezone: standard meridian (degrees west), e.g., 120 for PST
+        altitude: sun altitudes (degrees), mutually exclusive with times
+        azimuth: sun azimuths (degrees west of south), mutually exclusive with times
+        michalsky: use the Almanac sun position algorithm, like gendaylit -y
+        dirnorm: direct normal irradiance
+        diffhor: diffuse horizontal irradiance
+        dirhor: direct horizontal irradiance, either this or dirnorm
+        dirnorm_illum: direct normal illuminance
+        diffhor_illum: diffuse horizontal illuminance
+        dew_point: dew point temperature (C)
+        solar: solar radiance instead of visible, like gendaylit -O 1
+        sky_only: sky description only
+        grefl: ground reflectance
+    Returns:
+        PerezSkies; call descriptions() for the Radiance sky files
+    """
+    alt, azi, solar_time, jdate = _sky_sun(times, latitude, longitude, timezone, altitude, azimuth, michalsky)
+    if dirnorm is not None and diffhor is not None:
+        dirv, difv, illum = dirnorm, diffhor, False
+    elif dirhor is not None and diffhor is not None:
+        dirv, difv, illum = dirhor, diffhor, False
+    elif dirnorm_illum is not None and diffhor_illum is not None:
+        dirv, difv, illum = dirnorm_illum, diffhor_illum, True
+    else:
+        raise ValueError("Must provide irradiances or illuminances")
+    td = 10.97353115 if dew_point is None else dew_point
+    alt, azi, solar_time, jdate, dirv, difv, td = (
+        np.array(a, dtype=float).reshape(-1)
+        for a in np.broadcast_arrays(alt, azi, solar_time, jdate, dirv, difv, td)
+    )
+    water = np.exp(0.07 * np.where((td < -40) | (td > 40), 10.97353115, td) - 0.075)
+    valid = alt > 0
+    alt = np.where(valid, np.minimum(alt, np.radians(87.0)), alt)
+    sun_zenith = np.pi / 2 - np.where(valid, alt, np.pi / 2)
+
+    def parametrize(diff_irrad, dir_irrad):
+        brightness, clearness = _brightness_clearness(diff_irrad, dir_irrad, sun_zenith, jdate, np.inf)
+        return brightness, np.where(clearness > 12.01, 12.009, clearness)
+
+    if illum:
+        diff_illum, dir_illum = np.maximum(difv, 0.0), np.maximum(dirv, 0.0)
+        valid &= (diff_illum + dir_illum > 0) & (dir_illum <= SOLAR_CONSTANT_L * 1000)
+        diff_irrad = diff_illum * SOLAR_CONSTANT_E / (SOLAR_CONSTANT_L * 1000)
+        dir_irrad = dir_illum * SOLAR_CONSTANT_E / (SOLAR_CONSTANT_L * 1000)
+        brightness, clearness = parametrize(diff_irrad, dir_irrad)
+        # gendaylit always runs the full nine iterations
+        for _ in range(9):
+            index = _category(clearness)
+            diff_irrad = diff_illum / _diffuse_ratio(index, water, sun_zenith, brightness)
+            ratio = _direct_ratio(index, water, sun_zenith, brightness)
+            dir_irrad = np.where(ratio < 0.1, 0.0, dir_illum / np.maximum(ratio, 0.1))
+            brightness, clearness = parametrize(diff_irrad, dir_irrad)
+    else:
+        dir_irrad = np.maximum(dirv, 0.0)
+        if dirnorm is None:
+            dir_irrad = dir_irrad / np.sin(np.where(valid, alt, np.pi / 2))
+        diff_irrad = np.maximum(difv, 0.0)
+        valid &= (diff_irrad + dir_irrad > 0) & (dir_irrad <= SOLAR_CONSTANT_E)
+        brightness, clearness = parametrize(diff_irrad, dir_irrad)
+        index = _category(clearness)
+        diff_illum = np.maximum(diff_irrad * _diffuse_ratio(index, water, sun_zenith, brightness), 0.0)
+        dir_illum = dir_irrad * _direct_ratio(index, water, sun_zenith, brightness)
+        if not solar:
+            valid &= (diff_illum + dir_illum > 0) & (dir_illum <= SOLAR_CONSTANT_L * 1000)
+
+    index = _category(clearness)
+    coefficients = _perez_params(sun_zenith, clearness, brightness, index)
+    valid &= coefficients[:, 1] <= 0
+    cos_gamma = np.cos(sun_zenith)[:, None] * np.cos(_SAMPLE_THETA) + np.sin(sun_zenith)[:, None] * np.sin(
+        _SAMPLE_THETA
+    ) * np.cos(_SAMPLE_PHI)
+    lum = _rel_lum(coefficients[:, None, :], _SAMPLE_THETA, np.arccos(np.minimum(cos_gamma, 1.0)))
+    integral = (lum.astype(np.float32) * np.cos(_SAMPLE_THETA)).sum(axis=1) * (2 * np.pi / len(_SAMPLE_THETA))
+    sun_sa = 2 * np.pi * (1 - np.cos(np.radians(SUN_HALF_ANGLE)))
+    if solar:
+        diff_norm = diff_irrad / integral
+        solar_radiance = dir_irrad / sun_sa
+    else:
+        diff_norm = diff_illum / integral / WHTEFFICACY
+        solar_radiance = dir_illum / sun_sa / WHTEFFICACY
+
+    zenith = _rel_lum(coefficients, 0.0, sun_zenith) * diff_norm
+    intermediate = (clearness > 1) & (clearness < 6)
+    f2 = np.where(intermediate, _intermediate_f2(alt), _clear_f2(alt))
+    normfactor = np.where(clearness == 1, 0.777778, _normsc(alt, False) / f2 / np.pi)
+    normfactor = np.where(intermediate, _normsc(alt, True) / f2 / np.pi, normfactor)
+    ground = zenith * normfactor
+    if not sky_only:
+        ground += np.where(clearness > 1, 6.8e-5 / np.pi * solar_radiance * np.sin(alt), 0.0)
+    ground *= grefl
+
+    direction = _sun_directions(alt, azi)
+    invalid = ~valid
+    for arr in (clearness, brightness, solar_radiance, diff_norm, ground, coefficients):
+        arr[invalid] = 0
+    return PerezSkies(
+        np.degrees(alt),
+        np.degrees(azi),
+        direction,
+        solar_time,
+        clearness,
+        brightness,
+        water,
+        np.where(clearness > 1, solar_radiance, 0.0),
+        diff_norm,
+        ground,
+        coefficients,
+        valid,
+        not sky_only,
+    )
+
+
+_CIE_TYPES = {"clear": 1, "overcast": 2, "uniform": 3, "intermediate": 4}
+
+
+class CIESkies(NamedTuple):
+    """CIE skies in the form of gensky's skybright.cal sky, one per time step.
+
+    Attributes:
+        sky_type: 1 clear, 2 overcast, 3 uniform, 4 intermediate
+        altitude: sun altitude (degrees)
+        azimuth: sun azimuth (degrees west of south)
+        direction: unit vectors towards the sun, x east, y north, z up
+        solar_time: local solar time (hours), NaN for given sun angles
+        zenith_brightness: zenith radiance
+        ground_brightness: ground radiance
+        f2: horizon brightness normalization factor, the F2 skybright argument
+        solar_radiance: radiance of the sun source, 0 where there is none
+    """
+
+    sky_type: int
+    altitude: np.ndarray
+    azimuth: np.ndarray
+    direction: np.ndarray
+    solar_time: np.ndarray
+    zenith_brightness: np.ndarray
+    ground_brightness: np.ndarray
+    f2: np.ndarray
+    solar_radiance: np.ndarray
+
+    def descriptions(self) -> list[bytes]:
+        """Radiance sky descriptions, as gensky would print them."""
+        overcast = self.sky_type in (2, 3)
+        skies = []
+        for i in range(len(self.altitude)):
+            sx, sy, sz = self.direction[i]
+            lines = []
+            if not np.isnan(self.solar_time[i]):
+                lines.append(f"# Local solar time: {self.solar_time[i]:.2f}")
+                lines.append(f"# Solar altitude and azimuth: {self.altitude[i]:.1f} {self.azimuth[i]:.1f}")
+            if self.solar_radiance[i] > 0:
+                rad = self.solar_radiance[i]
+                lines.extend(
+                    [
+                        "",
+                        "void light solar",
+                        "0",
+                        "0",
+                        f"3 {rad:.3e} {rad:.3e} {rad:.3e}",
+                        "",
+                        "solar source sun",
+                        "0",
+                        "0",
+                        f"4 {sx:f} {sy:f} {sz:f} 0.5",
+                    ]
+                )
+            lines.extend(["", "void brightfunc skyfunc", "2 skybr skybright.cal", "0"])
+            zenith, ground = self.zenith_brightness[i], self.ground_brightness[i]
+            if overcast:
+                lines.append(f"3 {self.sky_type} {zenith:.3e} {ground:.3e}")
+            else:
+                lines.append(
+                    f"7 {self.sky_type} {zenith:.3e} {ground:.3e} {self.f2[i]:.3e} {sx:f} {sy:f} {sz:f}"
+                )
+            skies.append(("\n".join(lines) + "\n").encode())
+        return skies
+
+
+def cie_skies(
+    times: None | np.ndarray | Sequence[datetime] = None,
+    latitude: None | float = None,
+    longitude: None | float = None,
+    timezone: None | float = None,
+    altitude: None | float | np.ndarray = None,
+    azimuth: None | float | np.ndarray = None,
+    michalsky: bool = False,
+    sky_type: str = "clear",
+    sun: bool = True,
+    ground_reflectance: float | np.ndarray = 0.2,
+    zenith_brightness: None | float | np.ndarray = None,
+    horizontal_brightness: None | float | np.ndarray = None,
+    solar_radiance: None | float | np.ndarray = None,
+    horizontal_direct_irradiance: None | float | np.ndarray = None,
+    turbidity: float | np.ndarray = 2.45,
+) -> CIESkies:
+    """Compute gensky skies for many time steps at once, in-process.
+
+    Args:
+        times: local standard times, mutually exclusive with altitude and azimuth
+        latitude: site latitude (degrees north)
+        longitude: site longitude (degrees west)
+        timezone: standard meridian (degrees west), e.g., 120 for PST
+        altitude: sun altitudes (degrees), mutually exclusive with times
+        azimuth: sun azimuths (degrees west of south), mutually exclusive with times
+        michalsky: use the Almanac sun position algorithm, like gensky -y
+        sky_type: "clear", "intermediate", "overcast" or "uniform"
+        sun: include the sun for clear and intermediate skies
+        ground_reflectance: ground reflectance
+        zenith_brightness: zenith radiance (watts/steradian/meter2)
+        horizontal_brightness: horizontal diffuse irradiance (watts/meter2)
+        solar_radiance: solar radiance (watts/steradian/meter2)
+        horizontal_direct_irradiance: horizontal direct irradiance (watts/meter2)
+        turbidity: atmospheric turbidity
+    Returns:
+        CIESkies; call descriptions() for the Radiance sky files
+    """
+    if sky_type not in _CIE_TYPES:
+        raise ValueError(f"sky_type must be one of {', '.join(_CIE_TYPES)}")
+    skytype = _CIE_TYPES[sky_type]
+    overcast = skytype in (2, 3)
+    alt, azi, solar_time, _ = _sky_sun(times, latitude, longitude, timezone, altitude, azimuth, michalsky)
+    alt, azi, solar_time, gprefl, turb = (
+        np.array(a, dtype=float).reshape(-1)
+        for a in np.broadcast_arrays(alt, azi, solar_time, ground_reflectance, turbidity)
+    )
+    if not overcast:
+        alt = np.minimum(alt, np.radians(87.0))
+    direction = _sun_directions(alt, azi)
+    sinalt = direction[:, 2]
+
+    f2 = np.zeros_like(alt)
+    if skytype == 1:
+        f2 = _clear_f2(alt)
+        normfactor = _normsc(alt, False) / f2 / np.pi
+    elif skytype == 4:
+        f2 = _intermediate_f2(alt)
+        normfactor = _normsc(alt, True) / f2 / np.pi
+    else:
+        normfactor = np.full_like(alt, 1.0 if skytype == 3 else 0.777778)
+
+    if horizontal_brightness is not None:
+        zenith = np.asarray(horizontal_brightness, dtype=float) / (normfactor * np.pi)
+    elif zenith_brightness is not None:
+        zenith = np.asarray(zenith_brightness, dtype=float) + np.zeros_like(alt)
+    else:
+        if overcast:
+            zenith = 8.6 * sinalt + 0.123
+        else:
+            zenith = (1.376 * turb - 1.81) * np.tan(alt) + 0.38
+        if skytype == 4:
+            zenith = (zenith + 8.6 * sinalt + 0.123) / 2
+        zenith = np.maximum(zenith, 0.0) * (1000.0 / SKYEFFICACY)
+    ground = zenith * normfactor
+
+    solarbr = np.zeros_like(alt)
+    if not overcast:
+        if horizontal_direct_irradiance is not None:
+            given = np.asarray(horizontal_direct_irradiance, dtype=float) + solarbr
+            with np.errstate(divide="ignore"):
+                solarbr = np.where(given > 0, given / (5.98e-5 * sinalt), 0.0)
+        elif solar_radiance is not None:
+            solarbr = np.maximum(np.asarray(solar_radiance, dtype=float), 0.0) + solarbr
+        else:
+            solarbr = 1.5e9 / SUNEFFICACY * (1.147 - 0.147 / np.maximum(sinalt, 0.16))
+            if skytype == 4:
+                solarbr *= 0.15
+        solarbr = np.where(sinalt > 0, solarbr, 0.0)
+        ground = ground + 6e-5 / np.pi * solarbr * sinalt
+    ground *= gprefl
+
+    return CIESkies(
+        skytype,
+        np.degrees(alt),
+        np.degrees(azi),
+        direction,
+        solar_time,
+        zenith,
+        ground,
+        f2,
+        solarbr if sun else np.zeros_like(solarbr),
+    )
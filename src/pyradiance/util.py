@@ -3,26 +3,49 @@ Radiance utilities
 """
 
 import csv
+import io
+import math
 import os
 import re
+import shutil
 import subprocess as sp
 import tempfile
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Sequence, Literal
-
-from .anci import BINPATH, handle_called_process_error
+from typing import TYPE_CHECKING, Callable, Sequence, Literal
+
+import numpy as np
+
+from .anci import (
+    BINPATH,
+    CHUNK_SIZE,
+    FileType,
+    StreamInput,
+    StreamOutput,
+    _read_head,
+    handle_called_process_error,
+    read_header,
+    stream_run,
+)
 
 from .bsdf import spec_xyz, xyz_rgb
+from .cache import MatrixCache
 from .model import Primitive, Scene
-from .rad_params import View, RayParams, get_ray_params_args, get_view_args
+from .mtx import rgb2xyz_matrix
+from .rad_params import View, RayParams, get_ray_params_args, get_view_args, parse_view
 from .ot import getbbox
-from .px import pvaluer
+from .px import read_hdr, write_hdr
 from .cal import cnt
 from .rt import rpict, rtrace
 
+if TYPE_CHECKING:
+    from .radiance_ext import RpictSimulManager
+
 
 Ops = Literal["*", "+", ".", "/"]
-FileType = Literal["a", "f", "d", "c"]
+# receiver option sending rfluxmtx output to files
+_RFLUX_OUTPUT = re.compile(r"^#@rfluxmtx\b.*\bo=", re.MULTILINE)
 SpectrumTag = Literal["Visible", "Solar"]
 
 
@@ -248,31 +271,99 @@ def get_image_dimensions(image: str | Path | bytes) -> tuple[int, int]:
     Returns:
         Tuple[int, int]: width and height
     """
-    output = getinfo(image, dimension_only=True).decode().split()
-    return int(output[3]), int(output[1])
+    dims = read_header(image).dimensions
+    if dims is None:
+        raise ValueError("Missing resolution string")
+    return dims
 
 
-@handle_called_process_error
 def get_header(inp: str | Path | bytes, dimension: bool = False) -> bytes:
     """Get header information from a Radiance file.
 
+    The output is getinfo's, read in process.
+
     Args:
         inp: input file or bytes
+        dimension: return the resolution string instead of the header
 
     Returns:
         bytes: header
     """
-    stdin = None
-    cmd = [str(BINPATH / "getinfo")]
+    if not isinstance(inp, (str, Path, bytes)):
+        raise TypeError("inp must be a string, Path, or bytes")
+    data = inp if isinstance(inp, bytes) else _read_head(inp, 1 << 12)
+    info = read_header(data)
     if dimension:
-        cmd.append("-d")
+        if info.resolution is None:
+            # octrees and other data without a resolution string
+            return getinfo(inp, dimension_only=True)
+        res = data[info.header_end : info.offset]
+        return res if isinstance(inp, bytes) else os.fsencode(inp) + b": " + res
     if isinstance(inp, bytes):
-        stdin = inp
-    elif isinstance(inp, (str, Path)):
-        cmd.append(str(inp))
-    else:
-        raise TypeError("inp must be a string, Path, or bytes")
-    return sp.run(cmd, check=True, input=stdin, stdout=sp.PIPE, stderr=sp.PIPE).stdout
+        return data[: info.header_end]
+    lines = data[: info.header_end - 1].replace(b"\n", b"\n\t")
+    return os.fsencode(inp) + b":\n\t" + lines + b"\n"
+
+
+def edit_header(
+    inp: str | Path | bytes,
+    append: Sequence[str] = (),
+    replace: Sequence[str] = (),
+    strip: bool = False,
+    out: None | str | Path = None,
+) -> bytes | str:
+    """Edit the information header of a Radiance file, as getinfo -a, -r and -.
+
+    The data after the header is passed through untouched: bytes are
+    sliced in place and files are copied from the data offset.
+
+    Args:
+        inp: input file or bytes
+        append: lines to add to the header
+        replace: variables to replace, as 'VAR=value' to set a value or
+            'VAR' to remove it
+        strip: drop the header, keeping only the data
+        out: output file, bytes are returned if None
+
+    Returns:
+        bytes or the output path
+    """
+    info = read_header(inp)
+    head = b""
+    if not strip:
+        # the format line goes last, as getinfo puts it
+        fmt = info.fmt
+        names = {"FORMAT"}
+        replaced = []
+        for rep in replace:
+            name, eq, value = rep.partition("=")
+            names.add(name.strip())
+            if name.strip() == "FORMAT":
+                fmt = value.strip() if eq else None
+            elif eq:
+                replaced.append(rep.strip())
+        lines = [ln for ln in info.lines if "=" not in ln or ln.partition("=")[0].strip() not in names]
+        lines.extend(a.rstrip("\n") for a in append if a)
+        lines.extend(replaced)
+        if fmt is not None:
+            lines.append(f"FORMAT={fmt}")
+        head = ("\n".join(lines) + "\n\n").encode()
+    if isinstance(inp, bytes):
+        payload = memoryview(inp)[info.header_end :]
+        if out is None:
+            return head + payload
+        with open(out, "wb") as wtr:
+            wtr.write(head)
+            wtr.write(payload)
+        return str(out)
+    with open(inp, "rb") as rdr:
+        rdr.seek(info.header_end)
+        if out is None:
+            return head + rdr.read()
+        with open(out, "wb") as wtr:
+            wtr.write(head)
+            shutil.copyfileobj(rdr, wtr, CHUNK_SIZE)
+    return str(out)
 
 
 @handle_called_process_error
@@ -765,7 +856,7 @@ def render(
         param_strs.extend(get_ray_params_args(params))
     vargs = get_view_args(aview)
     res_raw = vwrays(view=vargs, dimensions=True, xres=xres, yres=yres).decode().split()
-    xres, yres = int(res_raw[3]), int(res_raw[1])
+    xres, yres = int(res_raw[1]), int(res_raw[3])
     if not specout and nproc == 1:
         return rpict(
             vargs, scene.octree, params=["-ps", "1"] + param_strs, xres=xres, yres=yres
@@ -778,23 +869,24 @@ def render(
                 octree=scene.octree,
                 rays=vwrays(view=vargs, outform="f", pixpos=ord, xres=xres, yres=yres),
                 inform="f",
-                outform="a",
+                outform="f",
                 outspec="v",
                 nproc=nproc,
                 params=param_strs,
             )
-            header = getinfo(
-                getinfo(get_header(pix), replace="NCOMP"),
-                append=f"VIEW={' '.join(vargs)}",
-            )
-            sorted_lines = b"\n".join(
-                o + b"\t" + p
-                for o, p in zip(ord.splitlines(), strip_header(pix).splitlines())
+            info = read_header(pix)
+            # pixel positions count up from the bottom left, pictures start at the top
+            xpos, ypos = np.array(ord.split(), dtype=np.intp).reshape(-1, 2).T
+            values = np.frombuffer(pix, dtype=np.float32, offset=info.offset).reshape(-1, 3)
+            img = np.empty((yres, xres, 3), dtype=np.float32)
+            img[yres - 1 - ypos, xpos] = values
+            skip = ("FORMAT=", "NCOMP=", "NROWS=", "NCOLS=", "BigEndian=")
+            return write_hdr(
+                img,
+                view=vargs,
+                info=[ln for ln in info.lines[1:] if not ln.startswith(skip)],
+                nthreads=nproc,
             )
-            content = sp.run(
-                ["sort", "-k2rn", "-k1n"], input=sorted_lines, check=True, stdout=sp.PIPE
-            ).stdout
-            return pvaluer(header + content, yres=yres, xres=xres)
         # else randomize overture calculation to prime ambient cache
         oxres, oyres = int(xres / 6), int(yres / 6)
         rtrace(
@@ -811,7 +903,7 @@ def render(
             ),
         )
 
-    return getinfo(
+    return edit_header(
         rtrace(
             octree=scene.octree,
             params=param_strs + res_raw,
@@ -825,31 +917,535 @@ def render(
             outform="c",
             nproc=nproc,
         ),
-        append=f"VIEW={' '.join(vargs)}",
+        append=[f"VIEW={' '.join(vargs)}"],
+    )
+
+
+def _crop_view(view: Sequence[str], x0: float, y0: float, x1: float, y1: float) -> list[str]:
+    """View options for part of a view, as Radiance's cropview().
+
+    Args:
+        view: view options
+        x0, y0, x1, y1: crop bounds as fractions of the view, from the lower left
+
+    Returns:
+        view options of the cropped view
+    """
+    vw = parse_view(" ".join(view))
+    half = math.pi / 360
+
+    def crop(size: float, frac: float, horizontal: bool) -> float:
+        if math.isclose(frac, 1):
+            return size
+        if vw.type == "v" or (vw.type == "c" and not horizontal):
+            return math.atan(frac * math.tan(half * size)) / half
+        if vw.type in "lac":
+            return size * frac
+        if vw.type == "h":
+            frac *= math.sin(half * size)
+        else:
+            frac *= math.sin(half * size) / (1 + math.cos(half * size))
+            return math.acos((1 - frac * frac) / (1 + frac * frac)) / half
+        if frac > 1:
+            raise ValueError("illegal crop for hemispherical view")
+        return math.asin(frac) / half
+
+    vw.horiz = crop(vw.horiz, x1 - x0, True)
+    vw.vert = crop(vw.vert, y1 - y0, False)
+    vw.hoff = ((x0 + x1) * 0.5 - 0.5 + vw.hoff) / (x1 - x0)
+    vw.voff = ((y0 + y1) * 0.5 - 0.5 + vw.voff) / (y1 - y0)
+    return get_view_args(vw)
+
+
+def render_tiles(
+    view: Sequence[str],
+    octree: str | Path,
+    xres: int = 512,
+    yres: int = 512,
+    tiles: tuple[int, int] = (2, 2),
+    params: None | Sequence[str] = None,
+    ambfile: None | str | Path = None,
+    nproc: int = 1,
+    executor: None | Executor = None,
+    out: None | str | Path = None,
+) -> bytes | str:
+    """Render a view in tiles with concurrent rpict processes and stitch the picture.
+
+    Tiles are cropped views, as RpictSimulManager's tile grid and rpiece
+    use. All tiles share one ambient file, which Radiance locks while
+    each process reads and adds values.
+
+    Args:
+        view: view options
+        octree: octree file
+        xres: maximum picture width
+        yres: maximum picture height
+        tiles: number of tile columns and rows
+        params: other rpict options
+        ambfile: ambient file to share, a temporary one if None
+        nproc: number of concurrent rpict processes
+        executor: executor running rpict() for each tile instead of a local
+            thread pool, e.g., a process pool or a cluster client; workers
+            need access to the octree and ambient file
+        out: output picture path, None to return bytes
+
+    Returns:
+        bytes of the picture if out is None, otherwise the output path
+    """
+    ncols, nrows = tiles
+    res = vwrays(view=view, dimensions=True, xres=xres, yres=yres).decode().split()
+    # tiles have equal sizes, as in RpictSimulManager.NewFrame()
+    width, height = int(res[1]) // ncols, int(res[3]) // nrows
+    if width < 1 or height < 1:
+        raise ValueError("too many tiles for the picture size")
+    tmp_amb = None
+    if ambfile is None:
+        fd, tmp_amb = tempfile.mkstemp(suffix=".amb")
+        os.close(fd)
+        os.remove(tmp_amb)
+        ambfile = tmp_amb
+    # -pa 0 keeps each tile at the requested size
+    args = [*(params or []), "-pa", "0", "-af", str(ambfile)]
+    pool = executor or ThreadPoolExecutor(max_workers=nproc)
+    try:
+        futures = {
+            (col, row): pool.submit(
+                rpict,
+                _crop_view(view, col / ncols, row / nrows, (col + 1) / ncols, (row + 1) / nrows),
+                octree,
+                xres=width,
+                yres=height,
+                params=args,
+            )
+            # top rows first
+            for row in reversed(range(nrows))
+            for col in range(ncols)
+        }
+        img = np.empty((nrows * height, ncols * width, 3), dtype=np.float32)
+        info = None
+        for (col, row), future in futures.items():
+            pic = future.result()
+            if info is None:
+                info = read_header(pic)
+            # true radiances, in case tiles carry different exposures
+            tile = read_hdr(pic, original=True)
+            if tile.shape[:2] != (height, width):
+                raise RuntimeError(f"tile {col},{row} has shape {tile.shape[:2]}")
+            top = (nrows - 1 - row) * height
+            img[top : top + height, col * width : (col + 1) * width] = tile
+    finally:
+        if executor is None:
+            pool.shutdown(cancel_futures=True)
+        if tmp_amb is not None and os.path.exists(tmp_amb):
+            os.remove(tmp_amb)
+    skip = ("VIEW=", "EXPOSURE=", "PIXASPECT=", "FORMAT=")
+    return write_hdr(
+        img,
+        out,
+        view=view,
+        info=[ln for ln in info.lines[1:] if not ln.startswith(skip)],
+        nthreads=nproc,
     )
 
 
+def render_progressive(
+    view: Sequence[str],
+    octree: str | Path,
+    xres: int = 512,
+    yres: int = 512,
+    params: None | Sequence[str] = None,
+    rel_error: float = 0.05,
+    time_budget: None | float = None,
+    max_samples: int = 64,
+    stride: int = 8,
+    ambfile: None | str | Path = None,
+    nproc: int = 1,
+    progress: None | Callable[[np.ndarray, np.ndarray, int], None | bool] = None,
+    seed: None | int = None,
+    out: None | str | Path = None,
+) -> bytes | str:
+    """Render a view in successive passes until it converges or time runs out.
+
+    The first passes trace one ray per pixel on grids from every stride-th
+    pixel down to every pixel, filling the gaps with the nearest sample.
+    Later passes add jittered samples to pixels whose relative standard
+    error of luminance is above rel_error, doubling their sample count
+    each pass. Rays are traced by rtrace with uncorrelated sampling and
+    one ambient file shared across passes. Ambient values are cached
+    rather than resampled, so with -aa above 0 the error estimate covers
+    direct, specular and pixel sampling noise only.
+
+    Args:
+        view: view options
+        octree: octree file
+        xres: maximum picture width
+        yres: maximum picture height
+        params: other rtrace options
+        rel_error: target relative standard error per pixel; dark pixels
+            are held to the error relative to the picture's mean luminance
+        time_budget: seconds after which no new pass starts, None for no limit;
+            passes are cut to the rays expected to fit, timed on a sample of
+            the first pass; grid pixels left out take the nearest sample of a
+            coarser grid and get their first ray in a later pass
+        max_samples: maximum number of samples per pixel
+        stride: pixel spacing of the first, coarsest pass, rounded down to a power of two
+        ambfile: ambient file to share, a temporary one if None
+        nproc: number of rtrace processes
+        progress: called after each pass with the best picture so far
+            (height x width x 3), the relative error per pixel (inf where
+            unknown) and the pass number; returning True stops the render
+        seed: seed for pixel jitter
+        out: output picture path, None to return bytes
+
+    Returns:
+        bytes of the picture if out is None, otherwise the output path
+    """
+    start = time.monotonic()
+    res = vwrays(view=view, dimensions=True, xres=xres, yres=yres).decode().split()
+    width, height = int(res[1]), int(res[3])
+    rng = np.random.default_rng(seed)
+    lum = rgb2xyz_matrix()[1]
+    count = np.zeros(height * width, dtype=np.int64)
+    total = np.zeros((height * width, 3))
+    lsum = np.zeros(height * width)
+    lsum2 = np.zeros(height * width)
+    tmp_amb = None
+    if ambfile is None:
+        fd, tmp_amb = tempfile.mkstemp(suffix=".amb")
+        os.close(fd)
+        os.remove(tmp_amb)
+        ambfile = tmp_amb
+    args = [*(params or []), "-af", str(ambfile)]
+    rays_traced, trace_time = 0, 0.0
+
+    def trace(pixels: np.ndarray) -> None:
+        nonlocal rays_traced, trace_time
+        tstart = time.monotonic()
+        row, col = np.divmod(pixels, width)
+        # vwrays -i takes pixel positions from the lower left, pixel centers at .5
+        pos = np.column_stack([col, height - 1 - row]) + rng.random((len(pixels), 2)) - 0.5
+        buf = io.BytesIO()
+        np.savetxt(buf, pos, fmt="%.6f")
+        rays = vwrays(pixpos=buf.getvalue(), outform="f", xres=xres, yres=yres, view=view)
+        values = np.frombuffer(
+            rtrace(rays, octree, header=False, inform="f", outform="f", uncorrelated=True, nproc=nproc, params=args),
+            dtype=np.float32,
+        ).reshape(-1, 3)
+        if len(values) != len(pixels):
+            raise RuntimeError(f"rtrace returned {len(values)} values for {len(pixels)} rays")
+        lvalues = values @ lum
+        count[:] += np.bincount(pixels, minlength=count.size)
+        for c in range(3):
+            total[:, c] += np.bincount(pixels, values[:, c], minlength=count.size)
+        lsum[:] += np.bincount(pixels, lvalues, minlength=count.size)
+        lsum2[:] += np.bincount(pixels, lvalues * lvalues, minlength=count.size)
+        rays_traced += len(pixels)
+        trace_time += time.monotonic() - tstart
+
+    def error() -> np.ndarray:
+        err = np.full(count.size, np.inf)
+        many = count > 1
+        n = count[many]
+        mean = lsum[many] / n
+        var = np.maximum(lsum2[many] - lsum[many] * mean, 0) / (n - 1)
+        floor = max(lsum[count > 0].sum() / count.sum(), 1e-9) if count.any() else 1e-9
+        err[many] = np.sqrt(var / n) / np.maximum(mean, floor)
+        return err
+
+    def picture() -> np.ndarray:
+        img = (total / np.maximum(count, 1)[:, None]).reshape(height, width, 3)
+        have = count.reshape(height, width) > 0
+        missing = ~have
+        size = 2
+        while size <= first_step and missing.any():
+            # nearest sample on the finest grid that has one
+            rows, cols = np.arange(height) // size * size, np.arange(width) // size * size
+            fill = missing & have[rows[:, None], cols]
+            img = np.where(fill[..., None], img[rows[:, None], cols], img)
+            missing &= ~fill
+            size <<= 1
+        return img.astype(np.float32)
+
+    def time_left() -> float:
+        return math.inf if time_budget is None else time_budget - (time.monotonic() - start)
+
+    def ray_budget() -> float:
+        # rays expected to fit in the remaining time at the rate seen so far
+        left = time_left()
+        if math.isinf(left) or trace_time <= 0:
+            return math.inf
+        return left * rays_traced / trace_time
+
+    npass = 0
+    img = np.zeros((height, width, 3), dtype=np.float32)
+    try:
+        index = np.arange(height * width).reshape(height, width)
+        step = first_step = 1 << max(int(stride), 1).bit_length() - 1
+        done = np.zeros((height, width), dtype=bool)
+        stop = False
+        while not stop and time_left() > 0:
+            traced = rays_traced
+            if step >= 1:
+                # coarse to fine: new pixels on this grid, one ray each
+                grid = np.zeros((height, width), dtype=bool)
+                grid[::step, ::step] = True
+                pixels = index[grid & ~done]
+                if time_budget is not None and rays_traced == 0 and pixels.size > 1:
+                    # time a spread of the first pass to learn how many rays fit
+                    probe = np.sort(rng.choice(pixels, max(pixels.size // 8, 1), replace=False))
+                    trace(probe)
+                    done.flat[probe] = True
+                    pixels = np.setdiff1d(pixels, probe, assume_unique=True)
+                budget = ray_budget()
+                if pixels.size > budget:
+                    if budget < 1 and rays_traced == traced:
+                        break
+                    # an even spread of the grid, the rest stays filled from coarser grids
+                    pixels = np.sort(rng.choice(pixels, max(int(budget), 0), replace=False))
+                done.flat[pixels] = True
+            else:
+                err = error()
+                todo = np.flatnonzero((err > rel_error) & (count < max_samples))
+                if todo.size == 0:
+                    break
+                # pixels left out of a cut grid pass get their first ray
+                nsamp = np.minimum(np.maximum(count[todo], 1), max_samples - count[todo])
+                budget = ray_budget()
+                if nsamp.sum() > budget:
+                    # the worst pixels first, as many as the budget allows
+                    order = np.argsort(-err[todo], kind="stable")
+                    todo, nsamp = todo[order], nsamp[order]
+                    keep = np.cumsum(nsamp) <= budget
+                    todo, nsamp = todo[keep], nsamp[keep]
+                if nsamp.sum() == 0:
+                    break
+                pixels = np.repeat(todo, nsamp)
+            if pixels.size > 0:
+                trace(pixels)
+            npass += 1
+            img = picture()
+            if progress is not None:
+                stop = bool(progress(img, error().reshape(height, width), npass))
+            step >>= 1
+    finally:
+        if tmp_amb is not None and os.path.exists(tmp_amb):
+            os.remove(tmp_amb)
+    return write_hdr(img, out, view=view, nthreads=nproc)
+
+
+def _view_order(positions: np.ndarray) -> list[int]:
+    """Nearest neighbor tour through view points, from the one closest to their center."""
+    left = list(range(len(positions)))
+    if not left:
+        return []
+    current = int(np.argmin(np.linalg.norm(positions - positions.mean(axis=0), axis=1)))
+    order = [current]
+    left.remove(current)
+    while left:
+        dist = np.linalg.norm(positions[left] - positions[current], axis=1)
+        current = left.pop(int(np.argmin(dist)))
+        order.append(current)
+    return order
+
+
+def render_views(
+    scene: Scene,
+    views: None | Sequence[View | Sequence[str]] = None,
+    xres: int = 512,
+    yres: int = 512,
+    params: None | Sequence[str] = None,
+    ambfile: None | str | Path = None,
+    nproc: int = 1,
+    out: None | str | Path = None,
+) -> list[np.ndarray] | list[str]:
+    """Render many views of a scene with concurrent rpict processes.
+
+    The scene's octree is built once and all views share one ambient
+    file, which Radiance locks while each process reads and adds values.
+    Views are rendered in nearest neighbor order of their view points,
+    so that each view starts from ambient values computed nearby.
+
+    Args:
+        scene: Scene object
+        views: views or view options, the scene's views if None
+        xres: maximum picture width
+        yres: maximum picture height
+        params: other rpict options
+        ambfile: ambient file to share, a temporary one if None
+        nproc: number of concurrent rpict processes
+        out: directory to write pictures to as {sid}_{index}.hdr,
+            None to return arrays
+
+    Returns:
+        pictures as arrays if out is None, otherwise their paths, in the order of views
+    """
+    views = scene.views if views is None else views
+    vargs = [get_view_args(v) if isinstance(v, View) else list(v) for v in views]
+    positions = np.array([parse_view(" ".join(v)).vp for v in vargs], dtype=np.float64)
+    scene.build()
+    tmp_amb = None
+    if ambfile is None:
+        fd, tmp_amb = tempfile.mkstemp(suffix=".amb")
+        os.close(fd)
+        os.remove(tmp_amb)
+        ambfile = tmp_amb
+    args = [*(params or []), "-af", str(ambfile)]
+    if out is not None:
+        os.makedirs(out, exist_ok=True)
+    results: list = [None] * len(vargs)
+    pool = ThreadPoolExecutor(max_workers=nproc)
+    try:
+        futures = {
+            idx: pool.submit(rpict, vargs[idx], scene.octree, xres=xres, yres=yres, params=args)
+            for idx in _view_order(positions)
+        }
+        for idx, future in futures.items():
+            pic = future.result()
+            if out is None:
+                results[idx] = read_hdr(pic)
+            else:
+                path = os.path.join(out, f"{scene.sid}_{idx}.hdr")
+                with open(path, "wb") as wtr:
+                    wtr.write(pic)
+                results[idx] = path
+    finally:
+        pool.shutdown(cancel_futures=True)
+        if tmp_amb is not None and os.path.exists(tmp_amb):
+            os.remove(tmp_amb)
+    return results
+
+
+def render_resumable(
+    manager: "RpictSimulManager",
+    octree: str | Path,
+    view: View,
+    checkpoint: str | Path,
+    xres: int = 512,
+    yres: int = 512,
+    tiles: tuple[int, int] = (1, 16),
+    depth: bool = True,
+    interval: float = 60,
+    nthreads: int = 0,
+    progress: None | Callable[[int, int, np.ndarray], None] = None,
+) -> tuple[np.ndarray, None | np.ndarray]:
+    """Render a view with a RpictSimulManager, checkpointing finished tiles.
+
+    The picture and depth buffers, with the tiles done so far, are saved
+    to the checkpoint file as they fill in. Rendering the same view of the
+    same octree with the same ray parameters again picks up from the tiles
+    the checkpoint holds, so an interrupted render only loses the tiles in
+    progress. Set an ambient file in the ray parameters to also keep
+    ambient values across runs.
+
+    Args:
+        manager: manager to render with, using the current ray parameters
+        octree: octree file, loaded into the manager unless it already is
+        view: view to render
+        checkpoint: checkpoint file path, removed once the frame is done
+        xres: maximum picture width
+        yres: maximum picture height
+        tiles: number of tile columns and rows, the unit of checkpointing
+        depth: also render the depth buffer
+        interval: minimum seconds between checkpoints, 0 to save after every tile;
+            one is also saved when rendering stops on an exception
+        nthreads: number of ray tracing processes, 0 for all cores
+        progress: called with tiles done, total tiles and the picture after each tile
+
+    Returns:
+        picture of shape (height, width, components) and depth (height, width) or None
+    """
+    from .radiance_ext import get_ray_params
+
+    ncols, nrows = tiles
+    manager.load_octree(str(octree))
+    width, height = manager.new_frame(view, xres, yres, tiles)
+    manager.set_thread_count(nthreads)
+    theight, twidth, ncomp = manager.t_height(), manager.t_width(), manager.n_components()
+    frame = np.array([width, height, ncols, nrows, ncomp, depth])
+    key = {
+        "view": " ".join(get_view_args(view)),
+        "octree": os.path.abspath(octree),
+        "params": " ".join(get_ray_params_args(get_ray_params())),
+    }
+    if os.path.exists(checkpoint):
+        with np.load(checkpoint, allow_pickle=False) as saved:
+            for name, value in key.items():
+                if name not in saved or str(saved[name]) != value:
+                    raise ValueError(f"checkpoint {checkpoint} has another {name}")
+            if not np.array_equal(saved["frame"], frame):
+                raise ValueError(f"checkpoint {checkpoint} is for another frame")
+            img, zbuf, done = saved["image"], saved["depth"], saved["done"]
+    else:
+        img = np.zeros((height, width, ncomp), dtype=np.float32)
+        zbuf = np.zeros((height, width) if depth else (0, 0), dtype=np.float32)
+        # rows of tiles from the top, as in the picture
+        done = np.zeros((nrows, ncols), dtype=bool)
+
+    def save() -> None:
+        tmp = f"{checkpoint}.tmp"
+        with open(tmp, "wb") as wtr:
+            np.savez(wtr, frame=frame, image=img, depth=zbuf, done=done, **key)
+        os.replace(tmp, checkpoint)
+
+    tile = np.empty((theight, twidth, ncomp), dtype=np.float32)
+    tile_depth = np.empty((theight, twidth), dtype=np.float32) if depth else None
+    saved_at = time.monotonic()
+    try:
+        for row, col in zip(*np.nonzero(~done)):
+            if not manager.render_tile(tile, tile_depth, (col, nrows - 1 - row)):
+                raise RuntimeError(f"rendering tile {col},{nrows - 1 - row} failed")
+            rows = slice(row * theight, (row + 1) * theight)
+            cols = slice(col * twidth, (col + 1) * twidth)
+            img[rows, cols] = tile
+            if depth:
+                zbuf[rows, cols] = tile_depth
+            done[row, col] = True
+            if time.monotonic() - saved_at >= interval:
+                save()
+                saved_at = time.monotonic()
+            if progress is not None:
+                progress(int(done.sum()), done.size, img)
+    except BaseException:
+        save()
+        raise
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return img, zbuf if depth else None
+
+
 @handle_called_process_error
 def rfluxmtx(
     receiver: str | Path,
     surface: None | str | Path = None,
-    rays: None | bytes = None,
+    rays: None | StreamInput = None,
     params: None | Sequence[str] = None,
     octree: None | Path | str = None,
     scene: None | Sequence[Path | str] = None,
-) -> bytes:
+    out: StreamOutput = None,
+    chunk_size: int = CHUNK_SIZE,
+    cache: None | MatrixCache = None,
+) -> bytes | str | np.ndarray:
     """Run rfluxmtx command.
 
     Args:
         receiver: receiver file path
         surface: input surface file path, mutually exclusive with rays
-        rays: input rays bytes, mutually exclusive with surface
+        rays: input rays as bytes, a file path, an array (e.g. np.memmap)
+            or an iterator of chunks, mutually exclusive with surface
         params: ray tracing parameters
         octree: octree file path
         scene: list of scene files
+        out: None to return bytes; a file path or binary file object to
+            stream the output to; or a preallocated array to read binary
+            output into, with header skipped.
+        chunk_size: size in bytes of each streamed read and write
+        cache: cache to reuse results from, keyed on the content of the
+            octree, scene, sender and receiver files, the parameters and
+            the rays. Not used when results go to files named in the
+            receiver or parameters.
 
     Returns:
-        The results of rfluxmtx in bytes
+        The results of rfluxmtx in bytes, or out if given
     """
     cmd = [str(BINPATH / "rfluxmtx")]
     if params:
@@ -866,7 +1462,18 @@ def rfluxmtx(
             cmd.extend(f'"{str(s)}"' for s in scene)
         else:
             cmd.extend(str(s) for s in scene)
-    return sp.run(cmd, check=True, stdout=sp.PIPE, input=rays).stdout
+    key = None
+    if cache is not None and "-o" not in cmd and not _RFLUX_OUTPUT.search(Path(receiver).read_text()):
+        key = cache.command_key(cmd, rays, out)
+    if key is not None and (result := cache.fetch(key, out)) is not None:
+        return result
+    if out is None and (rays is None or isinstance(rays, bytes)):
+        result = sp.run(cmd, check=True, stdout=sp.PIPE, input=rays).stdout
+    else:
+        result = stream_run(cmd, rays, out=out, chunk_size=chunk_size)
+    if key is not None:
+        cache.store(key, result, out)
+    return result
 
 
 # TODO: update to latest rmtxop interface
@@ -1010,15 +1617,11 @@ def rsensor(
     return sp.run(cmd, check=True, stdout=sp.PIPE).stdout
 
 
-@handle_called_process_error
 def strip_header(inp: bytes) -> bytes:
-    """Use getinfo to strip the header from a Radiance file."""
-    cmd = [str(BINPATH / "getinfo"), "-"]
-    if isinstance(inp, bytes):
-        stdin = inp
-    else:
+    """Strip the header from a Radiance file, as getinfo -."""
+    if not isinstance(inp, bytes):
         raise TypeError("Input must be bytes")
-    return sp.run(cmd, check=True, input=stdin, stdout=sp.PIPE).stdout
+    return inp[read_header(inp).header_end :]
 
 
 @handle_called_process_error
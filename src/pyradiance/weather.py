@@ -0,0 +1,249 @@
+"""
+Weather file reading and writing
+"""
+
+from dataclasses import dataclass, fields
+from pathlib import Path
+import os
+import tempfile
+
+import numpy as np
+
+# EPW data columns: index, missing value threshold
+_EPW_COLUMNS = {
+    "dew_point": (7, 99.9),
+    "ghi": (13, 9999.0),
+    "dni": (14, 9999.0),
+    "dhi": (15, 9999.0),
+    "ghi_illum": (16, 999900.0),
+    "dni_illum": (17, 999900.0),
+    "dhi_illum": (18, 999900.0),
+}
+
+
+@dataclass(slots=True)
+class Weather:
+    """Weather data as NumPy columns, with the site location.
+
+    Irradiances are in W/m2 and illuminances in lux; values the file does
+    not provide or marks as missing are NaN.
+
+    Attributes:
+        place: site name
+        latitude: degrees north
+        longitude: degrees west
+        timezone: standard meridian, degrees west
+        elevation: site elevation (m)
+        year: year of each record
+        month: month of each record
+        day: day of each record
+        hour: decimal hour at the middle of each interval, as gendaymtx reads it
+        dni: direct normal irradiance
+        dhi: diffuse horizontal irradiance
+        ghi: global horizontal irradiance
+        dni_illum: direct normal illuminance
+        dhi_illum: diffuse horizontal illuminance
+        ghi_illum: global horizontal illuminance
+        dew_point: dew point temperature (C)
+    """
+
+    place: str
+    latitude: float
+    longitude: float
+    timezone: float
+    elevation: float
+    year: np.ndarray
+    month: np.ndarray
+    day: np.ndarray
+    hour: np.ndarray
+    dni: np.ndarray
+    dhi: np.ndarray
+    ghi: np.ndarray
+    dni_illum: np.ndarray
+    dhi_illum: np.ndarray
+    ghi_illum: np.ndarray
+    dew_point: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.month)
+
+    @property
+    def times(self) -> np.ndarray:
+        """Local standard times of the records, datetime64[s]."""
+        months = (self.year - 1970) * 12 + self.month - 1
+        days = months.astype("datetime64[M]").astype("datetime64[D]") + (self.day - 1)
+        return days.astype("datetime64[s]") + np.round(self.hour * 3600).astype("timedelta64[s]")
+
+    def to_array(self, units: int = 1) -> np.ndarray:
+        """Records as WEA data lines.
+
+        Args:
+            units: 1 for direct normal and diffuse horizontal irradiance,
+                2 for direct and diffuse horizontal irradiance, 3 for direct
+                normal and diffuse horizontal illuminance
+        Returns:
+            ndarray: shape (nstep, 5) with month, day, hour and the two values,
+            as sky_matrix takes them; missing values are 0
+        """
+        if units == 1:
+            direct, diffuse = self.dni, self.dhi
+        elif units == 2:
+            direct, diffuse = self.ghi - self.dhi, self.dhi
+        elif units == 3:
+            direct, diffuse = self.dni_illum, self.dhi_illum
+        else:
+            raise ValueError("units must be 1, 2 or 3")
+        if np.isnan(direct).all() or np.isnan(diffuse).all():
+            raise ValueError(f"no data for WEA units {units}")
+        return np.column_stack(
+            [self.month, self.day, self.hour, np.nan_to_num(direct), np.nan_to_num(diffuse)]
+        )
+
+    def to_wea(self, units: int = 1) -> bytes:
+        """WEA file content, e.g., to feed gendaymtx through stdin.
+
+        Args:
+            units: WEA data units, see to_array()
+        Returns:
+            bytes
+        """
+        lines = [
+            f"place {self.place}",
+            f"latitude {self.latitude:g}",
+            f"longitude {self.longitude:g}",
+            f"time_zone {self.timezone:g}",
+            f"site_elevation {self.elevation:g}",
+            f"weather_data_file_units {units}",
+        ]
+        lines.extend(
+            f"{int(m)} {int(d)} {h:.3f} {v1:.6g} {v2:.6g}" for m, d, h, v1, v2 in self.to_array(units)
+        )
+        return ("\n".join(lines) + "\n").encode()
+
+
+def _read_wea(path: Path) -> Weather:
+    with open(path, "rb") as rdr:
+        header = [rdr.readline().decode().strip() for _ in range(6)]
+        keys = ("place", "latitude", "longitude", "time_zone", "site_elevation", "weather_data_file_units")
+        values = {}
+        for line, key in zip(header, keys):
+            if not line.startswith(key):
+                raise ValueError(f"{path}: missing {key} in WEA header")
+            values[key] = line[len(key) :].strip()
+        data = np.loadtxt(rdr, usecols=range(5), ndmin=2)
+    units = int(values["weather_data_file_units"])
+    nan = np.full(len(data), np.nan)
+    columns = dict.fromkeys(_EPW_COLUMNS, nan)
+    if units == 1:
+        columns.update(dni=data[:, 3], dhi=data[:, 4])
+    elif units == 2:
+        columns.update(ghi=data[:, 3] + data[:, 4], dhi=data[:, 4])
+    elif units == 3:
+        columns.update(dni_illum=data[:, 3], dhi_illum=data[:, 4])
+    else:
+        raise ValueError(f"{path}: bad WEA data units {units}")
+    return Weather(
+        place=values["place"],
+        latitude=float(values["latitude"]),
+        longitude=float(values["longitude"]),
+        timezone=float(values["time_zone"]),
+        elevation=float(values["site_elevation"]),
+        year=np.full(len(data), 2000),
+        month=data[:, 0].astype(int),
+        day=data[:, 1].astype(int),
+        hour=data[:, 2],
+        **columns,
+    )
+
+
+def _read_epw(path: Path) -> Weather:
+    with open(path, "rb") as rdr:
+        location = rdr.readline().decode().strip().split(",")
+        if location[0].upper() != "LOCATION" or len(location) < 10:
+            raise ValueError(f"{path}: not an EPW file")
+        nperhour = 1
+        for _ in range(7):
+            line = rdr.readline().decode()
+            if line.upper().startswith("DATA PERIODS,"):
+                nperhour = int(line.split(",")[2])
+        usecols = (0, 1, 2, 3, 4) + tuple(idx for idx, _ in _EPW_COLUMNS.values())
+        data = np.loadtxt(rdr, delimiter=",", usecols=usecols, ndmin=2)
+    columns = {}
+    for i, (name, (_, missing)) in enumerate(_EPW_COLUMNS.items()):
+        col = data[:, 5 + i]
+        columns[name] = np.where(col >= missing, np.nan, col)
+    # records are centered on their interval, as in gendaymtx; sub-hourly
+    # records carry the minute at the end of the interval
+    hour = data[:, 3] - 0.5 if nperhour == 1 else data[:, 3] - 1 + (data[:, 4] - 30 / nperhour) / 60
+    return Weather(
+        place=f"{location[1]}_{location[3]}",
+        latitude=float(location[6]),
+        longitude=-float(location[7]),
+        timezone=-15 * float(location[8]),
+        elevation=float(location[9]),
+        year=data[:, 0].astype(int),
+        month=data[:, 1].astype(int),
+        day=data[:, 2].astype(int),
+        hour=hour,
+        **columns,
+    )
+
+
+def _cache_path(path: Path) -> Path:
+    return path.with_name(f".{path.name}.npz")
+
+
+def _write_cache(npz: Path, stamp: np.ndarray, weather: Weather) -> None:
+    """Write the columnar copy; a read-only directory just means no cache."""
+    try:
+        fd, tmp = tempfile.mkstemp(dir=npz.parent, suffix=".npz")
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "wb") as wtr:
+            np.savez(wtr, _source=stamp, **{f.name: getattr(weather, f.name) for f in fields(Weather)})
+        os.replace(tmp, npz)
+    except OSError:
+        Path(tmp).unlink(missing_ok=True)
+
+
+def read_weather(path: str | Path, year: None | int = None, cache: bool = True) -> Weather:
+    """Read an EPW or WEA weather file into NumPy columns.
+
+    A binary columnar copy is kept next to the source as a hidden .npz
+    file and reused for as long as the source's modification time and
+    size are unchanged.
+
+    Args:
+        path: EPW or WEA file
+        year: year for all records; WEA files have none and default to 2000
+        cache: use and keep the columnar copy
+    Returns:
+        Weather
+    """
+    path = Path(path)
+    stat = path.stat()
+    stamp = np.array([stat.st_mtime_ns, stat.st_size])
+    npz = _cache_path(path)
+    weather = None
+    if cache and npz.exists():
+        try:
+            with np.load(npz, allow_pickle=False) as arrs:
+                if np.array_equal(arrs["_source"], stamp):
+                    weather = Weather(
+                        **{
+                            f.name: arrs[f.name] if arrs[f.name].ndim else arrs[f.name].item()
+                            for f in fields(Weather)
+                        }
+                    )
+        except (OSError, ValueError, KeyError):
+            weather = None
+    if weather is None:
+        with open(path, "rb") as rdr:
+            is_epw = rdr.read(9).upper() == b"LOCATION,"
+        weather = _read_epw(path) if is_epw else _read_wea(path)
+        if cache:
+            _write_cache(npz, stamp, weather)
+    if year is not None:
+        weather.year = np.full(len(weather), year)
+    return weather
@@ -1,8 +1,11 @@
 import os
+import tempfile
+import time
 import unittest
 from datetime import datetime
 from pathlib import Path
 
+import numpy as np
 import pyradiance as pr
 
 
@@ -159,6 +162,8 @@ class TestPyradianceAPI(unittest.TestCase):
     def test_parse_view(self):
         view = "-vta -vp 1 2 3 -vd 4 5 6 -vv 180 -vh 170"
         myview = pr.parse_view(view)
+        self.assertEqual(myview.vu, (0, 0, 1))
+        self.assertEqual((myview.hoff, myview.voff), (0, 0))
         self.assertEqual(myview.type, "a")
         self.assertEqual(myview.vp, (1, 2, 3))
         self.assertEqual(myview.vdir, (4, 5, 6))
@@ -276,10 +281,46 @@ class TestPyradianceCLI(unittest.TestCase):
         # shutil.rmtree("atmos_data")
 
     def test_gendaymtx(self):
-        pass
+        wea = b"place test\nlatitude 37.7\nlongitude 122.2\ntime_zone 120\n"
+        wea += b"site_elevation 0\nweather_data_file_units 1\n"
+        wea += b"".join(
+            b"3 21 %.1f %d %d\n" % (h + 0.5, 600 * (7 < h < 17), 100 * (6 < h < 18))
+            for h in range(24)
+        )
+        for kwargs in ({}, {"daylight_hours_only": True}, {"average": True}):
+            for outform in (None, "f", "d"):
+                serial = pr.gendaymtx(wea, outform=outform, **kwargs)
+                parallel = pr.gendaymtx(wea, outform=outform, nproc=3, **kwargs)
+                self.assertEqual(parallel, serial)
 
     def test_gensdaymtx(self):
-        pass
+        wea = b"place test\nlatitude 37.7\nlongitude 122.2\ntime_zone 120\n"
+        wea += b"site_elevation 0\nweather_data_file_units 3\n"
+        wea += b"".join(
+            b"3 21 %.1f %d %d\n" % (h + 0.5, 60000 * (7 < h < 17), 10000 * (6 < h < 18))
+            for h in range(24)
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # the atmosphere data computed by the first run are shared with the rest
+            for kwargs in ({"outform": "f"}, {"daylight_hours_only": True}):
+                calls = []
+                parallel = pr.gensdaymtx(
+                    wea, out_dir=tmpdir, nthreads=4, nproc=3, progress=lambda *a: calls.append(a), **kwargs
+                )
+                serial = pr.gensdaymtx(wea, out_dir=tmpdir, nthreads=4, **kwargs)
+                self.assertEqual(calls[-1], (24, 24))
+                self.assertEqual(parallel, serial)
+            self.assertEqual(pr.read_matrix(serial).shape[1], 12)
+            dts = [datetime(2022, 3, 21, h) for h in (9, 12, 15)]
+            # sky images go to out_dir
+            batch = pr.genssky_batch(dts, res=16, cloud_cover=[0.0, 0.5, 1.0], out_dir=tmpdir, out_name="batch", nproc=3)
+            for i, (dt, cover) in enumerate(zip(dts, (0.0, 0.5, 1.0))):
+                single = pr.genssky(dt, res=16, cloud_cover=cover, out_dir=tmpdir, out_name=f"single_{i}")
+                self.assertEqual(batch[i].replace(b"batch_", b"single_"), single)
+                np.testing.assert_array_equal(
+                    pr.read_hdr(os.path.join(tmpdir, f"batch_{i}_sky.hsr")),
+                    pr.read_hdr(os.path.join(tmpdir, f"single_{i}_sky.hsr")),
+                )
 
     def test_render(self):
         """Test the render function."""
@@ -304,10 +345,109 @@ class TestPyradianceCLI(unittest.TestCase):
             ambcache=True,
             resolution=(800, 800),
         )
+        self.assertEqual(pr.read_header(img).dimensions, (800, 800))
+        # a non-square view, assembled in parallel against rpict
+        pview = pr.create_default_view()
+        pview.vp = (1, 2, 1)
+        pview.vdir = (0, -1, 0)
+        pview.horiz = 60
+        pview.vert = 40
+        kwargs = {"view": pview, "quality": "low", "ambbounce": 1, "resolution": (120, 120)}
+        parallel = pr.render(scene, nproc=4, **kwargs)
+        serial = pr.render(scene, nproc=1, **kwargs)
+        pinfo, sinfo = pr.read_header(parallel), pr.read_header(serial)
+        self.assertEqual(pinfo.dimensions, (120, 76))
+        self.assertEqual(pinfo.dimensions, sinfo.dimensions)
+        pv, sv = pr.parse_view(pinfo.view), pr.parse_view(sinfo.view)
+        for attr in ("type", "vp", "vdir", "horiz", "vert"):
+            self.assertEqual(getattr(pv, attr), getattr(sv, attr))
+        pimg, simg = pr.read_hdr(parallel), pr.read_hdr(serial)
+        self.assertEqual(pimg.shape, (76, 120, 3))
+        self.assertEqual(pimg.shape, simg.shape)
+        np.testing.assert_allclose(pimg.mean(axis=(0, 1)), simg.mean(axis=(0, 1)), rtol=0.1)
+        # rows are in the same order in both
+        np.testing.assert_allclose(pimg[:38].mean(), simg[:38].mean(), rtol=0.1)
+        np.testing.assert_allclose(pimg[38:].mean(), simg[38:].mean(), rtol=0.1)
         os.remove(scene.octree)
         os.remove(scene._moctree)
         os.remove(f"{scene.sid}.amb")
-        
+
+    def test_render_views(self):
+        aview = pr.create_default_view()
+        aview.vp = (1, 2, 1)
+        aview.vdir = (0, -1, 0)
+        scene = pr.Scene("test_views", surfaces=[self.floor, self.ceiling], materials=[self.material])
+        scene.add_source(self.source)
+        scene.add_view(aview)
+        views = [aview, "-vtv -vp 1 1 1 -vd 1 0 0 -vh 45 -vv 45".split(), "-vtv -vp 9 9 1 -vd 0 1 0".split()]
+        params = ["-ab", "0", "-ps", "1", "-pj", "0"]
+        imgs = pr.render_views(scene, views, 64, 64, params=params, nproc=2)
+        for view, img in zip(views, imgs):
+            vargs = pr.get_view_args(view) if isinstance(view, pr.View) else view
+            ref = pr.read_hdr(pr.rpict(vargs, scene.octree, xres=64, yres=64, params=params))
+            np.testing.assert_array_equal(img, ref)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = pr.render_views(scene, xres=32, yres=32, params=params, out=tmpdir)
+            self.assertEqual(paths, [os.path.join(tmpdir, "test_views_0.hdr")])
+            self.assertEqual(pr.get_image_dimensions(paths[0]), (32, 32))
+        os.remove(scene.octree)
+        os.remove(scene._moctree)
+
+    def test_render_tiles(self):
+        octree = os.path.join(self.resources_dir, "trace.oct")
+        view = "-vtv -vp 20 20 1.5 -vd 1 0.3 0 -vu 0 0 1 -vh 60 -vv 45".split()
+        params = ["-ab", "0", "-ps", "1", "-pj", "0"]
+        ref = pr.read_hdr(pr.rpict(view, octree, xres=120, yres=120, params=params))
+        pic = pr.render_tiles(view, octree, 120, 120, tiles=(3, 2), params=params, nproc=2)
+        np.testing.assert_array_equal(pr.read_hdr(pic), ref)
+        self.assertEqual(pr.read_header(pic).view, " ".join(view))
+        # view options left out take the standard defaults
+        view = "-vtv -vp 20 20 1.5 -vd 1 0.3 0 -vh 60".split()
+        ref = pr.read_hdr(pr.rpict(view, octree, xres=120, yres=120, params=params))
+        pic = pr.render_tiles(view, octree, 120, 120, tiles=(3, 2), params=params, nproc=2)
+        np.testing.assert_array_equal(pr.read_hdr(pic), ref)
+
+    def test_render_progressive(self):
+        octree = os.path.join(self.resources_dir, "trace.oct")
+        view = "-vtv -vp 20 20 1.5 -vd 1 0.3 0 -vu 0 0 1 -vh 60 -vv 45".split()
+        params = ["-ab", "1", "-aa", "0", "-ad", "32"]
+        ref = pr.read_hdr(pr.rpict(view, octree, xres=64, yres=64, params=[*params, "-ps", "1"]))
+        passes = []
+
+        def progress(img, err, npass):
+            self.assertEqual(img.shape, ref.shape)
+            passes.append((npass, bool(np.isfinite(err).all())))
+
+        pic = pr.render_progressive(view, octree, 64, 64, params=params, max_samples=8, progress=progress, seed=0)
+        img = pr.read_hdr(pic)
+        self.assertEqual(img.shape, ref.shape)
+        self.assertAlmostEqual(img.mean() / ref.mean(), 1, delta=0.02)
+        # every 8th, 4th, 2nd pixel and then all, before the error is known everywhere
+        self.assertEqual(passes[:5], [(1, False), (2, False), (3, False), (4, False), (5, True)])
+        # stopped by the callback
+        pic = pr.render_progressive(view, octree, 64, 64, params=params, progress=lambda *_: True)
+        self.assertEqual(pr.read_hdr(pic).shape, ref.shape)
+        # time a first pass on every other pixel, then allow for twice that: the
+        # second pass, three times as long, is cut with no pixel left unfilled
+        params = ["-ab", "1", "-aa", "0", "-ad", "16"]
+        start = time.monotonic()
+        pic = pr.render_progressive(view, octree, 240, 240, params=params, stride=2, progress=lambda *_: True)
+        budget = 2 * (time.monotonic() - start)
+        first = pr.read_hdr(pic)
+        start = time.monotonic()
+        pic = pr.render_progressive(view, octree, 240, 240, params=params, stride=2, time_budget=budget, seed=0)
+        self.assertLess(time.monotonic() - start, 1.5 * budget)
+        self.assertAlmostEqual(pr.read_hdr(pic).mean() / first.mean(), 1, delta=0.05)
+        # a budget that ends partway through the first pass, leaving pixels
+        # without a sample; any later pass narrows the pixels of unknown error
+        unknown = []
+        pic = pr.render_progressive(
+            view, octree, 400, 400, params=params, stride=1, time_budget=0.05, seed=0,
+            progress=lambda img, err, npass: unknown.append(int(np.isinf(err).sum())),
+        )
+        self.assertGreater((pr.read_hdr(pic).sum(axis=2) == 0).mean(), 0.1)
+        self.assertEqual(unknown, sorted(set(unknown), reverse=True))
+
     def test_pextrem(self):
         """Test the pextrem function."""
         hdr = os.path.join(self.resources_dir, "test.hdr")
@@ -348,6 +488,29 @@ class TestPyradianceCLI(unittest.TestCase):
         # based on original version, max_pt = (209,272, 742.0,718.0, 646.0)
         self.assertEqual(max_pt3, (209, 272, 583.0, 564.0, 508.0))
 
+    def test_header(self):
+        hdr = os.path.join(self.resources_dir, "test.hdr")
+        info = pr.read_header(hdr)
+        self.assertEqual(info.fmt, "32-bit_rle_rgbe")
+        self.assertEqual(info.resolution, ("-Y+X", 544, 544))
+        self.assertAlmostEqual(info.exposure, 742 / 583, places=2)
+        self.assertEqual(pr.get_image_dimensions(hdr), (544, 544))
+        self.assertEqual(pr.get_header(hdr, dimension=True), f"{hdr}: -Y 544 +X 544\n".encode())
+        with open(hdr, "rb") as f:
+            data = f.read()
+        self.assertEqual(pr.get_header(data), data[: info.header_end])
+        self.assertEqual(pr.util.strip_header(data), data[info.header_end :])
+        self.assertEqual(pr.edit_header(data, strip=True), data[info.header_end :])
+        edited = pr.edit_header(data, append=["VIEW= -vh 90"], replace=["EXPOSURE=1"])
+        self.assertTrue(edited.endswith(data[info.header_end :]))
+        info2 = pr.read_header(edited)
+        self.assertEqual(info2.exposure, 1)
+        self.assertTrue(info2.view.endswith("-vh 90"))
+        self.assertEqual(info2.lines[-1], "FORMAT=32-bit_rle_rgbe")
+        edited = pr.edit_header(data, replace=["FORMAT=32-bit_rle_xyze"])
+        lines = pr.read_header(edited).lines
+        self.assertEqual([ln for ln in lines if ln.startswith("FORMAT=")], ["FORMAT=32-bit_rle_xyze"])
+
     def test_rfluxmtx(self):
         """Test the rfluxmtx function."""
         receiver = os.path.join(self.resources_dir, "skyr4.rad")
@@ -360,6 +523,20 @@ class TestPyradianceCLI(unittest.TestCase):
         result = pr.rfluxmtx(receiver, rays=rays, scene=scene)
         self.assertGreater(len(result), 0)
 
+    def test_rfluxmtx_stream(self):
+        """Test streaming rays into rfluxmtx and output into an array."""
+        receiver = os.path.join(self.resources_dir, "skyr4.rad")
+        scene = (
+            self.material,
+            self.floor,
+            self.ceiling,
+        )
+        rays = (b"1.0 1 1 0 0 1\n" for _ in range(2))
+        # ground + 2305 Reinhart MF:4 patches
+        out = np.full((2, 2306, 3), np.nan, dtype=np.float32)
+        pr.rfluxmtx(receiver, rays=rays, params=["-faf"], scene=scene, out=out)
+        self.assertTrue(np.isfinite(out).all())
+
     def test_ra_tiff(self):
         """Test the ra_tiff function."""
         hdr = os.path.join(self.resources_dir, "test.hdr")
@@ -1,6 +1,7 @@
 import os
 import unittest
 
+import pyradiance as pr
 from pyradiance import bsdf
 
 
@@ -17,6 +18,19 @@ class TestBSDF(unittest.TestCase):
         _sv = bsdf.query(sddata, 0, 0, 180, 0)
         self.assertAlmostEqual(_sv[1], 4.9971852)
 
+    def test_load_klems(self):
+        path = os.path.join(
+            os.path.dirname(__file__), "..", "docs", "assets", "sample_files",
+            "room", "matrices", "tmtx", "clear.xml",
+        )
+        klems = pr.load_klems(path)
+        self.assertIs(pr.load_klems(path), klems)
+        self.assertEqual(klems.tb.shape, (145, 145, 3))
+        self.assertEqual(klems.bases["tb"], ("LBNL/Klems Full", "LBNL/Klems Full"))
+        self.assertAlmostEqual(klems.lambdas["tb"].sum(), 3.14159, places=4)
+        # normal incidence transmittance of clear glass
+        self.assertAlmostEqual(klems.tb[:, 0, 1].sum(), 0.8974, places=3)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,45 @@
+import tempfile
+import unittest
+
+import numpy as np
+import pyradiance as pr
+
+
+class TestMatrixCache(unittest.TestCase):
+    def test_lru(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = pr.MatrixCache(tmpdir, max_size=250)
+            key = cache.command_key(["rfluxmtx", "-ab", "1"], b"0 0 0 0 0 1\n")
+            self.assertIsNone(cache.fetch(key))
+            self.assertIsNone(cache.command_key(["rfluxmtx"], iter([b""])))
+            cache.store(key, b"a" * 100)
+            self.assertEqual(cache.fetch(key), b"a" * 100)
+            cache.store("array", None, np.arange(25, dtype=np.float32))
+            cache.get(key)
+            cache.put("last", b"c" * 100)
+            self.assertIsNone(cache.get("array"))
+            self.assertEqual(cache.size, 200)
+            out = np.empty(25, dtype=np.float32)
+            cache.put("array", np.arange(25, dtype=np.float32))
+            np.testing.assert_array_equal(cache.fetch("array", out), np.arange(25))
+            # an entry larger or smaller than out is a miss, not a truncated hit
+            self.assertIsNone(cache.fetch("array", np.empty(20, dtype=np.float32)))
+            self.assertIsNone(cache.fetch("array", np.empty(30, dtype=np.float32)))
+
+    def test_arrays(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = pr.MatrixCache(tmpdir, max_age=3600)
+            weather = np.array([[3, 21, 12.5, 800.0, 120.0], [3, 21, 13.5, 700.0, 130.0]])
+            smx = pr.sky_matrix(weather, 37.7, 122.2, 120, cache=cache)
+            hit = pr.sky_matrix(weather, 37.7, 122.2, 120, cache=cache)
+            self.assertIsInstance(hit, np.memmap)
+            np.testing.assert_array_equal(hit, smx)
+            self.assertNotIsInstance(pr.sky_matrix(weather, 37.7, 122.2, 120, mfactor=2, cache=cache), np.memmap)
+            cache.max_age = 0
+            self.assertIsNone(cache.load(cache.key("missing")))
+            cache.evict()
+            self.assertEqual(cache.size, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pyradiance as pr
+
+
+class TestMatrix(unittest.TestCase):
+    resources_dir = os.path.join(os.path.dirname(__file__), "Resources")
+
+    def test_roundtrip(self):
+        mtx = np.random.default_rng(0).random((5, 20, 3)).astype(np.float32)
+        for outform, tol in (("a", 1e-6), ("f", 0), ("d", 0), ("c", 1e-2)):
+            data = pr.write_matrix(mtx, outform=outform)
+            np.testing.assert_allclose(pr.read_matrix(data), mtx, atol=tol)
+
+    def test_memmap(self):
+        mtx = np.arange(24, dtype=np.float32).reshape(2, 4, 3)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = pr.write_matrix(mtx, os.path.join(tmpdir, "test.mtx"))
+            hdr = pr.read_matrix_header(path)
+            self.assertEqual((hdr.nrows, hdr.ncols, hdr.ncomp), (2, 4, 3))
+            self.assertEqual(hdr.offset % 4, 0)
+            data = pr.read_matrix(path)
+            self.assertIsInstance(data, np.memmap)
+            np.testing.assert_array_equal(data, mtx)
+            del data
+
+    def test_read_rle(self):
+        hdr = pr.read_matrix_header(os.path.join(self.resources_dir, "test.hdr"))
+        self.assertEqual(hdr.fmt, "32-bit_rle_rgbe")
+        data = pr.read_matrix(os.path.join(self.resources_dir, "test.hdr"))
+        self.assertEqual(data.shape, (hdr.nrows, hdr.ncols, 3))
+        self.assertTrue(np.isfinite(data).all())
+
+    def test_dctimestep_array(self):
+        rng = np.random.default_rng(0)
+        vmx, tmx, dmx = rng.random((6, 4, 3)), rng.random((4, 5, 3)), rng.random((5, 7, 3))
+        sky = rng.random((7, 10, 3))
+        expected = np.einsum("ijc,jkc,klc,lmc->imc", vmx, tmx, dmx, sky)
+        result = pr.dctimestep_array(vmx, tmx, dmx, sky, chunk_steps=3, nproc=2)
+        np.testing.assert_allclose(result, expected, rtol=1e-6)
+        result = pr.dctimestep_array(dmx, pr.write_matrix(sky), nstep=4)
+        np.testing.assert_allclose(result, np.einsum("ijc,jkc->ikc", dmx, sky[:, :4]), rtol=1e-5)
+
+    def test_matrix_expr(self):
+        rng = np.random.default_rng(0)
+        vmx, tmx, dmx = rng.random((50, 4, 3)), rng.random((4, 5, 3)), rng.random((5, 7, 3))
+        expr = (pr.MatrixExpr(vmx) @ tmx @ pr.write_matrix(dmx)).T * 2
+        self.assertEqual(expr.shape, (7, 50, 3))
+        expected = np.einsum("ijc,jkc,klc->lic", vmx, tmx, dmx) * 2
+        np.testing.assert_allclose(expr.evaluate(), expected, rtol=1e-5)
+        result = expr.transform([0.2, 0.7, 0.1]).evaluate()
+        np.testing.assert_allclose(result[..., 0], expected @ [0.2, 0.7, 0.1], rtol=1e-5)
+        np.testing.assert_allclose((tmx + pr.MatrixExpr(tmx)).evaluate(), tmx * 2)
+        np.testing.assert_allclose((tmx / pr.MatrixExpr(tmx + 1)).evaluate(), tmx / (tmx + 1))
+        with self.assertRaises(TypeError):
+            1 / pr.MatrixExpr(tmx)
+
+    def test_tiled_matmul(self):
+        rng = np.random.default_rng(0)
+        left, right = rng.random((30, 6, 3)), rng.random((6, 40, 3))
+        expected = np.einsum("ijc,jkc->ikc", left, right)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "result.mtx")
+            result = pr.tiled_matmul(left, right, out=path, memory=20000, nproc=2)
+            np.testing.assert_allclose(result, expected, rtol=1e-5)
+            np.testing.assert_allclose(pr.read_matrix(path), expected, rtol=1e-5)
+            del result
+
+    def test_collate_and_transform(self):
+        mtx = np.arange(24, dtype=np.float32).reshape(2, 4, 3)
+        collated = pr.rcollate_array(mtx, transpose=True)
+        self.assertTrue(np.shares_memory(collated, mtx))
+        self.assertEqual(collated.shape, (4, 2, 3))
+        self.assertEqual(pr.rcollate_array(mtx, ocols=2).shape, (4, 2, 3))
+        lum = pr.transform_components(np.ones((1, 1, 3)), "Y")
+        self.assertAlmostEqual(float(lum[0, 0, 0]), 179, places=4)
+        np.testing.assert_allclose(pr.rgb2xyz_matrix() @ np.ones(3), [1, 1, 1], rtol=1e-6)
+        np.testing.assert_allclose(pr.rcomb_array(mtx, mtx, scale=0.5), mtx)
+
+
+if __name__ == "__main__":
+    unittest.main()
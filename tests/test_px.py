@@ -0,0 +1,76 @@
+import os
+import unittest
+
+import numpy as np
+import pyradiance as pr
+
+
+class TestPicture(unittest.TestCase):
+    resources_dir = os.path.join(os.path.dirname(__file__), "Resources")
+
+    def test_read_hdr(self):
+        path = os.path.join(self.resources_dir, "test.hdr")
+        img = pr.read_hdr(path)
+        self.assertEqual(img.shape, (544, 544, 3))
+        self.assertEqual(img.dtype, np.float32)
+        # pextrem reports pixels from the bottom left: max at (209, 272)
+        np.testing.assert_allclose(img[544 - 1 - 272, 209], (742, 718, 646), rtol=2e-3)
+        original = pr.read_hdr(open(path, "rb").read(), original=True)
+        np.testing.assert_allclose(original[544 - 1 - 272, 209], (583, 564, 508), rtol=2e-3)
+        # no FORMAT line, read as RGBE
+        noformat = pr.edit_header(path, replace=["FORMAT"])
+        self.assertIsNone(pr.read_header(noformat).fmt)
+        np.testing.assert_array_equal(pr.read_hdr(noformat), img)
+        # old-style runs: a marker repeats the last pixel, the next one adds a higher count byte
+        pixels = [[100, 50, 25, 129], [1, 1, 1, 2], [1, 1, 1, 0], [10, 20, 30, 128], [1, 1, 1, 1], [1, 1, 1, 1]]
+        old = pr.read_hdr(b"#?RADIANCE\nFORMAT=32-bit_rle_rgbe\n\n-Y 2 +X 130\n" + bytes(sum(pixels, [])))
+        self.assertEqual(old.shape, (2, 130, 3))
+        first, second = np.array([100.5, 50.5, 25.5]) / 128, np.array([10.5, 20.5, 30.5]) / 256
+        np.testing.assert_array_equal(old[0, :3], [first] * 3)
+        np.testing.assert_array_equal(old[0, 3:], [second] * 127)
+        np.testing.assert_array_equal(old[1], [second] * 130)
+
+    def test_write_hdr(self):
+        img = pr.read_hdr(os.path.join(self.resources_dir, "test.hdr"))
+        pic = pr.write_hdr(img, view=["-vtv", "-vp", "0", "0", "1"], exposure=0.5, nthreads=3)
+        self.assertIn(b"VIEW= -vtv -vp 0 0 1\n", pic)
+        hdr = pr.read_matrix_header(pic)
+        self.assertEqual((hdr.nrows, hdr.ncols), img.shape[:2])
+        # RLE is lossless on already quantized values
+        np.testing.assert_array_equal(pr.read_hdr(pic), img)
+        np.testing.assert_array_equal(pr.read_hdr(pic, original=True), img * 2)
+        self.assertEqual(pr.write_hdr(img, nthreads=0), pr.write_hdr(img))
+
+    def test_pfilt_array(self):
+        img = np.random.default_rng(0).random((40, 60, 3)).astype(np.float32)
+        out, exposure = pr.pfilt_array(img, "/2", 10, exposure="+1", one_pass=True, nthreads=3)
+        self.assertEqual(exposure, 2)
+        np.testing.assert_allclose(out, img.reshape(10, 4, 30, 2, 3).mean(axis=(1, 3)) * 2, rtol=1e-6)
+        out, exposure = pr.pfilt_array(img, "/4", "/4", gaussian_filter_radius=0.6)
+        self.assertEqual(out.shape, (10, 15, 3))
+        # the average brightness goes to 0.5
+        self.assertAlmostEqual(float(img.mean()) * exposure, 0.5, places=2)
+        self.assertAlmostEqual(float(out.mean()), 0.5, places=2)
+
+    def test_filter_hdr(self):
+        path = os.path.join(self.resources_dir, "test.hdr")
+        pic = pr.filter_hdr(path, xres="/2", yres=100, exposure=0.5, one_pass=True, nthreads=2)
+        hdr = pr.read_header(pic)
+        self.assertEqual(hdr.dimensions, (272, 100))
+        self.assertIn("PIXASPECT=2.720000", hdr.lines)
+        # the applied exposure adds to the picture's own
+        self.assertAlmostEqual(hdr.exposure, pr.read_header(path).exposure * 0.5)
+        np.testing.assert_allclose(
+            pr.read_hdr(pic, original=True).mean(), pr.read_hdr(path, original=True).mean(), rtol=0.01
+        )
+        # no FORMAT line, filtered as RGBE
+        pic = pr.filter_hdr(pr.edit_header(path, replace=["FORMAT"]), xres="/2", yres="/2", one_pass=True)
+        self.assertEqual(pr.read_header(pic).fmt, "32-bit_rle_rgbe")
+        spectral = b"#?RADIANCE\nNCOMP=5\nFORMAT=Radiance_spectra\n\n-Y 2 +X 2\n" + bytes(24)
+        self.assertEqual(pr.read_hdr(spectral).shape, (2, 2, 5))
+        with self.assertRaisesRegex(ValueError, "spectral"):
+            pr.filter_hdr(spectral)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 import unittest
 
 import numpy as np
@@ -74,5 +75,115 @@ class TestRtraceSimulManager(unittest.TestCase):
         self.assertEqual(len(result), 4)
 
 
+class TestRpictSimulManager(unittest.TestCase):
+    octree = os.path.join(os.path.dirname(__file__), "Resources", "trace.oct")
+
+    @unittest.skipIf(os.name == "nt", "test not supported on Windows")
+    def test_render(self):
+        rparam = pr.get_ray_params()
+        rparam.ab = 0
+        pr.set_ray_params(rparam)
+        view = pr.parse_view("-vtv -vp 20 20 1.5 -vd 1 0.3 0 -vu 0 0 1 -vh 60 -vv 45")
+        mgr = pr.RpictSimulManager()
+        mgr.load_octree(self.octree)
+        done = []
+        img, depth = mgr.render(
+            view, 100, 100, tiles=(2, 2), nthreads=1,
+            progress=lambda ndone, total, _: done.append((ndone, total)),
+        )
+        self.assertEqual(done, [(1, 4), (2, 4), (3, 4), (4, 4)])
+        self.assertEqual(img.shape, (*depth.shape, 3))
+        self.assertEqual(img.shape[1], 100)
+        ref = pr.read_hdr(
+            pr.rpict(pr.get_view_args(view), self.octree, xres=100, yres=100, params=["-ab", "0"])
+        )
+        self.assertAlmostEqual(img.mean() / ref.mean(), 1, places=1)
+        # the top right tile of the grid
+        tile = np.zeros((mgr.t_height(), mgr.t_width(), 3), dtype=np.float32)
+        self.assertTrue(mgr.render_tile(tile, tile=(1, 1)))
+        self.assertAlmostEqual(tile.mean() / img[: tile.shape[0], tile.shape[1] :].mean(), 1, places=1)
+        with self.assertRaises(ValueError):
+            mgr.render_tile(tile, tile=(2, 0))
+
+    @unittest.skipIf(os.name == "nt", "test not supported on Windows")
+    def test_render_resumable(self):
+        rparam = pr.get_ray_params()
+        rparam.ab = 0
+        pr.set_ray_params(rparam)
+        view = pr.parse_view("-vtv -vp 20 20 1.5 -vd 1 0.3 0 -vu 0 0 1 -vh 60 -vv 45")
+        mgr = pr.RpictSimulManager()
+        mgr.load_octree(self.octree)
+        partial = []
+
+        def interrupt(ndone, total, img):
+            if ndone == 2:
+                partial.append(img.copy())
+                raise KeyboardInterrupt
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            checkpoint = os.path.join(tmpdir, "frame.npz")
+            with self.assertRaises(KeyboardInterrupt):
+                pr.render_resumable(
+                    mgr, self.octree, view, checkpoint, 100, 100, tiles=(2, 3), interval=3600, nthreads=1,
+                    progress=interrupt,
+                )
+            self.assertTrue(os.path.exists(checkpoint))
+            # not resumed with other ray parameters
+            rparam.ab = 1
+            pr.set_ray_params(rparam)
+            with self.assertRaisesRegex(ValueError, "params"):
+                pr.render_resumable(mgr, self.octree, view, checkpoint, 100, 100, tiles=(2, 3), nthreads=1)
+            rparam.ab = 0
+            pr.set_ray_params(rparam)
+            done = []
+            img, depth = pr.render_resumable(
+                mgr, self.octree, view, checkpoint, 100, 100, tiles=(2, 3), nthreads=1,
+                progress=lambda ndone, total, _: done.append((ndone, total)),
+            )
+            self.assertFalse(os.path.exists(checkpoint))
+        self.assertEqual(done, [(3, 6), (4, 6), (5, 6), (6, 6)])
+        self.assertEqual(img.shape, (*depth.shape, 3))
+        # the top row of tiles comes from the checkpoint
+        np.testing.assert_array_equal(img[: mgr.t_height()], partial[0][: mgr.t_height()])
+        ref, _ = mgr.render(view, 100, 100, depth=False, tiles=(2, 3), nthreads=1)
+        self.assertAlmostEqual(img.mean() / ref.mean(), 1, places=1)
+
+    @unittest.skipIf(os.name == "nt", "test not supported on Windows")
+    def test_resume_frame(self):
+        rparam = pr.get_ray_params()
+        rparam.ab = 0
+        pr.set_ray_params(rparam)
+        view = pr.parse_view("-vtv -vp 20 20 1.5 -vd 1 0.3 0 -vu 0 0 1 -vh 60 -vv 45")
+        mgr = pr.RpictSimulManager()
+        mgr.load_octree(self.octree)
+        mgr.set_thread_count(1)
+        dtype = pr.RenderDataType.RDTrgb | pr.RenderDataType.RDTdfloat
+        with tempfile.TemporaryDirectory() as tmpdir:
+            full, part = os.path.join(tmpdir, "full.hdr"), os.path.join(tmpdir, "part.hdr")
+            pdepth = os.path.join(tmpdir, "part.dpt")
+            width, height = mgr.new_frame(view, 60, 60)
+            self.assertTrue(mgr.render_frame(full, dtype, os.path.join(tmpdir, "full.dpt")))
+            # the depth type defaults to float when only a depth file is given
+            mgr.new_frame(view, 60, 60)
+            self.assertTrue(mgr.render_frame(part, pr.RenderDataType.RDTrgb, pdepth))
+            # cut the picture and the headerless depth file at the same scanline
+            nrows = height // 3
+            before, zbefore = np.array(pr.read_matrix(part)), np.fromfile(pdepth, dtype=np.float32)
+            os.truncate(part, pr.read_header(part).offset + nrows * width * 3 * 4)
+            os.truncate(pdepth, nrows * width * 4)
+            self.assertTrue(mgr.resume_frame(part, pdepth))
+            ref, after = pr.read_matrix(full), pr.read_matrix(part)
+            self.assertEqual(after.shape, (height, width, 3))
+            # pixels are jittered, so the rows rendered again only match on average
+            np.testing.assert_array_equal(after[:nrows], before[:nrows])
+            self.assertAlmostEqual(after[nrows:].mean() / ref[nrows:].mean(), 1, delta=0.02)
+            zref = np.fromfile(os.path.join(tmpdir, "full.dpt"), dtype=np.float32)
+            zafter = np.fromfile(pdepth, dtype=np.float32)
+            self.assertEqual(zafter.size, width * height)
+            np.testing.assert_array_equal(zafter[: nrows * width], zbefore[: nrows * width])
+            self.assertAlmostEqual(zafter.mean() / zref.mean(), 1, delta=0.02)
+            del ref, after
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+import pyradiance as pr
+
+
+class TestSky(unittest.TestCase):
+    weather = np.array([[3, 21, 12.5, 800.0, 120.0], [3, 21, 23.5, 0.0, 0.0]])
+
+    def test_solar_position(self):
+        times = np.array(["2023-03-21T10:30", "2023-06-21T12:00"], dtype="datetime64")
+        sun = pr.solar_position(times, 37.7, 122.2, 120)
+        # gensky 3 21 10:30 -a 37.7 -o 122.2 -m 120
+        self.assertAlmostEqual(sun.altitude[0], 44.7, places=1)
+        self.assertAlmostEqual(sun.azimuth[0], -39.0, places=1)
+        self.assertEqual(sun.direction.shape, (2, 3))
+        np.testing.assert_allclose(np.linalg.norm(sun.direction, axis=-1), 1.0)
+        sites = pr.solar_position(times, np.array([[0.0], [37.7]]), 122.2, 120)
+        self.assertEqual(sites.altitude.shape, (2, 2))
+        self.assertAlmostEqual(sites.altitude[1, 0], sun.altitude[0])
+
+    def test_reinhart_patches(self):
+        alt, _, dom = pr.reinhart_patches(2)
+        self.assertEqual(len(alt), 578)
+        self.assertAlmostEqual(dom[1:].sum(), 2 * np.pi, places=4)
+
+    def test_sky_matrix(self):
+        smx = pr.sky_matrix(
+            self.weather, 37.7, 122.2, 120, sky_only=True,
+            solar_radiance=True, sky_color=[1, 1, 1],
+        )
+        self.assertEqual(smx.shape, (146, 2, 3))
+        self.assertEqual(smx.dtype, np.float32)
+        alt, _, dom = pr.reinhart_patches()
+        # sky patches integrate to the diffuse horizontal irradiance
+        diffuse = (smx[1:, 0, 1] * np.sin(alt[1:]) * dom[1:]).sum()
+        self.assertAlmostEqual(diffuse, 120.0, places=2)
+        self.assertFalse(smx[:, 1].any())
+
+    def test_sun_matrix(self):
+        smx = pr.sky_matrix(
+            self.weather, 37.7, 122.2, 120, mfactor=6, sun_only=True,
+            onesun=True, solar_radiance=True,
+        )
+        sun_sa = np.pi * np.radians(0.533 / 2) ** 2
+        self.assertEqual(np.count_nonzero(smx[:, 0, 0]), 1)
+        self.assertAlmostEqual(smx[:, 0, 0].sum() * sun_sa, 800.0, places=2)
+
+    def test_perez_skies(self):
+        times = np.array(["2023-03-21T10:30", "2023-03-21T23:30"], dtype="datetime64")
+        skies = pr.perez_skies(times, 37.7, 122.2, 120, dirnorm=[600, 0], diffhor=[150, 0])
+        # gendaylit 3 21 10.5 -a 37.7 -o 122.2 -m 120 -W 600 150
+        self.assertAlmostEqual(skies.clearness[0], 3.6414, places=4)
+        self.assertAlmostEqual(skies.solar_radiance[0], 4.913e6, delta=1e3)
+        np.testing.assert_allclose(
+            skies.coefficients[0], [-0.978387, -0.316319, 13.028073, -3.459523, 0.237732], atol=1e-6
+        )
+        self.assertEqual(skies.valid.tolist(), [True, False])
+        desc = skies.descriptions()
+        self.assertIn(b"10 4.067e+01 2.031e+01 -0.978387", desc[0])
+        self.assertIn(b"10 0.00 0.00  0.000", desc[1])
+
+    def test_cie_skies(self):
+        skies = pr.cie_skies(altitude=[40, 10], azimuth=-20, sky_type="intermediate")
+        # gensky -ang 40 -20 +i
+        self.assertAlmostEqual(skies.zenith_brightness[0], 18.08, places=2)
+        self.assertAlmostEqual(skies.ground_brightness[0], 6.922, places=3)
+        self.assertIn(b"7 4 1.808e+01 6.922e+00 9.860e-01 0.262003 -0.719846 0.642788", skies.descriptions()[0])
+        overcast = pr.cie_skies(altitude=[40, 10], azimuth=-20, sky_type="overcast")
+        self.assertFalse(overcast.solar_radiance.any())
+
+
+if __name__ == "__main__":
+    unittest.main()
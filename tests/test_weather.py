@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pyradiance as pr
+
+EPW = """LOCATION,Oakland,CA,USA,TMY3,724930,37.72,-122.22,-8.0,2.0
+DESIGN CONDITIONS,0
+TYPICAL/EXTREME PERIODS,0
+GROUND TEMPERATURES,0
+HOLIDAYS/DAYLIGHT SAVINGS,No,0,0,0
+COMMENTS 1,
+COMMENTS 2,
+DATA PERIODS,1,1,Data,Sunday, 1/ 1,12/31
+1999,3,21,11,0,?9?9,12.0,6.1,67,101500,1187,1367,331,512,600,150,55900,62400,17600,2930,290,4.1,3,2,16.1,77777,9,999999999,0,0.1,0,88,0.0,0.0,0.0
+1999,3,21,12,0,?9?9,13.0,99.9,67,101500,1187,1367,331,9999,9999,9999,999999,999999,999999,2930,290,4.1,3,2,16.1,77777,9,999999999,0,0.1,0,88,0.0,0.0,0.0
+"""
+
+
+class TestWeather(unittest.TestCase):
+    def test_read_weather(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "oakland.epw")
+            with open(path, "w") as wtr:
+                wtr.write(EPW)
+            weather = pr.read_weather(path)
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, ".oakland.epw.npz")))
+            self.assertEqual(weather.place, "Oakland_USA")
+            self.assertEqual((weather.longitude, weather.timezone), (122.22, 120.0))
+            self.assertEqual(weather.times[0], np.datetime64("1999-03-21T10:30"))
+            self.assertEqual(weather.dni[0], 600)
+            self.assertTrue(np.isnan(weather.dni[1]) and np.isnan(weather.dew_point[1]))
+            cached = pr.read_weather(path, year=2023)
+            np.testing.assert_array_equal(cached.ghi_illum, weather.ghi_illum)
+            self.assertEqual(cached.times[1], np.datetime64("2023-03-21T11:30"))
+            wea = weather.to_wea()
+            self.assertTrue(wea.endswith(b"3 21 10.500 600 150\n3 21 11.500 0 0\n"))
+            wea_path = os.path.join(tmpdir, "oakland.wea")
+            with open(wea_path, "wb") as wtr:
+                wtr.write(wea)
+            np.testing.assert_array_equal(pr.read_weather(wea_path).to_array(), weather.to_array())
+
+    def test_read_subhourly(self):
+        epw = EPW.replace("DATA PERIODS,1,1,", "DATA PERIODS,1,4,")
+        epw = epw.replace(",11,0,", ",11,15,").replace(",12,0,", ",11,30,")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "oakland.epw")
+            with open(path, "w") as wtr:
+                wtr.write(epw)
+            weather = pr.read_weather(path, cache=False)
+            # the middle of 10:00-10:15 and 10:15-10:30
+            np.testing.assert_allclose(weather.hour, [10.125, 10.375])
+
+
+if __name__ == "__main__":
+    unittest.main()